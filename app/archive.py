@@ -0,0 +1,298 @@
+"""
+Hot/cold partitioning of shift history.
+
+Closed months move out of ``shifts``/``ShiftAssignments`` into one SQLite file per
+year under ``archive/`` next to the database, listed in the ``ShiftArchives``
+catalog. The hot database keeps only recent months, so its working set stays
+in the page cache. Run it periodically (cron), like migrations:
+
+    python -m app.archive                    # archive all but the last ARCHIVE_KEEP_MONTHS months
+    python -m app.archive --keep-months 6 --vacuum
+    python -m app.archive --status
+
+Readers wrap their query in ``shift_tables(conn, start_date, end_date)``. It
+attaches only the yearly files that overlap the range (all of them for an
+open-ended range) and returns FROM-clause sources; with no archive in range these
+are the plain table names. Archived dates are read-only for the scheduler: jobs
+that create or change assignments call ``check_writable`` inside their write
+transaction, so they cannot race the archiver.
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import db
+
+ARCHIVE_DIR = "archive"
+# כמה חודשים סגורים נשארים במסד החם מעבר לחודש הנוכחי
+ARCHIVE_KEEP_MONTHS = 3
+# ניסיונות חוזרים כשנכתבו שיוכים למשמרות הישנות בין ההעתקה למחיקה
+ARCHIVE_MAX_ATTEMPTS = 5
+
+_SHIFT_COLUMNS = "id, project_id, date, start_time, end_time, location"
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+_ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS archive.shifts (
+        id INTEGER PRIMARY KEY,
+        project_id INTEGER,
+        date TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        location TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS archive.ShiftAssignments (
+        shift_id INTEGER,
+        employee_id INTEGER,
+        PRIMARY KEY (shift_id, employee_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS archive.idx_shifts_project_slot ON shifts (project_id, date, start_time)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_shifts_date ON shifts (date, start_time)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_shift_assignments_employee ON ShiftAssignments (employee_id, shift_id)",
+)
+
+
+def archive_cutoff(today: date, keep_months: int = ARCHIVE_KEEP_MONTHS) -> str:
+    """First day of the oldest month that stays hot; the current month is never archived."""
+    month_index = today.year * 12 + today.month - 1 - max(keep_months, 0)
+    return date(month_index // 12, month_index % 12 + 1, 1).isoformat()
+
+
+def _database_dir(conn: sqlite3.Connection) -> str:
+    for row in conn.execute("PRAGMA database_list").fetchall():
+        if row[1] == "main":
+            return os.path.dirname(row[2])
+    raise RuntimeError("main database not found")
+
+
+def archive_catalog(conn: sqlite3.Connection) -> List[Tuple[int, str, str]]:
+    """``(year, path, archived_before)`` for every archive file, oldest first."""
+    rows = conn.execute("SELECT year, path, archived_before FROM ShiftArchives ORDER BY year").fetchall()
+    return [(row[0], row[1], row[2]) for row in rows]
+
+
+def archive_horizon(conn: sqlite3.Connection) -> Optional[str]:
+    """Dates before this live in archive files (None when nothing was archived)."""
+    return conn.execute("SELECT MAX(archived_before) FROM ShiftArchives").fetchone()[0]
+
+
+class ArchivedDateError(ValueError):
+    """A scheduling write targets dates that were already moved to the archive."""
+
+
+def check_writable(conn: sqlite3.Connection, first_date: str) -> None:
+    """
+    Raise ``ArchivedDateError`` when ``first_date`` lies before the archive horizon.
+    Duplicate and double-booking checks only see the hot tables, so plans, commits
+    and repairs for archived months are refused instead of silently duplicating rows.
+    """
+    horizon = archive_horizon(conn)
+    if horizon and first_date < horizon:
+        raise ArchivedDateError(f"משמרות לפני {horizon} הועברו לארכיון ולא ניתן לשבץ אליהן")
+
+
+@contextmanager
+def shift_tables(
+    conn: sqlite3.Connection, start_date: Optional[str] = None, end_date: Optional[str] = None
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield ``(shifts, assignments)`` FROM-clause sources covering ``[start_date,
+    end_date]`` (None = open end). Archive files overlapping the range are attached
+    to ``conn`` for the duration of the block and unioned with the hot tables;
+    otherwise the sources are simply ``shifts`` and ``ShiftAssignments``. Fetch all
+    rows inside the block: the files are detached when it exits.
+    """
+    needed = [
+        (year, path, archived_before)
+        for year, path, archived_before in archive_catalog(conn)
+        if (start_date is None or start_date < archived_before)
+        and (end_date is None or end_date >= f"{year:04d}-01-01")
+    ]
+    if not needed:
+        yield "shifts", "ShiftAssignments"
+        return
+
+    base_dir = _database_dir(conn)
+    attached: List[str] = []
+    shift_parts = [f"SELECT {_SHIFT_COLUMNS} FROM main.shifts"]
+    assignment_parts = ["SELECT shift_id, employee_id FROM main.ShiftAssignments"]
+    try:
+        for year, path, archived_before in needed:
+            full_path = os.path.join(base_dir, path)
+            if not os.path.exists(full_path) or not _DATE.match(archived_before):
+                raise RuntimeError(f"קובץ הארכיון לשנת {year} חסר או פגום: {full_path}")
+            alias = f"archive_{int(year)}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (full_path,))
+            attached.append(alias)
+            # שורות שהועתקו בריצה שלא הסתיימה עדיין נמצאות גם במסד החם - מסננים לפי האופק
+            shift_parts.append(f"SELECT {_SHIFT_COLUMNS} FROM {alias}.shifts WHERE date < '{archived_before}'")
+            assignment_parts.append(
+                f"SELECT shift_id, employee_id FROM {alias}.ShiftAssignments "
+                f"WHERE shift_id IN (SELECT id FROM {alias}.shifts WHERE date < '{archived_before}')"
+            )
+        yield (
+            "(" + " UNION ALL ".join(shift_parts) + ")",
+            "(" + " UNION ALL ".join(assignment_parts) + ")",
+        )
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        for alias in attached:
+            conn.execute(f"DETACH DATABASE {alias}")
+
+
+def _connect(path: Optional[str]) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or db.DB_PATH, isolation_level=None, timeout=db.WRITER_BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _archive_year(conn: sqlite3.Connection, year: int, cutoff: str) -> int:
+    lower = f"{year:04d}-01-01"
+    upper = min(cutoff, f"{year + 1:04d}-01-01")
+    relative_path = os.path.join(ARCHIVE_DIR, f"shifts_{year:04d}.db")
+    full_path = os.path.join(_database_dir(conn), relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    cur = conn.cursor()
+    cur.execute("ATTACH DATABASE ? AS archive", (full_path,))
+    try:
+        for statement in _ARCHIVE_SCHEMA:
+            cur.execute(statement)
+        for _ in range(ARCHIVE_MAX_ATTEMPTS):
+            # שלב 1: העתקה - הטרנזקציה כותבת רק לקובץ הארכיון
+            cur.execute("BEGIN")
+            cur.execute(
+                f"""
+                INSERT OR IGNORE INTO archive.shifts ({_SHIFT_COLUMNS})
+                SELECT {_SHIFT_COLUMNS} FROM main.shifts WHERE date >= ? AND date < ?
+                """,
+                (lower, upper),
+            )
+            cur.execute(
+                """
+                INSERT OR IGNORE INTO archive.ShiftAssignments (shift_id, employee_id)
+                SELECT sa.shift_id, sa.employee_id
+                FROM main.ShiftAssignments sa
+                INNER JOIN main.shifts s ON s.id = sa.shift_id
+                WHERE s.date >= ? AND s.date < ?
+                """,
+                (lower, upper),
+            )
+            cur.execute("COMMIT")
+
+            # שלב 2: מחיקה מהמסד החם וקידום האופק - כותבת רק ל-main ולכן אטומית
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute(
+                """
+                SELECT
+                    (SELECT COUNT(*) FROM main.shifts s
+                     WHERE s.date >= ? AND s.date < ?
+                       AND NOT EXISTS (SELECT 1 FROM archive.shifts a WHERE a.id = s.id))
+                  + (SELECT COUNT(*) FROM main.ShiftAssignments sa
+                     INNER JOIN main.shifts s ON s.id = sa.shift_id
+                     WHERE s.date >= ? AND s.date < ?
+                       AND NOT EXISTS (
+                           SELECT 1 FROM archive.ShiftAssignments a
+                           WHERE a.shift_id = sa.shift_id AND a.employee_id = sa.employee_id
+                       ))
+                """,
+                (lower, upper, lower, upper),
+            )
+            if cur.fetchone()[0]:
+                cur.execute("ROLLBACK")
+                continue
+            cur.execute(
+                """
+                DELETE FROM main.ShiftAssignments
+                WHERE shift_id IN (SELECT id FROM main.shifts WHERE date >= ? AND date < ?)
+                """,
+                (lower, upper),
+            )
+            cur.execute("DELETE FROM main.shifts WHERE date >= ? AND date < ?", (lower, upper))
+            moved = cur.rowcount
+            cur.execute(
+                """
+                INSERT INTO main.ShiftArchives (year, path, archived_before) VALUES (?, ?, ?)
+                ON CONFLICT(year) DO UPDATE SET
+                    path = excluded.path,
+                    archived_before = MAX(archived_before, excluded.archived_before)
+                """,
+                (year, relative_path, upper),
+            )
+            cur.execute("COMMIT")
+            return moved
+        raise RuntimeError(f"הארכוב של {year} נכשל: משמרות ישנות ממשיכות להשתנות")
+    except BaseException:
+        if conn.in_transaction:
+            cur.execute("ROLLBACK")
+        raise
+    finally:
+        cur.execute("DETACH DATABASE archive")
+
+
+def archive_closed_months(
+    path: Optional[str] = None, keep_months: int = ARCHIVE_KEEP_MONTHS, today: Optional[date] = None
+) -> Dict[int, int]:
+    """
+    Move shifts dated before ``archive_cutoff`` (and their assignments) into the
+    yearly archive files. Returns ``{year: shifts moved}``. Safe to re-run: an
+    interrupted run leaves the hot rows in place and the next run finishes it.
+    """
+    cutoff = archive_cutoff(today or date.today(), keep_months)
+    conn = _connect(path)
+    try:
+        years = [
+            int(row[0])
+            for row in conn.execute(
+                "SELECT DISTINCT substr(date, 1, 4) FROM shifts WHERE date < ? ORDER BY 1", (cutoff,)
+            ).fetchall()
+            if row[0] and row[0].isdigit()
+        ]
+        return {year: _archive_year(conn, year, cutoff) for year in years}
+    finally:
+        conn.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Move closed months of shifts into yearly archive files.")
+    parser.add_argument("--db", dest="path", default=None, help=f"database file (default: {db.DB_PATH})")
+    parser.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS, help="closed months to keep hot")
+    parser.add_argument("--vacuum", action="store_true", help="compact the hot database afterwards")
+    parser.add_argument("--status", action="store_true", help="only list the archive files")
+    args = parser.parse_args(argv)
+
+    if not args.status:
+        moved = archive_closed_months(args.path, args.keep_months)
+        for year, count in moved.items():
+            print(f"archived {count} shifts from {year}")
+        if not moved:
+            print("nothing to archive")
+        if args.vacuum:
+            conn = _connect(args.path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+
+    conn = _connect(args.path)
+    try:
+        for year, path, archived_before in archive_catalog(conn):
+            print(f"{year}: {path} (before {archived_before})")
+        print(f"hot shifts: {conn.execute('SELECT COUNT(*) FROM shifts').fetchone()[0]}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
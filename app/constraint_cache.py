@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from app.utils import ConstraintTimeline
+
+_VERSION_FIELDS = ("id", "kind", "scope", "value_json", "compiled_json", "valid_from", "valid_to")
+
+
+def constraint_version(rows: Iterable[Dict[str, Any]]) -> Tuple:
+    """Cheap fingerprint of an employee's raw constraint rows (no JSON parsing)."""
+    return tuple(tuple(row.get(field) for field in _VERSION_FIELDS) for row in rows)
+
+
+class ConstraintProfileCache:
+    """
+    Process-wide LRU of compiled constraint timelines, keyed by employee id and the
+    fingerprint of the rows the timeline was compiled from.
+
+    A changed row therefore never returns a stale timeline, and writers call
+    ``invalidate`` so the superseded entry is dropped right away instead of aging
+    out. Cached timelines (and their profiles) are shared between generation runs
+    and must be treated as read-only.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[Tuple, ConstraintTimeline]]" = OrderedDict()
+
+    def get(self, employee_id: int, rows: Iterable[Dict[str, Any]]) -> ConstraintTimeline:
+        rows = list(rows)
+        version = constraint_version(rows)
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(employee_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        timeline = ConstraintTimeline(rows)
+        with self._lock:
+            self._entries[employee_id] = (version, timeline)
+            self._entries.move_to_end(employee_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return timeline
+
+    def invalidate(self, employee_id: Optional[int] = None) -> None:
+        """Drop one employee's timeline, or every timeline when ``employee_id`` is None."""
+        with self._lock:
+            if employee_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(employee_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+class CoverageCache:
+    """
+    Small LRU of derived per-day coverage results (e.g. the availability heatmap).
+
+    Keys must include everything the result was computed from, typically the date
+    range plus each active employee's ``constraint_version``, so a changed employee
+    list or constraint row is simply a miss.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+
+    def get_or_build(self, key: Tuple, build: Callable[[], Any]) -> Any:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = build()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+profile_cache = ConstraintProfileCache()
+coverage_cache = CoverageCache()
@@ -1,113 +1,565 @@
+import asyncio
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.utils import COMPILED_CONSTRAINT_VERSION, compile_constraint
 
 DB_PATH = "database.db"
 
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# הגדרות מאגר החיבורים
+POOL_MAX_CONNECTIONS = 16
+POOL_CHECKOUT_TIMEOUT = 10.0
+# חיבור שלא היה בשימוש יותר מזה נבדק (SELECT 1) לפני שהוא נמסר שוב
+POOL_HEALTHCHECK_AFTER = 30.0
+
+# נקבעות פעם אחת לכל חיבור חדש; cache_size שלילי = KiB
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+# כתיבה: כמה משימות כתיבה לכל היותר נכנסות ל-COMMIT אחד, וכמה זמן מחכים לנעילה
+# כשתהליך אחר (הפקה ברקע, מיגרציה) כותב באותו רגע
+WRITER_MAX_BATCH = 64
+WRITER_BUSY_TIMEOUT = 30.0
+
+# מספר ה-threads המרבי לכל סוג עומס בגישה האסינכרונית (run_db); דוחות כבדים לא
+# יכולים לתפוס יותר מזה ולכן לא מרעיבים התחברויות ומסכים אינטראקטיביים
+DB_WORKLOAD_LIMITS = {
+    "reports": 4,
+    "interactive": 8,
+}
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """No pooled connection became free within the checkout timeout."""
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection owned by a ``ConnectionPool``: ``close()`` hands it back to
+    the pool (rolling back anything uncommitted, like a real close would) instead
+    of closing the file.
+    """
+
+    _pool: Optional["ConnectionPool"] = None
+    _checked_out = False
+    _last_used = 0.0
+
+    def close(self) -> None:
+        if self._pool is None:
+            super().close()
+        elif self._checked_out:
+            self._checked_out = False
+            self._pool.release(self)
+
+    def discard(self) -> None:
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of pre-configured connections to one database file.
+
+    Connections are created lazily up to ``max_connections`` with
+    ``check_same_thread=False``; a checked-out connection belongs to one request
+    at a time, whichever worker thread runs it. Idle connections are handed out
+    most-recently-used first so their page and statement caches stay warm.
+    With ``readonly`` every connection also sets ``PRAGMA query_only``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        timeout: float = POOL_CHECKOUT_TIMEOUT,
+        healthcheck_after: float = POOL_HEALTHCHECK_AFTER,
+        readonly: bool = False,
+    ):
+        self.path = path
+        self.readonly = readonly
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self._idle: List[PooledConnection] = []
+        self._open = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._stats = {"created": 0, "checkouts": 0, "waits": 0, "timeouts": 0, "discarded": 0}
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if self.readonly:
+            conn.execute("PRAGMA query_only=ON")
+        conn._pool = self
+        return conn
+
+    def _healthy(self, conn: PooledConnection) -> bool:
+        if time.monotonic() - conn._last_used < self.healthcheck_after:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._open >= self.max_connections:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout("אין חיבור פנוי למסד הנתונים")
+                    self._stats["waits"] += 1
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._open += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["created"] += 1
+            elif not self._healthy(conn):
+                self._drop(conn)
+                continue
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+            conn._checked_out = True
+            return conn
+
+    def release(self, conn: PooledConnection) -> None:
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._drop(conn)
+            return
+        conn._last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                self._open -= 1
+                conn.discard()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _drop(self, conn: PooledConnection) -> None:
+        try:
+            conn.discard()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Close idle connections; connections still checked out close when released."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn in idle:
+            conn.discard()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                **self._stats,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "max_connections": self.max_connections,
+            }
+
+
+class _WriteJob:
+    __slots__ = ("fn", "args", "future")
+
+    def __init__(self, fn: Callable[..., Any], args: tuple):
+        self.fn = fn
+        self.args = args
+        self.future: "Future[Any]" = Future()
+
+
+class SerializedWriter:
+    """
+    The one connection that writes to a database file, owned by a dedicated thread.
+
+    ``submit(fn, *args)`` queues ``fn(cur, *args)``. The thread takes everything
+    queued (up to ``max_batch`` jobs) into a single ``BEGIN IMMEDIATE`` transaction,
+    runs each job in its own savepoint so a job that raises is rolled back alone,
+    and commits the batch once; each future resolves only after that commit. Jobs
+    must not commit or roll back themselves, and must not submit further writes.
+    """
+
+    def __init__(self, path: str, max_batch: int = WRITER_MAX_BATCH, busy_timeout: float = WRITER_BUSY_TIMEOUT):
+        self.path = path
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self._queue: "queue.Queue[Optional[_WriteJob]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._pid = os.getpid()
+        self._stats = {"jobs": 0, "failed": 0, "batches": 0, "largest_batch": 0}
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+        job = _WriteJob(fn, args)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("writer is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            elif threading.current_thread() is self._thread:
+                raise RuntimeError("a write job cannot submit another write job")
+            self._queue.put(job)
+        return job.future
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _run(self) -> None:
+        conn = None
+        stopping = False
+        while not stopping:
+            job = self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                if conn is None:
+                    conn = self._connect()
+                self._commit_batch(conn, batch)
+            except BaseException as exc:
+                # לא הצלחנו לפתוח חיבור או להתחיל טרנזקציה: כל המשימות נכשלות, ה-thread ממשיך
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(exc)
+        if conn is not None:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[_WriteJob]) -> None:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        outcomes: List[tuple] = []
+        for job in batch:
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            cur.execute("SAVEPOINT write_job")
+            try:
+                result = job.fn(cur, *job.args)
+            except Exception as exc:
+                if not conn.in_transaction:
+                    # השגיאה ביטלה את כל הטרנזקציה; גם משימות קודמות באצווה לא נשמרו
+                    outcomes = [(done, None, error or exc) for done, _, error in outcomes]
+                    outcomes.append((job, None, exc))
+                    cur.execute("BEGIN IMMEDIATE")
+                    continue
+                cur.execute("ROLLBACK TO write_job")
+                cur.execute("RELEASE write_job")
+                outcomes.append((job, None, exc))
+            else:
+                cur.execute("RELEASE write_job")
+                outcomes.append((job, result, None))
+        try:
+            cur.execute("COMMIT")
+        except sqlite3.Error as exc:
+            if conn.in_transaction:
+                cur.execute("ROLLBACK")
+            outcomes = [(job, None, error or exc) for job, _, error in outcomes]
+
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["jobs"] += len(outcomes)
+            self._stats["failed"] += sum(1 for _, _, error in outcomes if error is not None)
+            self._stats["largest_batch"] = max(self._stats["largest_batch"], len(batch))
+        for job, result, error in outcomes:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def close(self) -> None:
+        """Finish the queued jobs, then close the write connection."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "queued": self._queue.qsize()}
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_writers: Dict[str, SerializedWriter] = {}
+_pools_lock = threading.Lock()
+# מאגרים שתהליך בן ירש מההורה: אסור לגעת בחיבורים שלהם (גם לא לסגור), רק להחזיק אותם
+_inherited_pools: List[ConnectionPool] = []
+
+
+def get_pool(path: Optional[str] = None) -> ConnectionPool:
+    """
+    The read-only pool for ``path`` (default ``DB_PATH``, read at call time so tests
+    can repoint it). Writes go through ``write`` instead.
+    """
+    key = os.path.abspath(path or DB_PATH)
+    with _pools_lock:
+        pool = _pools.get(key)
+        # חיבור SQLite לא עובר fork: תהליך בן (עבודת רקע, עובד הפקה) פותח מאגר משלו
+        if pool is not None and pool._pid != os.getpid():
+            _inherited_pools.append(pool)
+            pool = None
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(key, readonly=True)
+        return pool
+
+
+def get_writer(path: Optional[str] = None) -> SerializedWriter:
+    key = os.path.abspath(path or DB_PATH)
+    with _pools_lock:
+        writer = _writers.get(key)
+        # תהליך בן (fork) יורש את האובייקט אבל לא את ה-thread שלו
+        if writer is None or writer._pid != os.getpid():
+            writer = _writers[key] = SerializedWriter(key)
+        return writer
+
+
+def close_pools() -> None:
+    """Close every read pool and writer (queued writes are committed first)."""
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool._pid == os.getpid()]
+        _inherited_pools.extend(pool for pool in _pools.values() if pool._pid != os.getpid())
+        writers = [writer for writer in _writers.values() if writer._pid == os.getpid()]
+        _pools.clear()
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+    for pool in pools:
+        pool.close()
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Unpooled read-write connection with the standard pragmas, for scripts and
+    benchmarks that own the database file. The app itself writes through ``write``.
+    """
+    conn = sqlite3.connect(path or DB_PATH)
     conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_db():
+
+def get_connection(path: Optional[str] = None) -> sqlite3.Connection:
+    """Check a read-only connection out of the pool; ``close()`` returns it."""
+    return get_pool(path).acquire()
+
+
+def get_db() -> Iterator[sqlite3.Connection]:
+    """FastAPI dependency: one pooled read-only connection per request, returned once the response is sent."""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def write(fn: Callable[..., Any], *args: Any, path: Optional[str] = None) -> Any:
+    """
+    Run ``fn(cur, *args)`` on the serialized writer and return its result once the
+    batch it joined has committed; an exception raised by ``fn`` (or by the commit)
+    is re-raised here and none of ``fn``'s changes are kept.
+    """
+    return get_writer(path).submit(fn, *args).result()
+
+
+class WorkloadExecutors:
+    """
+    One bounded thread pool per workload class for database work awaited from
+    ``async def`` handlers, so a burst of slow queries in one class queues behind
+    its own limit instead of occupying Starlette's shared thread pool.
+
+    Executors are created on first use; ``configure`` changes a limit (a running
+    executor is replaced, its queued work still finishes) and ``shutdown`` stops
+    them all.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self._limits = dict(limits)
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def configure(self, workload: str, max_workers: int) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        with self._lock:
+            self._limits[workload] = max_workers
+            previous = self._executors.pop(workload, None)
+        if previous is not None:
+            previous.shutdown(wait=False)
+
+    def _executor(self, workload: str) -> ThreadPoolExecutor:
+        with self._lock:
+            executor = self._executors.get(workload)
+            if executor is None:
+                if workload not in self._limits:
+                    raise KeyError(f"unknown database workload: {workload}")
+                executor = self._executors[workload] = ThreadPoolExecutor(
+                    max_workers=self._limits[workload], thread_name_prefix=f"db-{workload}"
+                )
+                self._stats.setdefault(workload, {"submitted": 0, "running": 0, "completed": 0})
+            self._stats[workload]["submitted"] += 1
+            return executor
+
+    def _call(self, workload: str, fn: Callable[..., Any], args: tuple) -> Any:
+        with self._lock:
+            self._stats[workload]["running"] += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._stats[workload]["running"] -= 1
+                self._stats[workload]["completed"] += 1
+
+    async def run(self, workload: str, fn: Callable[..., Any], *args: Any) -> Any:
+        executor = self._executor(workload)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self._call, workload, fn, args)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            result = {}
+            for workload, limit in self._limits.items():
+                counters = self._stats.get(workload, {"submitted": 0, "running": 0, "completed": 0})
+                result[workload] = {
+                    **counters,
+                    "queued": counters["submitted"] - counters["running"] - counters["completed"],
+                    "max_workers": limit,
+                }
+            return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+
+db_executors = WorkloadExecutors(DB_WORKLOAD_LIMITS)
+
+
+def _with_connection(fn: Callable[..., Any], args: tuple) -> Any:
     conn = get_connection()
-    cur = conn.cursor()
-
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS employees (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        email TEXT,
-        phone TEXT,
-        active INTEGER DEFAULT 1,
-        password_hash TEXT,
-        is_admin INTEGER DEFAULT 0
-    );
-
-    CREATE TABLE IF NOT EXISTS EmployeeAuthTokens (
-        employee_id INTEGER,
-        token TEXT PRIMARY KEY,
-        expires_at TEXT,
-        FOREIGN KEY(employee_id) REFERENCES employees(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS EmployeeConstraints (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        employee_id INTEGER NOT NULL,
-        kind TEXT NOT NULL,
-        scope TEXT NOT NULL,
-        value_json TEXT NOT NULL,
-        valid_from TEXT,
-        valid_to TEXT,
-        FOREIGN KEY(employee_id) REFERENCES employees(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS projects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        hourly_rate REAL DEFAULT 0,
-        active INTEGER DEFAULT 1,
-        morning_required INTEGER DEFAULT 0,
-        afternoon_required INTEGER DEFAULT 0,
-        night_required INTEGER DEFAULT 0
-    );
-
-    CREATE TABLE IF NOT EXISTS shifts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        project_id INTEGER,
-        date TEXT,
-        start_time TEXT,
-        end_time TEXT,
-        location TEXT,
-        FOREIGN KEY(project_id) REFERENCES projects(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS ShiftAssignments (
-        shift_id INTEGER,
-        employee_id INTEGER,
-        PRIMARY KEY (shift_id, employee_id),
-        FOREIGN KEY(shift_id) REFERENCES shifts(id),
-        FOREIGN KEY(employee_id) REFERENCES employees(id)
-    );
-    """)
-
-    # אם השדה employee_id עדיין קיים בטבלת shifts הישנה, נמפה נתונים לטבלת השיוכים החדשה
-    cur.execute("PRAGMA table_info(employees)")
-    employee_columns = [row[1] for row in cur.fetchall()]
-    if "password_hash" not in employee_columns:
-        cur.execute("ALTER TABLE employees ADD COLUMN password_hash TEXT")
-    if "email" not in employee_columns:
-        cur.execute("ALTER TABLE employees ADD COLUMN email TEXT")
-    if "phone" not in employee_columns:
-        cur.execute("ALTER TABLE employees ADD COLUMN phone TEXT")
-    if "active" not in employee_columns:
-        cur.execute("ALTER TABLE employees ADD COLUMN active INTEGER DEFAULT 1")
-    if "is_admin" not in employee_columns:
-        cur.execute("ALTER TABLE employees ADD COLUMN is_admin INTEGER DEFAULT 0")
-
-    cur.execute("PRAGMA table_info(projects)")
-    project_columns = [row[1] for row in cur.fetchall()]
-    if "hourly_rate" not in project_columns:
-        cur.execute("ALTER TABLE projects ADD COLUMN hourly_rate REAL DEFAULT 0")
-    if "active" not in project_columns:
-        cur.execute("ALTER TABLE projects ADD COLUMN active INTEGER DEFAULT 1")
-    if "morning_required" not in project_columns:
-        cur.execute("ALTER TABLE projects ADD COLUMN morning_required INTEGER DEFAULT 0")
-    if "afternoon_required" not in project_columns:
-        cur.execute("ALTER TABLE projects ADD COLUMN afternoon_required INTEGER DEFAULT 0")
-    if "night_required" not in project_columns:
-        cur.execute("ALTER TABLE projects ADD COLUMN night_required INTEGER DEFAULT 0")
-
-    cur.execute("PRAGMA table_info(shifts)")
-    shift_columns = [row[1] for row in cur.fetchall()]
-    if "location" not in shift_columns:
-        cur.execute("ALTER TABLE shifts ADD COLUMN location TEXT")
-
-    if "employee_id" in shift_columns:
-        cur.execute("""
-            INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
-            SELECT id, employee_id
-            FROM shifts
-            WHERE employee_id IS NOT NULL
-        """)
-
-    conn.commit()
-    conn.close()
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+
+async def run_db(workload: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Await ``fn(conn, *args)`` on ``workload``'s executor with a pooled connection that
+    is returned as soon as ``fn`` finishes. ``fn`` should do all of its row
+    processing inside, so the event loop only receives the finished result.
+    """
+    return await db_executors.run(workload, _with_connection, fn, args)
+
+
+def init_db(path: Optional[str] = None) -> None:
+    """
+    Create or upgrade the schema by applying pending migrations (``app/migrations.py``).
+    The web app no longer calls this on import; run ``python -m app.migrations`` once
+    per deploy instead. Kept for scripts and tests that build throwaway databases.
+    """
+    from app.migrations import migrate
+
+    migrate(path)
+
+
+# האינדקסים שהסכמה העדכנית אמורה להכיל: שם -> הגדרה. המיגרציות יוצרות אותם
+# (app/migrations.py); שינוי כאן דורש מיגרציה חדשה עם ה-DDL המתאים, ו-test_db
+# נכשל כשהרשימה והמסד המוגר אינם תואמים
+MANAGED_INDEXES = {
+    # דוחות, הפקה וקובצי iCal מסננים לפי פרויקט ותאריך; זה גם האינדקס המכסה
+    # לבדיקת "המשמרת כבר קיימת" ב-_persist_schedule_plan
+    "idx_shifts_project_slot": "shifts (project_id, date, start_time, end_time, location)",
+    "idx_shifts_date": "shifts (date, start_time)",
+    # עמודת employee_id היא השנייה במפתח הראשי ולכן לא עוזרת לחיפוש לפי עובד
+    "idx_shift_assignments_employee": "ShiftAssignments (employee_id, shift_id)",
+    "idx_employees_email_lower": "employees (LOWER(email))",
+    "idx_employee_constraints_employee": "EmployeeConstraints (employee_id)",
+    "idx_projects_name": "projects (name)",
+}
+
+
+def compile_stored_constraints(cur) -> int:
+    """Fill compiled_json for rows that have none or were compiled by an older parser."""
+    cur.execute(
+        """
+        SELECT id, kind, scope, value_json
+        FROM EmployeeConstraints
+        WHERE compiled_json IS NULL
+           OR json_valid(compiled_json) = 0
+           OR json_extract(compiled_json, '$.v') IS NOT ?
+        """,
+        (COMPILED_CONSTRAINT_VERSION,),
+    )
+    updates = [
+        (
+            json.dumps(compile_constraint(row["kind"], row["scope"], row["value_json"]), ensure_ascii=False),
+            row["id"],
+        )
+        for row in cur.fetchall()
+    ]
+    cur.executemany("UPDATE EmployeeConstraints SET compiled_json = ? WHERE id = ?", updates)
+    return len(updates)
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+from typing import Any, Callable, Dict, Optional
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class JobManager:
+    """
+    In-process queue of CPU-bound jobs executed in a process pool.
+
+    Every job receives two extra trailing arguments: a shared ``progress`` dict it
+    may update at any time, and a ``cancel`` event it should poll (raising
+    ``JobCancelled`` when set). Finished jobs keep their result until more than
+    ``max_finished`` newer jobs have completed.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 100):
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+
+    def _ensure_started(self) -> None:
+        if self._executor is None:
+            self._manager = Manager()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def submit(self, fn: Callable, *args, description: str = "") -> str:
+        with self._lock:
+            self._ensure_started()
+            job_id = uuid.uuid4().hex
+            progress = self._manager.dict()
+            cancel = self._manager.Event()
+            future = self._executor.submit(fn, *args, progress, cancel)
+            self._jobs[job_id] = {
+                "id": job_id,
+                "description": description,
+                "created_at": time.time(),
+                "progress": progress,
+                "cancel": cancel,
+                "future": future,
+                "snapshot": None,
+            }
+            self._prune()
+        return job_id
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job["future"].done()]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["snapshot"] is not None:
+                return job["snapshot"]
+
+            future = job["future"]
+            info: Dict[str, Any] = {
+                "id": job_id,
+                "description": job["description"],
+                "created_at": job["created_at"],
+                "progress": dict(job["progress"]),
+                "result": None,
+                "error": None,
+            }
+            if future.cancelled():
+                info["status"] = "cancelled"
+            elif future.done():
+                error = future.exception()
+                if isinstance(error, JobCancelled):
+                    info["status"] = "cancelled"
+                elif error is not None:
+                    info["status"] = "failed"
+                    info["error"] = str(error)
+                else:
+                    info["status"] = "done"
+                    info["result"] = future.result()
+            else:
+                info["status"] = "cancelling" if job["cancel"].is_set() else (
+                    "running" if future.running() else "queued"
+                )
+
+            if future.done():
+                # התוצאה נשמרת בזיכרון התהליך הראשי ואין עוד צורך באובייקטים המשותפים
+                job["snapshot"] = info
+                job["progress"] = job["cancel"] = None
+            return info
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["future"].done():
+                return False
+            job["cancel"].set()
+            job["future"].cancel()
+            return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._manager.shutdown()
+                self._executor = None
+                self._manager = None
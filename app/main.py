@@ -1,10 +1,13 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
-from app.db import init_db, get_connection
+from app import queries
+from app.archive import shift_tables
+from app.db import close_pools, db_executors, get_db
+from app.migrations import require_current_schema
 from app.routes import employee, admin  # מודולי הנתיבים
 
 # יצירת האפליקציה הראשית
@@ -18,38 +21,35 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 app.state.templates = templates
 
-# ייבוא מסד הנתונים והקמת הטבלאות אם לא קיימות
-init_db()
-
 # חיבור הנתיבים של העובדים והאדמין
 app.include_router(employee.router)
 app.include_router(admin.router)
 
+
+# הסכמה מעודכנת ע"י python -m app.migrations פעם אחת בכל פריסה, לא בכל טעינה של worker
+@app.on_event("startup")
+def check_schema_version():
+    require_current_schema()
+
+
+@app.on_event("shutdown")
+def shutdown_background_jobs():
+    admin.generation_jobs.shutdown()
+    admin.plan_executors.shutdown()
+    db_executors.shutdown()
+    close_pools()
+
+
 # דף הבית – מציג את סידור העבודה הכללי
 @app.get("/", response_class=HTMLResponse) #א.י - סידור עבודה אישי או כללי לפרוייקט?
-def root(request: Request):
+def root(request: Request, conn=Depends(get_db)):
     if not request.session.get("employee_id"):
         return RedirectResponse("/login", status_code=303)
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT
-            s.id,
-            COALESCE(GROUP_CONCAT(e.name, ', '), '-') AS employees,
-            p.name AS project,
-            s.location,
-            s.date,
-            s.start_time,
-            s.end_time
-        FROM shifts s
-        LEFT JOIN projects p ON s.project_id = p.id
-        LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
-        LEFT JOIN employees e ON sa.employee_id = e.id
-        GROUP BY s.id, p.name, s.location, s.date, s.start_time, s.end_time
-        ORDER BY s.date, s.start_time
-    """)
-    shifts = cur.fetchall()
-    conn.close()
+    # הסידור הכללי כולל גם שנים שהועברו לארכיון
+    with shift_tables(conn) as (shift_source, assignment_source):
+        shifts = queries.fetch_all(
+            conn.cursor(), "schedule_overview", shifts=shift_source, assignments=assignment_source
+        )
     message = request.query_params.get("message")
     error = request.query_params.get("error")
     return templates.TemplateResponse(
@@ -0,0 +1,283 @@
+"""
+Versioned schema migrations keyed on ``PRAGMA user_version``.
+
+Every migration runs once, in its own ``BEGIN IMMEDIATE`` transaction that also
+bumps ``user_version``, so a database at ``SCHEMA_VERSION`` costs a single PRAGMA
+read. Run them once per deploy:
+
+    python -m app.migrations            # apply pending migrations to DB_PATH
+    python -m app.migrations --status   # exit code 1 when migrations are pending
+    python -m app.migrations --db other.db
+"""
+import argparse
+import json
+import sqlite3
+import sys
+from typing import Callable, List, Optional, Tuple
+
+from app import db
+from app.utils import compile_constraint
+
+_BASELINE_TABLES = (
+    """
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT,
+        phone TEXT,
+        active INTEGER DEFAULT 1,
+        password_hash TEXT,
+        is_admin INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS EmployeeAuthTokens (
+        employee_id INTEGER,
+        token TEXT PRIMARY KEY,
+        expires_at TEXT,
+        FOREIGN KEY(employee_id) REFERENCES employees(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS EmployeeConstraints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        value_json TEXT NOT NULL,
+        compiled_json TEXT,
+        valid_from TEXT,
+        valid_to TEXT,
+        FOREIGN KEY(employee_id) REFERENCES employees(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        hourly_rate REAL DEFAULT 0,
+        active INTEGER DEFAULT 1,
+        morning_required INTEGER DEFAULT 0,
+        afternoon_required INTEGER DEFAULT 0,
+        night_required INTEGER DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS shifts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER,
+        date TEXT,
+        start_time TEXT,
+        end_time TEXT,
+        location TEXT,
+        FOREIGN KEY(project_id) REFERENCES projects(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ShiftAssignments (
+        shift_id INTEGER,
+        employee_id INTEGER,
+        PRIMARY KEY (shift_id, employee_id),
+        FOREIGN KEY(shift_id) REFERENCES shifts(id),
+        FOREIGN KEY(employee_id) REFERENCES employees(id)
+    )
+    """,
+)
+
+# עמודות שנוספו לאורך הזמן לטבלאות קיימות (מסדי נתונים שנוצרו לפני user_version)
+_LEGACY_COLUMNS = {
+    "employees": (
+        ("password_hash", "TEXT"),
+        ("email", "TEXT"),
+        ("phone", "TEXT"),
+        ("active", "INTEGER DEFAULT 1"),
+        ("is_admin", "INTEGER DEFAULT 0"),
+    ),
+    "projects": (
+        ("hourly_rate", "REAL DEFAULT 0"),
+        ("active", "INTEGER DEFAULT 1"),
+        ("morning_required", "INTEGER DEFAULT 0"),
+        ("afternoon_required", "INTEGER DEFAULT 0"),
+        ("night_required", "INTEGER DEFAULT 0"),
+    ),
+    "shifts": (("location", "TEXT"),),
+}
+
+
+def _columns(cur, table: str) -> List[str]:
+    cur.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cur.fetchall()]
+
+
+def _baseline(cur) -> None:
+    """Tables as of the first versioned release; upgrades older unversioned databases in place."""
+    for statement in _BASELINE_TABLES:
+        cur.execute(statement)
+    for table, columns in _LEGACY_COLUMNS.items():
+        existing = _columns(cur, table)
+        for column, definition in columns:
+            if column not in existing:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    # אם השדה employee_id עדיין קיים בטבלת shifts הישנה, נמפה נתונים לטבלת השיוכים החדשה
+    if "employee_id" in _columns(cur, "shifts"):
+        cur.execute(
+            """
+            INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
+            SELECT id, employee_id
+            FROM shifts
+            WHERE employee_id IS NOT NULL
+            """
+        )
+
+
+def _compiled_constraints(cur) -> None:
+    if "compiled_json" not in _columns(cur, "EmployeeConstraints"):
+        cur.execute("ALTER TABLE EmployeeConstraints ADD COLUMN compiled_json TEXT")
+    # רק שורות שעוד לא קומפלו; הפורמט עצמו נושא גרסה ("v") ושורה מגרסה אחרת
+    # נקראת בפענוח מלא עד שמיגרציה חדשה מקמפלת אותה מחדש
+    cur.execute("SELECT id, kind, scope, value_json FROM EmployeeConstraints WHERE compiled_json IS NULL")
+    cur.executemany(
+        "UPDATE EmployeeConstraints SET compiled_json = ? WHERE id = ?",
+        [
+            (json.dumps(compile_constraint(kind, scope, value_json), ensure_ascii=False), row_id)
+            for row_id, kind, scope, value_json in cur.fetchall()
+        ],
+    )
+
+
+# האינדקסים כפי ששוחררו במיגרציה 3 - קפוא; שינוי אינדקס הולך למיגרציה חדשה
+_INDEXES_V3 = {
+    "idx_shifts_project_slot": "shifts (project_id, date, start_time, end_time, location)",
+    "idx_shifts_date": "shifts (date, start_time)",
+    "idx_shift_assignments_employee": "ShiftAssignments (employee_id, shift_id)",
+    "idx_employees_email_lower": "employees (LOWER(email))",
+    "idx_employee_constraints_employee": "EmployeeConstraints (employee_id)",
+    "idx_projects_name": "projects (name)",
+}
+
+
+def _managed_indexes(cur) -> None:
+    """Create the release-3 indexes, rebuilding or dropping idx_* ones left with another definition."""
+    cur.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'")
+    existing = {row[0]: row[1] for row in cur.fetchall()}
+    for name, sql in existing.items():
+        definition = _INDEXES_V3.get(name)
+        if definition is None or sql != f"CREATE INDEX {name} ON {definition}":
+            cur.execute(f"DROP INDEX {name}")
+            existing[name] = None
+    for name, definition in _INDEXES_V3.items():
+        if existing.get(name) is None:
+            cur.execute(f"CREATE INDEX {name} ON {definition}")
+
+
+def _shift_archives(cur) -> None:
+    # קובץ ארכיון לכל שנה; archived_before = עד איזה תאריך (לא כולל) השורות כבר הועברו
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ShiftArchives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            archived_before TEXT NOT NULL
+        )
+        """
+    )
+
+
+# (גרסה, תיאור, פונקציה) - מוסיפים רק בסוף, לעולם לא משנים מיגרציה שכבר שוחררה.
+# כל מיגרציה מחזיקה את ה-DDL שלה בעצמה ולא קוראת לקוד חי מ-app.db, כדי שהרצה
+# על מסד ישן תמיד תיתן אותה סכמה כמו ביום השחרור
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "baseline tables and legacy columns", _baseline),
+    (2, "compiled constraint cache column", _compiled_constraints),
+    (3, "managed secondary indexes", _managed_indexes),
+    (4, "shift archive catalog", _shift_archives),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _connect(path: Optional[str]) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or db.DB_PATH, isolation_level=None, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(conn: sqlite3.Connection) -> List[Tuple[int, str, Callable]]:
+    current = schema_version(conn)
+    return [migration for migration in MIGRATIONS if migration[0] > current]
+
+
+def migrate(path: Optional[str] = None, log: Optional[Callable[[str], None]] = None) -> List[int]:
+    """
+    Apply pending migrations in order and return the versions applied. Safe to run
+    from several processes at once: the version is re-read under the write lock.
+    """
+    conn = _connect(path)
+    applied: List[int] = []
+    try:
+        if not pending_migrations(conn):
+            return applied
+        for version, description, step in MIGRATIONS:
+            cur = conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                if schema_version(conn) >= version:
+                    cur.execute("ROLLBACK")
+                    continue
+                step(cur)
+                cur.execute(f"PRAGMA user_version = {int(version)}")
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            if log is not None:
+                log(f"{version}: {description}")
+    finally:
+        conn.close()
+    return applied
+
+
+def require_current_schema(path: Optional[str] = None) -> None:
+    """Raise when the database is behind ``SCHEMA_VERSION`` (used at app startup instead of migrating)."""
+    conn = _connect(path)
+    try:
+        current = schema_version(conn)
+    finally:
+        conn.close()
+    if current < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"סכמת מסד הנתונים בגרסה {current} ונדרשת {SCHEMA_VERSION}; יש להריץ python -m app.migrations"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--db", dest="path", default=None, help=f"database file (default: {db.DB_PATH})")
+    parser.add_argument("--status", action="store_true", help="only report; exit 1 when migrations are pending")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = _connect(args.path)
+        try:
+            current, pending = schema_version(conn), pending_migrations(conn)
+        finally:
+            conn.close()
+        print(f"schema version {current}/{SCHEMA_VERSION}")
+        for version, description, _ in pending:
+            print(f"pending {version}: {description}")
+        return 1 if pending else 0
+
+    applied = migrate(args.path, log=lambda line: print(f"applied {line}"))
+    if not applied:
+        print(f"schema is current (version {SCHEMA_VERSION})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+"""
+Registry of the hot SQL statements used by the routes.
+
+Every statement has one fixed SQL text, so sqlite3's per-connection statement
+cache (keyed on the text) reuses the prepared statement across requests instead
+of re-parsing it. Nothing is spliced into the text at call time:
+
+* variable-length id lists are bound as one JSON array and expanded with
+  ``IN (SELECT value FROM json_each(?))`` (pass ``id_list(ids)``);
+* optional date filters are always present and take ``DATE_MIN``/``DATE_MAX``
+  when the caller has no bound. Shifts without a date therefore never match;
+  they have no computable hours, and a NULL-aware ``(? IS NULL OR ...)`` form
+  would turn the ``idx_shifts_date`` range search into a full index scan;
+* the only placeholders are ``{shifts}``/``{assignments}`` for the sources yielded
+  by ``app.archive.shift_tables``, which are plain table names unless archive
+  files are attached.
+
+``fetch_all``/``fetch_one``/``execute`` run a statement by name and record its
+timing in ``query_timings`` (served by ``/admin/db/stats``).
+"""
+import json
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# גבולות לטווח תאריכים פתוח (התאריכים נשמרים כ-YYYY-MM-DD)
+DATE_MIN = "0000-01-01"
+DATE_MAX = "9999-12-31"
+
+QUERIES: Dict[str, str] = {
+    # --- דף הבית ---
+    "schedule_overview": """
+        SELECT
+            s.id,
+            COALESCE(GROUP_CONCAT(e.name, ', '), '-') AS employees,
+            p.name AS project,
+            s.location,
+            s.date,
+            s.start_time,
+            s.end_time
+        FROM {shifts} s
+        LEFT JOIN projects p ON s.project_id = p.id
+        LEFT JOIN {assignments} sa ON sa.shift_id = s.id
+        LEFT JOIN employees e ON sa.employee_id = e.id
+        GROUP BY s.id, p.name, s.location, s.date, s.start_time, s.end_time
+        ORDER BY s.date, s.start_time
+    """,
+    # --- עובדים ---
+    "employee_by_id": """
+        SELECT id, name, email, phone, active
+        FROM employees
+        WHERE id = ?
+    """,
+    "employee_login": """
+        SELECT id, name, password_hash, is_admin, active
+        FROM employees
+        WHERE LOWER(email) = ?
+    """,
+    "employee_list": """
+        SELECT
+            e.id,
+            e.name,
+            e.email,
+            e.phone,
+            e.active,
+            COUNT(sa.shift_id) AS assigned_shifts
+        FROM employees e
+        LEFT JOIN ShiftAssignments sa ON sa.employee_id = e.id
+        GROUP BY e.id
+        ORDER BY e.active DESC, e.name
+    """,
+    "employee_assignment_count": """
+        SELECT COUNT(*) AS total
+        FROM ShiftAssignments
+        WHERE employee_id = ?
+    """,
+    "employee_shifts": """
+        SELECT
+            s.id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location,
+            COALESCE(p.name, 'לא הוגדר פרויקט') AS project
+        FROM shifts s
+        INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
+        LEFT JOIN projects p ON p.id = s.project_id
+        WHERE sa.employee_id = ?
+        ORDER BY s.date, s.start_time
+    """,
+    "employee_recent_shifts": """
+        SELECT
+            s.id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location,
+            COALESCE(p.name, 'לא הוגדר פרויקט') AS project
+        FROM shifts s
+        INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
+        LEFT JOIN projects p ON p.id = s.project_id
+        WHERE sa.employee_id = ?
+        ORDER BY s.date DESC, s.start_time DESC
+        LIMIT ?
+    """,
+    "employee_report_rows": """
+        SELECT
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location,
+            COALESCE(p.name, 'לא הוגדר פרויקט') AS project,
+            COALESCE(p.hourly_rate, 0) AS hourly_rate
+        FROM {shifts} s
+        INNER JOIN {assignments} sa ON sa.shift_id = s.id
+        LEFT JOIN projects p ON p.id = s.project_id
+        WHERE sa.employee_id = ?
+          AND s.date >= ? AND s.date <= ?
+        ORDER BY s.date ASC, s.start_time ASC
+    """,
+    "employee_constraints": """
+        SELECT
+            id,
+            kind,
+            scope,
+            value_json,
+            valid_from,
+            valid_to
+        FROM EmployeeConstraints
+        WHERE employee_id = ?
+        ORDER BY
+            COALESCE(valid_from, '') ASC,
+            id ASC
+    """,
+    "active_employees": """
+        SELECT id, name
+        FROM employees
+        WHERE active = 1
+        ORDER BY name
+    """,
+    "constraints_for_employees": """
+        SELECT id, employee_id, kind, scope, value_json, compiled_json, valid_from, valid_to
+        FROM EmployeeConstraints
+        WHERE employee_id IN (SELECT value FROM json_each(?))
+    """,
+    "assignments_for_employees": """
+        SELECT sa.employee_id, s.date, s.start_time, s.end_time
+        FROM ShiftAssignments sa
+        INNER JOIN shifts s ON s.id = sa.shift_id
+        WHERE sa.employee_id IN (SELECT value FROM json_each(?))
+          AND s.date BETWEEN ? AND ?
+    """,
+    # --- תיקון סידור ---
+    "repair_employee": "SELECT id, name, active FROM employees WHERE id = ?",
+    "repair_employee_assignments": """
+        SELECT
+            s.id AS shift_id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            COALESCE(p.name, 'לא הוגדר פרויקט') AS project
+        FROM ShiftAssignments sa
+        INNER JOIN shifts s ON s.id = sa.shift_id
+        LEFT JOIN projects p ON p.id = s.project_id
+        WHERE sa.employee_id = ?
+          AND s.date BETWEEN ? AND ?
+        ORDER BY s.date, s.start_time
+    """,
+    "assignment_exists": "SELECT 1 FROM ShiftAssignments WHERE shift_id = ? AND employee_id = ?",
+    "employee_busy_on_date": """
+        SELECT 1
+        FROM ShiftAssignments sa
+        INNER JOIN shifts s ON s.id = sa.shift_id
+        WHERE sa.employee_id = ? AND s.date = ?
+    """,
+    "assignment_delete": "DELETE FROM ShiftAssignments WHERE shift_id = ? AND employee_id = ?",
+    # --- שמירת תוכנית שיבוץ (טבלת ביניים זמנית) ---
+    "plan_stage_create": """
+        CREATE TEMP TABLE IF NOT EXISTS schedule_plan_stage (
+            date TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            employee_id INTEGER
+        )
+    """,
+    "plan_stage_clear": "DELETE FROM temp.schedule_plan_stage",
+    "plan_stage_load": """
+        INSERT INTO temp.schedule_plan_stage (date, start_time, end_time, employee_id)
+        SELECT
+            json_extract(value, '$[0]'),
+            json_extract(value, '$[1]'),
+            json_extract(value, '$[2]'),
+            json_extract(value, '$[3]')
+        FROM json_each(?)
+    """,
+    "plan_shifts_insert": """
+        INSERT INTO shifts (project_id, date, start_time, end_time, location)
+        SELECT ?, p.date, p.start_time, p.end_time, ?
+        FROM (
+            SELECT DISTINCT date, start_time, end_time
+            FROM temp.schedule_plan_stage
+        ) p
+        WHERE NOT EXISTS (
+            SELECT 1
+            FROM shifts s
+            WHERE s.project_id = ?
+              AND s.date = p.date
+              AND s.start_time = p.start_time
+              AND s.end_time = p.end_time
+              AND IFNULL(s.location, '') = ?
+        )
+        ORDER BY p.date, p.start_time
+    """,
+    "plan_assignments_insert": """
+        INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
+        SELECT MIN(s.id), p.employee_id
+        FROM temp.schedule_plan_stage p
+        INNER JOIN shifts s
+            ON s.project_id = ?
+           AND s.date = p.date
+           AND s.start_time = p.start_time
+           AND s.end_time = p.end_time
+           AND IFNULL(s.location, '') = ?
+        GROUP BY p.rowid
+    """,
+    # --- פרויקטים ---
+    "project_names": "SELECT name FROM projects ORDER BY name",
+    "project_options": "SELECT id, name FROM projects ORDER BY name",
+    "project_id_by_name": "SELECT id FROM projects WHERE name = ?",
+    "project_insert_name": "INSERT INTO projects (name) VALUES (?)",
+    "active_project_requirements": """
+        SELECT id, name, morning_required, afternoon_required, night_required
+        FROM projects
+        WHERE active = 1
+        ORDER BY name
+    """,
+    "project_slot_fill": """
+        SELECT s.date, s.start_time, s.end_time, COUNT(sa.employee_id) AS filled
+        FROM shifts s
+        LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
+        WHERE s.project_id = ?
+          AND s.date BETWEEN ? AND ?
+        GROUP BY s.date, s.start_time, s.end_time
+    """,
+    "project_by_id": """
+        SELECT
+            id,
+            name,
+            hourly_rate,
+            active,
+            morning_required,
+            afternoon_required,
+            night_required
+        FROM projects
+        WHERE id = ?
+    """,
+    "projects_dashboard_rows": """
+        SELECT
+            p.id AS project_id,
+            p.name,
+            p.hourly_rate,
+            p.active,
+            p.morning_required,
+            p.afternoon_required,
+            p.night_required,
+            s.id AS shift_id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            sa.employee_id
+        FROM projects p
+        LEFT JOIN {shifts} s ON s.project_id = p.id
+        LEFT JOIN {assignments} sa ON sa.shift_id = s.id
+        ORDER BY p.name, s.date, s.start_time
+    """,
+    "projects_by_ids": """
+        SELECT
+            id,
+            name,
+            hourly_rate,
+            active,
+            morning_required,
+            afternoon_required,
+            night_required
+        FROM projects
+        WHERE id IN (SELECT value FROM json_each(?))
+        ORDER BY name, id
+    """,
+    "project_report_rows": """
+        SELECT
+            e.id AS employee_id,
+            e.name AS employee_name,
+            s.id AS shift_id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location
+        FROM shifts s
+        INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
+        INNER JOIN employees e ON e.id = sa.employee_id
+        WHERE s.project_id = ?
+        ORDER BY s.date ASC, s.start_time ASC, e.name ASC
+    """,
+    "project_calendar_rows": """
+        SELECT
+            s.date,
+            s.start_time,
+            s.end_time,
+            IFNULL(s.location, '') AS location,
+            e.name AS employee_name,
+            p.name AS project_name
+        FROM {shifts} s
+        INNER JOIN projects p ON p.id = s.project_id
+        LEFT JOIN {assignments} sa ON sa.shift_id = s.id
+        LEFT JOIN employees e ON e.id = sa.employee_id
+        WHERE s.project_id = ?
+          AND s.date BETWEEN ? AND ?
+        ORDER BY s.date ASC, s.start_time ASC, e.name ASC
+    """,
+    # --- משמרות ---
+    "shift_insert": """
+        INSERT INTO shifts (project_id, date, start_time, end_time, location)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "shift_assignment_insert": """
+        INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
+        VALUES (?, ?)
+    """,
+    # --- דוחות ---
+    "admin_report_rows": """
+        SELECT
+            s.id AS shift_id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location,
+            p.id AS project_id,
+            p.name AS project_name,
+            p.hourly_rate,
+            sa.employee_id,
+            e.name AS employee_name
+        FROM {shifts} s
+        INNER JOIN projects p ON p.id = s.project_id
+        LEFT JOIN {assignments} sa ON sa.shift_id = s.id
+        LEFT JOIN employees e ON e.id = sa.employee_id
+        WHERE s.project_id IN (SELECT value FROM json_each(?))
+          AND s.date >= ? AND s.date <= ?
+        ORDER BY s.date ASC, s.start_time ASC, p.name ASC
+    """,
+    "business_overview_rows": """
+        SELECT
+            s.id AS shift_id,
+            s.date,
+            s.start_time,
+            s.end_time,
+            s.location,
+            p.id AS project_id,
+            p.name AS project_name,
+            p.hourly_rate,
+            p.active AS project_active,
+            sa.employee_id,
+            e.name AS employee_name
+        FROM {shifts} s
+        LEFT JOIN projects p ON p.id = s.project_id
+        LEFT JOIN {assignments} sa ON sa.shift_id = s.id
+        LEFT JOIN employees e ON e.id = sa.employee_id
+        WHERE s.date >= ? AND s.date <= ?
+        ORDER BY s.date ASC, s.start_time ASC
+    """,
+}
+
+
+def id_list(values: Iterable[Any]) -> str:
+    """Bind a variable-length id list as one parameter for ``json_each(?)``."""
+    return json.dumps([int(value) for value in values])
+
+
+class QueryTimings:
+    """Thread-safe per-statement counters: calls, rows returned and wall time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, name: str, seconds: float, rows: int = 0) -> None:
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = {"calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0}
+            entry["calls"] += 1
+            entry["rows"] += rows
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-statement totals, slowest (by total time) first."""
+        with self._lock:
+            items = [(name, dict(entry)) for name, entry in self._stats.items()]
+        items.sort(key=lambda item: item[1]["total_ms"], reverse=True)
+        return {
+            name: {
+                "calls": int(entry["calls"]),
+                "rows": int(entry["rows"]),
+                "total_ms": round(entry["total_ms"], 3),
+                "avg_ms": round(entry["total_ms"] / entry["calls"], 3),
+                "max_ms": round(entry["max_ms"], 3),
+            }
+            for name, entry in items
+        }
+
+
+query_timings = QueryTimings()
+
+
+def sql(name: str, shifts: Optional[str] = None, assignments: Optional[str] = None) -> str:
+    """The registered text of ``name``, with the ``shift_tables`` sources filled in."""
+    text = QUERIES[name]
+    if "{shifts}" in text:
+        text = text.format(shifts=shifts or "shifts", assignments=assignments or "ShiftAssignments")
+    return text
+
+
+def execute(cur, name: str, params: Sequence[Any] = (), **sources: str):
+    """Run a registered statement (typically a write) and return the cursor."""
+    started = time.perf_counter()
+    try:
+        return cur.execute(sql(name, **sources), params)
+    finally:
+        query_timings.record(name, time.perf_counter() - started, max(cur.rowcount, 0))
+
+
+def execute_many(cur, name: str, seq_of_params: Iterable[Sequence[Any]]):
+    """``executemany`` of a registered write; recorded as one call."""
+    started = time.perf_counter()
+    try:
+        return cur.executemany(sql(name), seq_of_params)
+    finally:
+        query_timings.record(name, time.perf_counter() - started, max(cur.rowcount, 0))
+
+
+def fetch_all(cur, name: str, params: Sequence[Any] = (), **sources: str) -> List[Any]:
+    """Run a registered query and fetch every row; the timing includes the fetch."""
+    started = time.perf_counter()
+    rows: List[Any] = []
+    try:
+        rows = cur.execute(sql(name, **sources), params).fetchall()
+        return rows
+    finally:
+        query_timings.record(name, time.perf_counter() - started, len(rows))
+
+
+def fetch_one(cur, name: str, params: Sequence[Any] = (), **sources: str) -> Optional[Any]:
+    started = time.perf_counter()
+    row = None
+    try:
+        row = cur.execute(sql(name, **sources), params).fetchone()
+        return row
+    finally:
+        query_timings.record(name, time.perf_counter() - started, 1 if row is not None else 0)
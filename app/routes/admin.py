@@ -1,17 +1,36 @@
-from collections import defaultdict
+import json
+import os
+import pickle
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from urllib.parse import urlencode
 
-from fastapi import APIRouter, Form, Request
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from fastapi import APIRouter, Depends, Form, Request
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
 from starlette import status
 
-from app.db import get_connection
+from app import db, queries
+from app.archive import ArchivedDateError, archive_horizon, check_writable, shift_tables
+from app.constraint_cache import constraint_version, coverage_cache, profile_cache
+from app.db import db_executors, get_connection, get_db, get_pool, run_db
+from app.jobs import JobCancelled, JobManager
+from app.scheduler import (
+    REJECTION_REASONS,
+    AvailabilityMatrix,
+    GenerationState,
+    RejectionAnalyzer,
+    WorkHoursTracker,
+    improve_schedule,
+    plan_day_optimal,
+)
 from app.utils import (
     calculate_shift_hours,
-    build_constraint_profile,
     constraint_allows_shift,
     normalize_shift_key,
 )
@@ -27,6 +46,30 @@ SHIFT_TEMPLATES = {
 
 SHIFT_ORDER = ["morning", "afternoon", "night"]
 
+GENERATION_JOB_WORKERS = 2
+
+# תור משימות מקומי להפקות ארוכות שרצות ברקע
+generation_jobs = JobManager(max_workers=GENERATION_JOB_WORKERS)
+
+GENERATION_MODES = {
+    "greedy": "מהיר (חמדני)",
+    "optimal": "אופטימלי (כיסוי מרבי)",
+}
+
+# תקרה לזמן שלב השיפור בבקשה סינכרונית
+MAX_IMPROVE_SECONDS = 30.0
+
+# מספר תהליכים להפקה מקבילית של כמה פרויקטים
+BATCH_GENERATION_WORKERS = os.cpu_count() or 1
+
+# טווח מרבי למפת הזמינות
+MAX_HEATMAP_DAYS = 366
+
+# מנוחה מינימלית בין משמרות ותקרת שעות בחלון מתגלגל (0 = ללא הגבלה)
+MIN_REST_HOURS = 8
+MAX_HOURS_PER_WINDOW = 48
+HOURS_WINDOW_DAYS = 7
+
 
 def _redirect(url: str, **params) -> RedirectResponse:
     target = url
@@ -57,80 +100,19 @@ def _require_admin(request: Request) -> Optional[RedirectResponse]:
 def _fetch_project_record(project_id: int):
     conn = get_connection()
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                id,
-                name,
-                hourly_rate,
-                active,
-                morning_required,
-                afternoon_required,
-                night_required
-            FROM projects
-            WHERE id = ?
-            """,
-            (project_id,),
-        )
-        project = cur.fetchone()
+        project = queries.fetch_one(conn.cursor(), "project_by_id", (project_id,))
     finally:
         conn.close()
     return project
 
 
-def _ensure_shift(cur, project_id: int, date_str: str, start_time: str, end_time: str, location: str) -> int:
-    loc_value = location or ""
-    cur.execute(
-        """
-        SELECT id
-        FROM shifts
-        WHERE project_id = ?
-          AND date = ?
-          AND start_time = ?
-          AND end_time = ?
-          AND IFNULL(location, '') = ?
-        """,
-        (project_id, date_str, start_time, end_time, loc_value),
-    )
-    row = cur.fetchone()
-    if row:
-        return row["id"]
-
-    cur.execute(
-        """
-        INSERT INTO shifts (project_id, date, start_time, end_time, location)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (project_id, date_str, start_time, end_time, location),
-    )
-    return cur.lastrowid
-
-
 def _load_active_employees_with_constraints(cur):
-    cur.execute(
-        """
-        SELECT id, name
-        FROM employees
-        WHERE active = 1
-        ORDER BY name
-        """
-    )
-    employees = cur.fetchall()
+    employees = queries.fetch_all(cur, "active_employees")
     employee_ids = [row["id"] for row in employees]
     constraints_map: Dict[int, List[Dict]] = defaultdict(list)
 
     if employee_ids:
-        placeholders = ",".join("?" for _ in employee_ids)
-        cur.execute(
-            f"""
-            SELECT employee_id, kind, scope, value_json, valid_from, valid_to
-            FROM EmployeeConstraints
-            WHERE employee_id IN ({placeholders})
-            """,
-            employee_ids,
-        )
-        for row in cur.fetchall():
+        for row in queries.fetch_all(cur, "constraints_for_employees", (queries.id_list(employee_ids),)):
             constraints_map[row["employee_id"]].append(dict(row))
 
     return employees, constraints_map
@@ -146,6 +128,7 @@ def _build_generation_context(request: Request, project, extra: Optional[Dict] =
             "night": project["night_required"] or 0,
         },
         "shift_templates": SHIFT_TEMPLATES,
+        "generation_modes": GENERATION_MODES,
     }
     if extra:
         context.update(extra)
@@ -154,6 +137,7 @@ def _build_generation_context(request: Request, project, extra: Optional[Dict] =
 
 def build_admin_report_data(
     request: Request,
+    conn: sqlite3.Connection,
     start_date: Optional[str],
     end_date: Optional[str],
     project_params: Optional[List[str]] = None,
@@ -164,13 +148,8 @@ def build_admin_report_data(
     start_date = (start_date or "").strip() or ""
     end_date = (end_date or "").strip() or ""
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM projects ORDER BY name")
-        all_projects = cur.fetchall()
-    finally:
-        conn.close()
+    cur = conn.cursor()
+    all_projects = queries.fetch_all(cur, "project_options")
 
     selected_ids: List[int] = []
     raw_selected = project_params or []
@@ -187,41 +166,13 @@ def build_admin_report_data(
     total_amount = 0.0
 
     if selected_ids:
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            placeholders = ",".join("?" for _ in selected_ids)
-            query = f"""
-                SELECT
-                    s.id AS shift_id,
-                    s.date,
-                    s.start_time,
-                    s.end_time,
-                    s.location,
-                    p.id AS project_id,
-                    p.name AS project_name,
-                    p.hourly_rate,
-                    sa.employee_id,
-                    e.name AS employee_name
-                FROM shifts s
-                INNER JOIN projects p ON p.id = s.project_id
-                LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
-                LEFT JOIN employees e ON e.id = sa.employee_id
-                WHERE s.project_id IN ({placeholders})
-            """
-            params: List = list(selected_ids)
-            if start_date:
-                query += " AND s.date >= ?"
-                params.append(start_date)
-            if end_date:
-                query += " AND s.date <= ?"
-                params.append(end_date)
-
-            query += " ORDER BY s.date ASC, s.start_time ASC, p.name ASC"
-            cur.execute(query, params)
-            rows = cur.fetchall()
-        finally:
-            conn.close()
+        params = (
+            queries.id_list(selected_ids),
+            start_date or queries.DATE_MIN,
+            end_date or queries.DATE_MAX,
+        )
+        with shift_tables(conn, start_date, end_date or None) as (shifts, assignments):
+            rows = queries.fetch_all(cur, "admin_report_rows", params, shifts=shifts, assignments=assignments)
 
         shift_hours: Dict[int, float] = {}
 
@@ -332,104 +283,160 @@ def build_admin_report_data(
     }
 
 
-def _generate_schedule_for_project(
-    cur,
-    project,
-    employees,
-    constraints_map,
-    start_date: datetime,
-    end_date: datetime,
-    requirements: Dict[str, int],
-    location: str,
-):
+def _valid_template_hours(date_str: str, shift_key: str) -> bool:
+    template = SHIFT_TEMPLATES[shift_key]
+    hours = calculate_shift_hours(date_str, template["start"], template["end"])
+    return 0 < hours <= 16
+
+
+def _date_range(start_date: datetime, end_date: datetime) -> List[str]:
     date_cursor = start_date.date()
     end_date_only = end_date.date()
     date_list: List[str] = []
     while date_cursor <= end_date_only:
         date_list.append(date_cursor.isoformat())
         date_cursor += timedelta(days=1)
+    return date_list
+
 
+def _build_generation_state(
+    cur, employees, constraints_map, date_list: List[str], exclude: Iterable[Tuple[int, str, str, str]] = ()
+) -> GenerationState:
+    """``exclude`` lists ``(employee_id, date, start_time, end_time)`` assignments that are about to be removed."""
     employee_ids = [row["id"] for row in employees]
-    employee_lookup = {row["id"]: row for row in employees}
+    existing: List = []
+    if employee_ids and date_list:
+        # גם משמרות שלפני ואחרי הטווח משפיעות על זמני המנוחה ועל תקרת השעות
+        padding = timedelta(days=WorkHoursTracker.padding_days(MIN_REST_HOURS, HOURS_WINDOW_DAYS))
+        first = (datetime.fromisoformat(date_list[0]) - padding).date().isoformat()
+        last = (datetime.fromisoformat(date_list[-1]) + padding).date().isoformat()
+        rows = queries.fetch_all(cur, "assignments_for_employees", (queries.id_list(employee_ids), first, last))
+        existing = [(row["employee_id"], row["date"], row["start_time"], row["end_time"]) for row in rows]
+    if exclude:
+        skipped = Counter(exclude)
+        kept = []
+        for row in existing:
+            if skipped[row]:
+                skipped[row] -= 1
+                continue
+            kept.append(row)
+        existing = kept
+    return GenerationState(
+        employees,
+        constraints_map,
+        date_list,
+        SHIFT_ORDER,
+        existing,
+        shift_times={key: (template["start"], template["end"]) for key, template in SHIFT_TEMPLATES.items()},
+        min_rest_hours=MIN_REST_HOURS,
+        max_window_hours=MAX_HOURS_PER_WINDOW,
+        window_days=HOURS_WINDOW_DAYS,
+    )
 
-    constraint_profiles = {
-        employee_id: build_constraint_profile(constraints_map.get(employee_id, []))
-        for employee_id in employee_ids
-    }
 
-    employee_load = {employee_id: 0 for employee_id in employee_ids}
-    preferred_map = {
-        emp_id: constraint_profiles[emp_id].get("preferred_shifts", set())
-        for emp_id in employee_ids
-    }
-    disliked_map = {
-        emp_id: constraint_profiles[emp_id].get("disliked_shifts", set())
-        for emp_id in employee_ids
+def _plan_schedule_for_project(
+    project,
+    requirements: Dict[str, int],
+    date_list: List[str],
+    state: GenerationState,
+    mode: str = "greedy",
+    on_progress: Optional[Callable[[int, int, List[str]], None]] = None,
+    improve_seconds: float = 0.0,
+    preferred: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Decide every assignment for the range in memory; nothing is written to the database.
+    ``on_progress(days_processed, slots_filled, warnings)`` is called after every day.
+    With ``improve_seconds`` the finished plan is refined by ``improve_schedule`` and
+    ``plan["improvement"]`` reports the score before and after. In optimal mode a
+    ``preferred`` employee bitset is solved first and the others only fill what is
+    left (greedy mode gets the same order from ``CandidateQueue.prefer``).
+    """
+    availability = state.availability
+    positions = availability.positions
+    working_by_date = state.working_by_date
+    candidates = state.candidates
+    names = state.names
+
+    assignments: List[Dict[str, Any]] = []
+    warnings: List[str] = []
+    hours_warnings: List[str] = []
+    coverage_by_shift = {
+        shift_key: {"label": SHIFT_TEMPLATES[shift_key]["label"], "required": 0, "filled": 0}
+        for shift_key in SHIFT_ORDER
     }
-    assignments_by_employee_date: Dict[int, Set[str]] = defaultdict(set)
 
-    if employee_ids:
-        placeholders = ",".join("?" for _ in employee_ids)
-        cur.execute(
-            f"""
-            SELECT sa.employee_id, s.date
-            FROM ShiftAssignments sa
-            INNER JOIN shifts s ON s.id = sa.shift_id
-            WHERE sa.employee_id IN ({placeholders})
-              AND s.date BETWEEN ? AND ?
-            """,
-            employee_ids + [date_list[0], date_list[-1]],
-        )
-        for row in cur.fetchall():
-            assignments_by_employee_date[row["employee_id"]].add(row["date"])
-            employee_load[row["employee_id"]] = employee_load.get(row["employee_id"], 0) + 1
+    for day_index, date_str in enumerate(date_list):
+        day_plan = None
+        if mode == "optimal":
+            day_requirements = {
+                shift_key: requirements.get(shift_key, 0) or 0
+                for shift_key in SHIFT_ORDER
+                if _valid_template_hours(date_str, shift_key)
+            }
 
-    assignments_created: List[Dict[str, Any]] = []
-    warnings: List[str] = []
-    shifts_created: Set[str] = set()
+            def _solve(needed: Dict[str, int], working_mask: int) -> Dict[str, List[int]]:
+                return plan_day_optimal(
+                    date_str,
+                    needed,
+                    availability,
+                    working_mask,
+                    state.employee_load,
+                    state.preferred_map,
+                    state.disliked_map,
+                    names,
+                    lambda employee_id, shift_key: state.allows_work(employee_id, date_str, shift_key),
+                )
+
+            if preferred is None:
+                day_plan = _solve(day_requirements, working_by_date[date_str])
+            else:
+                day_plan = _solve(day_requirements, working_by_date[date_str] | ~preferred)
+                remaining = {
+                    shift_key: required - len(day_plan.get(normalize_shift_key(shift_key), []))
+                    for shift_key, required in day_requirements.items()
+                }
+                if any(count > 0 for count in remaining.values()):
+                    taken = working_by_date[date_str]
+                    for members in day_plan.values():
+                        for employee_id in members:
+                            taken |= availability.bit(employee_id)
+                    for shift_key, members in _solve(remaining, taken).items():
+                        day_plan.setdefault(shift_key, []).extend(members)
 
-    for date_str in date_list:
         for shift_key in SHIFT_ORDER:
             required = requirements.get(shift_key, 0) or 0
             if required <= 0:
                 continue
+            coverage_by_shift[shift_key]["required"] += required
 
             template = SHIFT_TEMPLATES[shift_key]
             start_time = template["start"]
             end_time = template["end"]
             hours = calculate_shift_hours(date_str, start_time, end_time)
             if hours <= 0 or hours > 16:
-                warnings.append(
+                hours_warnings.append(
                     f"משמרת {template['label']} בתאריך {date_str} לא תקינה (משך {hours} שעות)."
                 )
+                warnings.append(hours_warnings[-1])
                 continue
 
-            shift_id = None
-            slots_filled = 0
-
             normalized_shift = normalize_shift_key(shift_key)
-            for _ in range(required):
-                candidate_order = sorted(
-                    employee_ids,
-                    key=lambda emp_id: (
-                        employee_load.get(emp_id, 0),
-                        0 if normalized_shift in preferred_map.get(emp_id, set()) else 1,
-                        1 if normalized_shift in disliked_map.get(emp_id, set()) else 0,
-                        employee_lookup[emp_id]["name"],
-                    ),
-                )
-                chosen_employee = None
+            allowed_mask = availability.mask(date_str, normalized_shift)
 
-                for employee_id in candidate_order:
-                    if date_str in assignments_by_employee_date[employee_id]:
-                        continue
-                    if normalized_shift in disliked_map.get(employee_id, set()) and normalized_shift not in preferred_map.get(employee_id, set()):
-                        continue
-                    profile = constraint_profiles.get(employee_id, {})
-                    if not constraint_allows_shift(profile, date_str, shift_key):
-                        continue
-                    chosen_employee = employee_id
-                    break
+            for slot_index in range(required):
+                eligible = allowed_mask & ~working_by_date[date_str]
+                chosen_employee = None
+                if day_plan is not None:
+                    planned = day_plan.get(normalized_shift, [])
+                    if slot_index < len(planned):
+                        chosen_employee = planned[slot_index]
+                elif eligible:
+                    chosen_employee = candidates.select(
+                        normalized_shift,
+                        lambda employee_id: eligible >> positions[employee_id] & 1
+                        and state.allows_work(employee_id, date_str, normalized_shift),
+                    )
 
                 if chosen_employee is None:
                     warnings.append(
@@ -437,45 +444,453 @@ def _generate_schedule_for_project(
                     )
                     break
 
-                if shift_id is None:
-                    shift_id = _ensure_shift(
-                        cur,
-                        project_id=project["id"],
-                        date_str=date_str,
-                        start_time=start_time,
-                        end_time=end_time,
-                        location=location,
-                    )
-                    shifts_created.add(f"{date_str}-{shift_key}")
-
-                cur.execute(
-                    """
-                    INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
-                    VALUES (?, ?)
-                    """,
-                    (shift_id, chosen_employee),
-                )
-
-                if cur.rowcount == 0:
-                    continue
-
-                assignments_by_employee_date[chosen_employee].add(date_str)
-                employee_load[chosen_employee] = employee_load.get(chosen_employee, 0) + 1
-                assignments_created.append(
+                state.record_assignment(chosen_employee, date_str, normalized_shift)
+                coverage_by_shift[shift_key]["filled"] += 1
+                assignments.append(
                     {
                         "date": date_str,
+                        "shift_key": shift_key,
                         "shift": template["label"],
-                        "employee": employee_lookup[chosen_employee]["name"],
+                        "employee_id": chosen_employee,
+                        "employee": names[chosen_employee],
                         "hours": hours,
                     }
                 )
-                slots_filled += 1
 
+        if on_progress is not None:
+            on_progress(day_index + 1, len(assignments), warnings)
+
+    improvement = None
+    if improve_seconds > 0:
+        assignments, shortfall_warnings, improvement = _improve_planned_assignments(
+            requirements, date_list, assignments, state, improve_seconds
+        )
+        warnings = hours_warnings + shortfall_warnings
+        for item in coverage_by_shift.values():
+            item["filled"] = 0
+        for row in assignments:
+            coverage_by_shift[row["shift_key"]]["filled"] += 1
+
+    total_required = sum(item["required"] for item in coverage_by_shift.values())
     return {
-        "assignments_created": assignments_created,
-        "total_assignments": len(assignments_created),
-        "shifts_created": len(shifts_created),
+        "project_id": project["id"],
+        "assignments": assignments,
         "warnings": warnings,
+        "coverage": {
+            "required": total_required,
+            "filled": len(assignments),
+            "percent": round(100.0 * len(assignments) / total_required, 1) if total_required else 100.0,
+            "by_shift": coverage_by_shift,
+        },
+        "improvement": improvement,
+    }
+
+
+def _improve_planned_assignments(
+    requirements: Dict[str, int],
+    date_list: List[str],
+    assignments: List[Dict[str, Any]],
+    state: GenerationState,
+    improve_seconds: float,
+):
+    """Run the local-search pass over a plan; returns (assignments, shortfall warnings, stats)."""
+    members_by_slot: Dict[tuple, List[int]] = defaultdict(list)
+    for row in assignments:
+        members_by_slot[(row["date"], row["shift_key"])].append(row["employee_id"])
+
+    slots: List[tuple] = []
+    for date_str in date_list:
+        for shift_key in SHIFT_ORDER:
+            required = requirements.get(shift_key, 0) or 0
+            if required <= 0 or not _valid_template_hours(date_str, shift_key):
+                continue
+            members = members_by_slot.get((date_str, shift_key), [])
+            slots.extend((date_str, shift_key, employee_id) for employee_id in members)
+            slots.extend((date_str, shift_key, None) for _ in range(required - len(members)))
+
+    improved_slots, stats = improve_schedule(slots, state, improve_seconds)
+
+    improved: List[Dict[str, Any]] = []
+    shortfall_warnings: List[str] = []
+    for date_str, shift_key, employee_id in improved_slots:
+        template = SHIFT_TEMPLATES[shift_key]
+        if employee_id is None:
+            message = f"לא נמצא עובד זמין למשמרת {template['label']} בתאריך {date_str}"
+            if not shortfall_warnings or shortfall_warnings[-1] != message:
+                shortfall_warnings.append(message)
+            continue
+        improved.append(
+            {
+                "date": date_str,
+                "shift_key": shift_key,
+                "shift": template["label"],
+                "employee_id": employee_id,
+                "employee": state.names[employee_id],
+                "hours": calculate_shift_hours(date_str, template["start"], template["end"]),
+            }
+        )
+    return improved, shortfall_warnings, stats
+
+
+def _persist_schedule_plan(cur, project_id: int, location: str, assignments: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Persist planned assignments set-wise: the plan is staged in a temp table from a
+    single JSON parameter (json_each), then missing shifts and all assignments are
+    written with two INSERT ... SELECT joins. The statement count does not grow with
+    the plan size. The caller owns the transaction.
+    """
+    if not assignments:
+        return {"assignments": 0, "shifts": 0}
+    check_writable(cur.connection, min(row["date"] for row in assignments))
+
+    loc_value = location or ""
+    staged = []
+    for row in assignments:
+        template = SHIFT_TEMPLATES[row["shift_key"]]
+        staged.append((row["date"], template["start"], template["end"], row["employee_id"]))
+
+    queries.execute(cur, "plan_stage_create")
+    queries.execute(cur, "plan_stage_clear")
+    queries.execute(cur, "plan_stage_load", (json.dumps(staged),))
+    queries.execute(cur, "plan_shifts_insert", (project_id, location, project_id, loc_value))
+    changes_before = cur.connection.total_changes
+    queries.execute(cur, "plan_assignments_insert", (project_id, loc_value))
+    inserted = cur.connection.total_changes - changes_before
+    queries.execute(cur, "plan_stage_clear")
+    return {
+        "assignments": inserted,
+        "shifts": len({(row[0], row[1], row[2]) for row in staged}),
+    }
+
+
+def _write_schedule_plan(project_id: int, location: str, assignments: List[Dict[str, Any]]) -> Dict[str, int]:
+    """``_persist_schedule_plan`` as one job on the serialized writer (committed on return)."""
+    return db.write(_persist_schedule_plan, project_id, location, assignments)
+
+
+def _persist_schedule_plans(cur, plans: List[Tuple[int, str, List[Dict[str, Any]]]]) -> List[Dict[str, int]]:
+    """Persist several ``(project_id, location, assignments)`` plans in the caller's transaction."""
+    return [_persist_schedule_plan(cur, project_id, location, assignments) for project_id, location, assignments in plans]
+
+
+def _write_schedule_plans(plans: List[Tuple[int, str, List[Dict[str, Any]]]]) -> List[Dict[str, int]]:
+    """
+    ``_persist_schedule_plans`` as a single writer job, so a batch is committed (or
+    rolled back) as a whole.
+    """
+    return db.write(_persist_schedule_plans, plans)
+
+
+def _generate_schedule_for_project(
+    cur,
+    project,
+    employees,
+    constraints_map,
+    start_date: datetime,
+    end_date: datetime,
+    requirements: Dict[str, int],
+    location: str,
+    mode: str = "greedy",
+    state: Optional[GenerationState] = None,
+    improve_seconds: float = 0.0,
+    write_plan: Optional[Callable[..., Dict[str, int]]] = None,
+):
+    """
+    Plan the project from ``cur``'s view of the data and persist the plan, on ``cur``
+    itself by default or through ``write_plan(project_id, location, assignments)``.
+    """
+    date_list = _date_range(start_date, end_date)
+    if state is None:
+        state = _build_generation_state(cur, employees, constraints_map, date_list)
+
+    plan = _plan_schedule_for_project(
+        project, requirements, date_list, state, mode=mode, improve_seconds=improve_seconds
+    )
+    if write_plan is None:
+        persisted = _persist_schedule_plan(cur, project["id"], location, plan["assignments"])
+    else:
+        persisted = write_plan(project["id"], location, plan["assignments"])
+    return {
+        "assignments_created": plan["assignments"],
+        "total_assignments": persisted["assignments"],
+        "shifts_created": persisted["shifts"],
+        "warnings": plan["warnings"],
+        "coverage": plan["coverage"],
+        "improvement": plan["improvement"],
+    }
+
+
+def _shift_key_for_times(start_time: str, end_time: str) -> Optional[str]:
+    for shift_key, template in SHIFT_TEMPLATES.items():
+        if template["start"] == start_time and template["end"] == end_time:
+            return shift_key
+    return None
+
+
+class RepairConflict(Exception):
+    """The assignments a repair was planned against changed before it was applied."""
+
+
+def _plan_employee_repair(cur, employee_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    """
+    Decide which of the employee's template shifts in the range their current constraints
+    no longer allow, and who takes each slot by the generator's candidate ordering.
+    Manually reported (non-template) shifts are left untouched. Only reads; the result
+    is applied by ``_apply_employee_repair``.
+    """
+    date_list = _date_range(start_date, end_date)
+    employee = queries.fetch_one(cur, "repair_employee", (employee_id,))
+    if employee is None:
+        raise ValueError("העובד לא נמצא")
+
+    constraint_rows = queries.fetch_all(cur, "constraints_for_employees", (queries.id_list([employee_id]),))
+    timeline = profile_cache.get(employee_id, [dict(row) for row in constraint_rows])
+    rows = queries.fetch_all(cur, "repair_employee_assignments", (employee_id, date_list[0], date_list[-1]))
+
+    conflicts: List[Dict[str, Any]] = []
+    for row in rows:
+        shift_key = _shift_key_for_times(row["start_time"], row["end_time"])
+        if shift_key is None:
+            continue
+        profile = timeline.profile_for(row["date"])
+        disliked_only = (
+            shift_key in profile["disliked_shifts"] and shift_key not in profile["preferred_shifts"]
+        )
+        if employee["active"] and not disliked_only and constraint_allows_shift(profile, row["date"], shift_key):
+            continue
+        conflicts.append(
+            {
+                "shift_id": row["shift_id"],
+                "date": row["date"],
+                "shift_key": shift_key,
+                "shift": SHIFT_TEMPLATES[shift_key]["label"],
+                "project": row["project"],
+                "employee_id": employee_id,
+                "employee": employee["name"],
+            }
+        )
+
+    result: Dict[str, Any] = {"employee": employee["name"], "removed": conflicts, "added": [], "warnings": []}
+    if not conflicts:
+        return result
+
+    # המצב נבנה כאילו השיוכים המתנגשים כבר נמחקו
+    removed_times = [
+        (employee_id, slot["date"], SHIFT_TEMPLATES[slot["shift_key"]]["start"], SHIFT_TEMPLATES[slot["shift_key"]]["end"])
+        for slot in conflicts
+    ]
+    employees, constraints_map = _load_active_employees_with_constraints(cur)
+    state = _build_generation_state(cur, employees, constraints_map, date_list, exclude=removed_times)
+    positions = state.availability.positions
+    for slot in conflicts:
+        eligible = state.availability.mask(slot["date"], slot["shift_key"]) & ~state.working_by_date[slot["date"]]
+        chosen = None
+        if eligible:
+            chosen = state.candidates.select(
+                slot["shift_key"],
+                lambda candidate_id: eligible >> positions[candidate_id] & 1
+                and state.allows_work(candidate_id, slot["date"], slot["shift_key"]),
+            )
+        if chosen is None:
+            result["warnings"].append(
+                f"לא נמצא עובד חלופי למשמרת {slot['shift']} בתאריך {slot['date']} ({slot['project']})"
+            )
+            continue
+        state.record_assignment(chosen, slot["date"], slot["shift_key"])
+        result["added"].append({**slot, "employee_id": chosen, "employee": state.names[chosen]})
+    return result
+
+
+def _apply_employee_repair(cur, diff: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Writer job: apply a planned repair after checking that every removed assignment
+    still exists and no replacement was booked for that date in the meantime;
+    raises ``RepairConflict`` otherwise.
+    """
+    if diff["removed"]:
+        check_writable(cur.connection, min(slot["date"] for slot in diff["removed"]))
+    for slot in diff["removed"]:
+        if queries.fetch_one(cur, "assignment_exists", (slot["shift_id"], slot["employee_id"])) is None:
+            raise RepairConflict(f"השיוך של {slot['employee']} בתאריך {slot['date']} השתנה – יש להריץ את התיקון שוב")
+    for slot in diff["added"]:
+        if queries.fetch_one(cur, "employee_busy_on_date", (slot["employee_id"], slot["date"])) is not None:
+            raise RepairConflict(f"{slot['employee']} כבר משובץ/ת בתאריך {slot['date']} – יש להריץ את התיקון שוב")
+
+    queries.execute_many(
+        cur, "assignment_delete", [(slot["shift_id"], slot["employee_id"]) for slot in diff["removed"]]
+    )
+    queries.execute_many(
+        cur, "shift_assignment_insert", [(slot["shift_id"], slot["employee_id"]) for slot in diff["added"]]
+    )
+    return diff
+
+
+def _repair_employee_schedule(cur, employee_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    """Plan and apply a repair on one cursor (see ``_plan_employee_repair``)."""
+    return _apply_employee_repair(cur, _plan_employee_repair(cur, employee_id, start_date, end_date))
+
+
+def _analyze_uncovered_slots(cur, project, date_list: List[str]) -> Dict[str, Any]:
+    """
+    For every template slot of the project that is still short of staff, count the
+    active employees by the reason they could not take it (see ``RejectionAnalyzer``).
+    """
+    requirements = _project_requirements(project)
+    filled: Dict[tuple, int] = defaultdict(int)
+    for row in queries.fetch_all(cur, "project_slot_fill", (project["id"], date_list[0], date_list[-1])):
+        shift_key = _shift_key_for_times(row["start_time"], row["end_time"])
+        if shift_key is not None:
+            filled[(row["date"], shift_key)] += row["filled"]
+
+    employees, constraints_map = _load_active_employees_with_constraints(cur)
+    state = _build_generation_state(cur, employees, constraints_map, date_list)
+    analyzer = RejectionAnalyzer(state, SHIFT_ORDER)
+
+    slots: List[Dict[str, Any]] = []
+    totals = {reason: 0 for reason in REJECTION_REASONS + ("available",)}
+    for date_str in date_list:
+        for shift_key in SHIFT_ORDER:
+            required = requirements.get(shift_key, 0) or 0
+            missing = required - filled[(date_str, shift_key)]
+            if missing <= 0 or not _valid_template_hours(date_str, shift_key):
+                continue
+            reasons = analyzer.explain(date_str, shift_key)
+            for reason, count in reasons.items():
+                totals[reason] += count
+            slots.append(
+                {
+                    "date": date_str,
+                    "shift_key": shift_key,
+                    "shift": SHIFT_TEMPLATES[shift_key]["label"],
+                    "required": required,
+                    "filled": filled[(date_str, shift_key)],
+                    "missing": missing,
+                    "reasons": reasons,
+                }
+            )
+    return {"project": project["name"], "employees": len(employees), "slots": slots, "totals": totals}
+
+
+def _availability_heatmap(cur, project, date_list: List[str]) -> Dict[str, Any]:
+    """
+    Number of active employees the generator could place on each shift key per day,
+    next to the project's requirement. Counts are popcounts over the compiled
+    availability bitsets (minus each employee's disliked shifts) and only depend on
+    the employees and their constraints, so they are cached under that fingerprint.
+    """
+    employees, constraints_map = _load_active_employees_with_constraints(cur)
+    employee_ids = [row["id"] for row in employees]
+    fingerprint = tuple(
+        (employee_id, constraint_version(constraints_map.get(employee_id, []))) for employee_id in employee_ids
+    )
+
+    def _build() -> Dict[str, List[int]]:
+        timelines = {
+            employee_id: profile_cache.get(employee_id, constraints_map.get(employee_id, []))
+            for employee_id in employee_ids
+        }
+        matrix = AvailabilityMatrix(employee_ids, timelines, date_list, SHIFT_ORDER)
+        counts: Dict[str, List[int]] = {}
+        for shift_key in SHIFT_ORDER:
+            disliked = 0
+            for employee_id, position in matrix.positions.items():
+                profile = timelines[employee_id].base
+                if shift_key in profile["disliked_shifts"] and shift_key not in profile["preferred_shifts"]:
+                    disliked |= 1 << position
+            counts[shift_key] = matrix.counts(shift_key, disliked)
+        return counts
+
+    counts = coverage_cache.get_or_build(("heatmap", date_list[0], date_list[-1], fingerprint), _build)
+    requirements = _project_requirements(project)
+    rows = []
+    gaps = 0
+    for index, date_str in enumerate(date_list):
+        cells = []
+        for shift_key in SHIFT_ORDER:
+            required = requirements.get(shift_key, 0) or 0
+            short = counts[shift_key][index] < required
+            gaps += short
+            cells.append(
+                {"shift_key": shift_key, "eligible": counts[shift_key][index], "required": required, "short": short}
+            )
+        rows.append({"date": date_str, "cells": cells})
+    return {
+        "project": project["name"],
+        "employees": len(employee_ids),
+        "shifts": [{"key": key, "label": SHIFT_TEMPLATES[key]["label"]} for key in SHIFT_ORDER],
+        "days": rows,
+        "gaps": gaps,
+    }
+
+
+def _heatmap_range(start_date: str, end_date: str) -> List[str]:
+    """Parse the heatmap range (default: the next four weeks); raises ValueError with a Hebrew message."""
+    if start_date.strip():
+        try:
+            start_dt = datetime.strptime(start_date.strip(), "%Y-%m-%d")
+            end_dt = datetime.strptime(end_date.strip(), "%Y-%m-%d") if end_date.strip() else start_dt
+        except ValueError:
+            raise ValueError("תאריכים אינם בתוקף")
+    else:
+        start_dt = datetime.combine(datetime.now().date(), datetime.min.time())
+        end_dt = start_dt + timedelta(days=27)
+    if end_dt < start_dt:
+        raise ValueError("תאריך הסיום חייב להיות אחרי תאריך ההתחלה")
+    if (end_dt - start_dt).days >= MAX_HEATMAP_DAYS:
+        raise ValueError(f"ניתן להציג עד {MAX_HEATMAP_DAYS} ימים")
+    return _date_range(start_dt, end_dt)
+
+
+def _run_generation_job(
+    db_path: str,
+    project_id: int,
+    start_date: str,
+    end_date: str,
+    requirements: Dict[str, int],
+    location: str,
+    mode: str,
+    improve_seconds: float,
+    progress,
+    cancel,
+) -> Dict[str, Any]:
+    """Process-pool entry point: plan with progress reporting, then persist in one write job."""
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    date_list = _date_range(start_dt, end_dt)
+    progress.update(days_total=len(date_list), days_processed=0, slots_filled=0, warnings=[])
+
+    def _report(days_processed: int, slots_filled: int, warnings: List[str]) -> None:
+        if cancel.is_set():
+            raise JobCancelled()
+        update: Dict[str, Any] = {"days_processed": days_processed, "slots_filled": slots_filled}
+        if len(warnings) != progress.get("warnings_count", 0):
+            update["warnings"] = list(warnings)
+            update["warnings_count"] = len(warnings)
+        progress.update(update)
+
+    conn = get_connection(db_path)
+    try:
+        cur = conn.cursor()
+        project = queries.fetch_one(cur, "project_by_id", (project_id,))
+        employees, constraints_map = _load_active_employees_with_constraints(cur)
+        state = _build_generation_state(cur, employees, constraints_map, date_list)
+        plan = _plan_schedule_for_project(
+            project, requirements, date_list, state, mode=mode, on_progress=_report,
+            improve_seconds=improve_seconds,
+        )
+        if cancel.is_set():
+            raise JobCancelled()
+    finally:
+        conn.close()
+    persisted = db.write(_persist_schedule_plan, project_id, location, plan["assignments"], path=db_path)
+
+    return {
+        "assignments_created": plan["assignments"],
+        "total_assignments": persisted["assignments"],
+        "shifts_created": persisted["shifts"],
+        "warnings": plan["warnings"],
+        "coverage": plan["coverage"],
+        "improvement": plan["improvement"],
     }
 
 
@@ -535,36 +950,13 @@ def availability_dashboard(request: Request):
 
 
 @router.get("/projects", response_class=HTMLResponse)
-def projects_dashboard(request: Request):
+def projects_dashboard(request: Request, conn: sqlite3.Connection = Depends(get_db)):
     if (redirect := _require_admin(request)):
         return redirect
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                p.id AS project_id,
-                p.name,
-                p.hourly_rate,
-                p.active,
-                p.morning_required,
-                p.afternoon_required,
-                p.night_required,
-                s.id AS shift_id,
-                s.date,
-                s.start_time,
-                s.end_time,
-                sa.employee_id
-            FROM projects p
-            LEFT JOIN shifts s ON s.project_id = p.id
-            LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            ORDER BY p.name, s.date, s.start_time
-            """
-        )
-        rows = cur.fetchall()
-    finally:
-        conn.close()
+    cur = conn.cursor()
+    # הסיכומים הם לכל התקופה, כולל שנים שהועברו לארכיון
+    with shift_tables(conn) as (shifts, assignments):
+        rows = queries.fetch_all(cur, "projects_dashboard_rows", shifts=shifts, assignments=assignments)
 
     projects: Dict[int, Dict] = {}
     for row in rows:
@@ -628,35 +1020,30 @@ def projects_dashboard(request: Request):
     # Handle projects with no shifts yet
     if not rows:
         # fetch plain list
-        conn = get_connection()
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                """
-                SELECT id, name, hourly_rate, active, morning_required, afternoon_required, night_required
-                FROM projects
-                ORDER BY name
-                """
+        cur.execute(
+            """
+            SELECT id, name, hourly_rate, active, morning_required, afternoon_required, night_required
+            FROM projects
+            ORDER BY name
+            """
+        )
+        for row in cur.fetchall():
+            project_list.append(
+                {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "hourly_rate": round(row["hourly_rate"] or 0, 2),
+                    "active": bool(row["active"]),
+                    "morning_required": row["morning_required"] or 0,
+                    "afternoon_required": row["afternoon_required"] or 0,
+                    "night_required": row["night_required"] or 0,
+                    "employee_count": 0,
+                    "assignment_count": 0,
+                    "person_hours": 0.0,
+                    "payout": 0.0,
+                    "shift_count": 0,
+                }
             )
-            for row in cur.fetchall():
-                project_list.append(
-                    {
-                        "id": row["id"],
-                        "name": row["name"],
-                        "hourly_rate": round(row["hourly_rate"] or 0, 2),
-                        "active": bool(row["active"]),
-                        "morning_required": row["morning_required"] or 0,
-                        "afternoon_required": row["afternoon_required"] or 0,
-                        "night_required": row["night_required"] or 0,
-                        "employee_count": 0,
-                        "assignment_count": 0,
-                        "person_hours": 0.0,
-                        "payout": 0.0,
-                        "shift_count": 0,
-                    }
-                )
-        finally:
-            conn.close()
 
     project_list.sort(key=lambda project: project["name"])
 
@@ -695,10 +1082,8 @@ def create_project(
     afternoon_value = _safe_positive_int(afternoon_required)
     night_value = _safe_positive_int(night_required)
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
+    db.write(
+        lambda cur: cur.execute(
             """
             INSERT INTO projects (
                 name,
@@ -711,9 +1096,7 @@ def create_project(
             """,
             (name, rate_value, morning_value, afternoon_value, night_value),
         )
-        conn.commit()
-    finally:
-        conn.close()
+    )
 
     return _redirect("/admin/projects", message="הפרויקט נוסף בהצלחה")
 
@@ -727,16 +1110,7 @@ def update_project_status(
     if (redirect := _require_admin(request)):
         return redirect
     new_status = 1 if active == "open" else 0
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE projects SET active = ? WHERE id = ?",
-            (new_status, project_id),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    db.write(lambda cur: cur.execute("UPDATE projects SET active = ? WHERE id = ?", (new_status, project_id)))
 
     message = "הפרויקט נפתח מחדש" if new_status else "הפרויקט נסגר לשיבוץ"
     return _redirect("/admin/projects", message=message)
@@ -755,16 +1129,7 @@ def update_project_rate(
     except ValueError:
         return _redirect("/admin/projects", error="נא להזין ערך מספרי לתעריף")
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE projects SET hourly_rate = ? WHERE id = ?",
-            (rate_value, project_id),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    db.write(lambda cur: cur.execute("UPDATE projects SET hourly_rate = ? WHERE id = ?", (rate_value, project_id)))
 
     return _redirect("/admin/projects", message="התעריף עודכן בהצלחה")
 
@@ -783,10 +1148,8 @@ def update_project_requirements(
     afternoon_value = _safe_positive_int(afternoon_required)
     night_value = _safe_positive_int(night_required)
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
+    db.write(
+        lambda cur: cur.execute(
             """
             UPDATE projects
             SET morning_required = ?,
@@ -796,49 +1159,18 @@ def update_project_requirements(
             """,
             (morning_value, afternoon_value, night_value, project_id),
         )
-        conn.commit()
-    finally:
-        conn.close()
+    )
 
     return _redirect("/admin/projects", message="דרישות המשמרות עודכנו")
 
 
-@router.get("/projects/{project_id}/report", response_class=HTMLResponse)
-def project_report(project_id: int, request: Request):
-    if (redirect := _require_admin(request)):
-        return redirect
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT id, name, hourly_rate, active FROM projects WHERE id = ?",
-            (project_id,),
-        )
-        project = cur.fetchone()
-        if not project:
-            return _redirect("/admin/projects", error="פרויקט לא נמצא")
+def _build_project_report(conn: sqlite3.Connection, project_id: int) -> Optional[Dict]:
+    cur = conn.cursor()
+    project = queries.fetch_one(cur, "project_by_id", (project_id,))
+    if not project:
+        return None
 
-        cur.execute(
-            """
-            SELECT
-                e.id AS employee_id,
-                e.name AS employee_name,
-                s.id AS shift_id,
-                s.date,
-                s.start_time,
-                s.end_time,
-                s.location
-            FROM shifts s
-            INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            INNER JOIN employees e ON e.id = sa.employee_id
-            WHERE s.project_id = ?
-            ORDER BY s.date ASC, s.start_time ASC, e.name ASC
-            """,
-            (project_id,),
-        )
-        rows = cur.fetchall()
-    finally:
-        conn.close()
+    rows = queries.fetch_all(cur, "project_report_rows", (project_id,))
 
     employee_totals: Dict[int, Dict[str, float]] = {}
     total_hours = 0.0
@@ -889,17 +1221,25 @@ def project_report(project_id: int, request: Request):
         reverse=True,
     )
 
-    return templates.TemplateResponse(
-        "admin_project_report.html",
-        {
-            "request": request,
-            "project": project,
-            "employee_summary": employee_summary,
-            "detailed_rows": detailed_rows,
-            "total_hours": round(total_hours, 2),
-            "total_payout": round(total_payout, 2),
-        },
-    )
+    return {
+        "project": project,
+        "employee_summary": employee_summary,
+        "detailed_rows": detailed_rows,
+        "total_hours": round(total_hours, 2),
+        "total_payout": round(total_payout, 2),
+    }
+
+
+@router.get("/projects/{project_id}/report", response_class=HTMLResponse)
+async def project_report(project_id: int, request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    report = await run_db("reports", _build_project_report, project_id)
+    if report is None:
+        return _redirect("/admin/projects", error="פרויקט לא נמצא")
+    context = {"request": request}
+    context.update(report)
+    return templates.TemplateResponse("admin_project_report.html", context)
 
 
 @router.get("/projects/{project_id}/generate", response_class=HTMLResponse)
@@ -934,6 +1274,10 @@ def project_generate_submit(
     morning_override: str = Form(default=""),
     afternoon_override: str = Form(default=""),
     night_override: str = Form(default=""),
+    mode: str = Form(default="greedy"),
+    preview: str = Form(default=""),
+    background: str = Form(default=""),
+    improve_seconds: str = Form(default=""),
 ):
     if (redirect := _require_admin(request)):
         return redirect
@@ -941,7 +1285,8 @@ def project_generate_submit(
     if not project:
         return _redirect("/admin/projects", error="הפרויקט לא נמצא")
 
-    context_extra = {"schedule_result": None, "warnings": []}
+    mode = (mode or "").strip().lower() or "greedy"
+    context_extra = {"schedule_result": None, "warnings": [], "mode": mode}
     context = _build_generation_context(request, project, context_extra)
     context.setdefault("overrides", context["requirements"])
 
@@ -956,12 +1301,50 @@ def project_generate_submit(
         context["error"] = "תאריך הסיום חייב להיות אחרי תאריך ההתחלה"
         return templates.TemplateResponse("admin_project_generate.html", context)
 
+    if mode not in GENERATION_MODES:
+        context["error"] = "מצב הפקה לא מוכר"
+        return templates.TemplateResponse("admin_project_generate.html", context)
+
+    try:
+        improve_budget = float(improve_seconds.strip() or 0)
+    except ValueError:
+        improve_budget = -1.0
+    if not 0 <= improve_budget <= MAX_IMPROVE_SECONDS:
+        context["error"] = f"זמן השיפור חייב להיות בין 0 ל-{MAX_IMPROVE_SECONDS:g} שניות"
+        return templates.TemplateResponse("admin_project_generate.html", context)
+    context["improve_seconds"] = improve_budget
+
     overrides = {
         "morning": _safe_positive_int(morning_override, context["requirements"]["morning"]),
         "afternoon": _safe_positive_int(afternoon_override, context["requirements"]["afternoon"]),
         "night": _safe_positive_int(night_override, context["requirements"]["night"]),
     }
 
+    conn = get_connection()
+    try:
+        archived_error = _archived_range_error(conn, start_dt)
+    finally:
+        conn.close()
+    if archived_error:
+        context["error"] = archived_error
+        return templates.TemplateResponse("admin_project_generate.html", context)
+
+    shift_location = location.strip() or project["name"]
+    if background:
+        job_id = generation_jobs.submit(
+            _run_generation_job,
+            db.DB_PATH,
+            project["id"],
+            start_dt.date().isoformat(),
+            end_dt.date().isoformat(),
+            overrides,
+            shift_location,
+            mode,
+            improve_budget,
+            description=f"{project['name']}: {start_dt.date().isoformat()} - {end_dt.date().isoformat()}",
+        )
+        return _redirect(f"/admin/jobs/{job_id}")
+
     conn = get_connection()
     try:
         cur = conn.cursor()
@@ -970,30 +1353,722 @@ def project_generate_submit(
             context["error"] = "אין עובדים פעילים זמינים לשיבוץ"
             return templates.TemplateResponse("admin_project_generate.html", context)
 
-        schedule_result = _generate_schedule_for_project(
+        if preview:
+            # תצוגה מקדימה – מחשבים את כל הסידור בזיכרון בלי לכתוב למסד הנתונים
+            date_list = _date_range(start_dt, end_dt)
+            state = _build_generation_state(cur, employees, constraints_map, date_list)
+            plan = _plan_schedule_for_project(
+                project, overrides, date_list, state, mode=mode, improve_seconds=improve_budget
+            )
+            schedule_result = {
+                "assignments_created": plan["assignments"],
+                "total_assignments": len(plan["assignments"]),
+                "shifts_created": len({(row["date"], row["shift_key"]) for row in plan["assignments"]}),
+                "warnings": plan["warnings"],
+                "coverage": plan["coverage"],
+                "improvement": plan["improvement"],
+            }
+        else:
+            schedule_result = _generate_schedule_for_project(
+                cur,
+                project,
+                employees,
+                constraints_map,
+                start_dt,
+                end_dt,
+                overrides,
+                shift_location,
+                mode=mode,
+                improve_seconds=improve_budget,
+                write_plan=_write_schedule_plan,
+            )
+    except ArchivedDateError as exc:
+        context["error"] = str(exc)
+        return templates.TemplateResponse("admin_project_generate.html", context)
+    finally:
+        conn.close()
+
+    context["schedule_result"] = schedule_result
+    context["generated_range"] = {
+        "start": start_dt.date().isoformat(),
+        "end": end_dt.date().isoformat(),
+    }
+    context["overrides"] = overrides
+    context["warnings"] = schedule_result.get("warnings", [])
+    if preview:
+        context["preview"] = {
+            "location": shift_location,
+            "plan_json": json.dumps(
+                [
+                    [row["date"], row["shift_key"], row["employee_id"]]
+                    for row in schedule_result["assignments_created"]
+                ]
+            ),
+        }
+        context["message"] = f"תצוגה מקדימה: {schedule_result['total_assignments']} שיוכים (לא נשמרו)"
+    else:
+        context["message"] = f"נוצרו {schedule_result['total_assignments']} שיוכים חדשים"
+
+    return templates.TemplateResponse("admin_project_generate.html", context)
+
+
+def _archived_range_error(conn, start_dt: datetime) -> Optional[str]:
+    """Hebrew error when a generation range starts in archived months (see ``check_writable``)."""
+    try:
+        check_writable(conn, start_dt.date().isoformat())
+    except ArchivedDateError as exc:
+        return str(exc)
+    return None
+
+
+def _validate_plan_rows(cur, raw_rows, employees, constraints_map: Dict[int, List[Dict]]) -> tuple:
+    """
+    Re-check a previewed plan against the current database before it is committed:
+    the generation state is rebuilt for the plan's dates, and rows that the
+    employee's constraints, an existing booking or the rest/hours limits no longer
+    allow are dropped with a warning.
+    """
+    names = {row["id"]: row["name"] for row in employees}
+    horizon = archive_horizon(cur.connection)
+    candidates: List[Dict[str, Any]] = []
+    warnings: List[str] = []
+    for raw in raw_rows if isinstance(raw_rows, list) else []:
+        try:
+            date_str, shift_key, employee_id = str(raw[0]), str(raw[1]), int(raw[2])
+            datetime.strptime(date_str, "%Y-%m-%d")
+        except (TypeError, ValueError, IndexError):
+            warnings.append(f"שורה לא תקינה בתוכנית: {raw}")
+            continue
+        if shift_key not in SHIFT_TEMPLATES:
+            warnings.append(f"משמרת לא מוכרת בתוכנית: {shift_key}")
+            continue
+        if employee_id not in names:
+            warnings.append(f"עובד {employee_id} אינו פעיל – השיוך בתאריך {date_str} דולג")
+            continue
+        if horizon and date_str < horizon:
+            warnings.append(f"התאריך {date_str} כבר הועבר לארכיון – השיוך דולג")
+            continue
+        candidates.append({"date": date_str, "shift_key": shift_key, "employee_id": employee_id})
+
+    assignments: List[Dict[str, Any]] = []
+    if not candidates:
+        return assignments, warnings
+
+    date_list = sorted({row["date"] for row in candidates})
+    state = _build_generation_state(cur, employees, constraints_map, date_list)
+    for row in candidates:
+        employee_id, date_str, shift_key = row["employee_id"], row["date"], row["shift_key"]
+        template = SHIFT_TEMPLATES[shift_key]
+        name = names[employee_id]
+        if state.working_by_date[date_str] & state.availability.bit(employee_id):
+            warnings.append(f"{name} כבר משובץ/ת בתאריך {date_str} – השיוך ל{template['label']} דולג")
+            continue
+        if not state.availability.allows(employee_id, date_str, shift_key):
+            warnings.append(f"האילוצים של {name} אינם מאפשרים {template['label']} בתאריך {date_str} – השיוך דולג")
+            continue
+        if not state.allows_work(employee_id, date_str, shift_key):
+            warnings.append(
+                f"{name} חורג/ת ממגבלת המנוחה או השעות ב{template['label']} בתאריך {date_str} – השיוך דולג"
+            )
+            continue
+        state.record_assignment(employee_id, date_str, shift_key)
+        assignments.append(
+            {
+                **row,
+                "shift": template["label"],
+                "employee": names[row["employee_id"]],
+                "hours": calculate_shift_hours(row["date"], template["start"], template["end"]),
+            }
+        )
+    return assignments, warnings
+
+
+@router.post("/projects/{project_id}/generate/commit", response_class=HTMLResponse)
+def project_generate_commit(
+    project_id: int,
+    request: Request,
+    plan_json: str = Form(...),
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    location: str = Form(default=""),
+):
+    if (redirect := _require_admin(request)):
+        return redirect
+    project = _fetch_project_record(project_id)
+    if not project:
+        return _redirect("/admin/projects", error="הפרויקט לא נמצא")
+
+    context = _build_generation_context(request, project, {"schedule_result": None, "warnings": []})
+    context.setdefault("overrides", context["requirements"])
+    try:
+        raw_rows = json.loads(plan_json)
+    except json.JSONDecodeError:
+        context["error"] = "תוכנית השיבוץ אינה תקינה"
+        return templates.TemplateResponse("admin_project_generate.html", context)
+
+    shift_location = location.strip() or project["name"]
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        employees, constraints_map = _load_active_employees_with_constraints(cur)
+        assignments, warnings = _validate_plan_rows(cur, raw_rows, employees, constraints_map)
+    finally:
+        conn.close()
+    try:
+        persisted = _write_schedule_plan(project["id"], shift_location, assignments)
+    except ArchivedDateError as exc:
+        context["error"] = str(exc)
+        return templates.TemplateResponse("admin_project_generate.html", context)
+
+    context["schedule_result"] = {
+        "assignments_created": assignments,
+        "total_assignments": persisted["assignments"],
+        "shifts_created": persisted["shifts"],
+        "warnings": warnings,
+    }
+    context["generated_range"] = {"start": start_date, "end": end_date}
+    context["warnings"] = warnings
+    context["message"] = f"נוצרו {persisted['assignments']} שיוכים חדשים"
+    return templates.TemplateResponse("admin_project_generate.html", context)
+
+
+def _fetch_projects_by_ids(cur, project_ids: List[int]):
+    if not project_ids:
+        return []
+    return queries.fetch_all(cur, "projects_by_ids", (queries.id_list(project_ids),))
+
+
+def _project_requirements(project) -> Dict[str, int]:
+    return {
+        "morning": project["morning_required"] or 0,
+        "afternoon": project["afternoon_required"] or 0,
+        "night": project["night_required"] or 0,
+    }
+
+
+class _PlanExecutors:
+    """
+    Long-lived process pools for parallel batch planning, one per worker count.
+
+    Created on first use and kept across requests, so a batch does not pay for
+    starting (and importing the app in) fresh processes. A pool inherited through
+    ``fork`` belongs to the parent and is never used by the child; a broken pool
+    (a worker died) is dropped and recreated on the next batch.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._executors: Dict[int, ProcessPoolExecutor] = {}
+
+    def get(self, workers: int) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executors = {}
+            executor = self._executors.get(workers)
+            if executor is None:
+                executor = self._executors[workers] = ProcessPoolExecutor(max_workers=workers)
+            return executor
+
+    def discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            for workers, current in list(self._executors.items()):
+                if current is executor:
+                    del self._executors[workers]
+        executor.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executors = list(self._executors.values()) if self._pid == os.getpid() else []
+            self._executors = {}
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+
+plan_executors = _PlanExecutors()
+
+
+def _plan_projects_worker(
+    state_blob: bytes, date_list: List[str], mode: str, jobs: List[Tuple[Dict[str, Any], List[int]]]
+) -> List[Dict[str, Any]]:
+    """
+    Process-pool entry point: plan each ``(project, shard)`` against a private copy of
+    the shared state. The project's ``shard`` of employees is served first at their
+    real loads; everyone else only fills the slots the shard cannot.
+    """
+    plans = []
+    for project, shard in jobs:
+        state = pickle.loads(state_blob)
+        state.candidates.prefer(shard)
+        preferred = 0
+        for employee_id in shard:
+            preferred |= state.availability.bit(employee_id)
+        plans.append(
+            _plan_schedule_for_project(
+                project, _project_requirements(project), date_list, state, mode=mode, preferred=preferred
+            )
+        )
+    return plans
+
+
+def _employee_shards(employee_ids: List[int], projects: List[Dict[str, Any]]) -> List[List[int]]:
+    """Split employees into consecutive slices sized by each project's daily demand."""
+    demands = [sum(_project_requirements(project).values()) for project in projects]
+    total_demand = sum(demands) or 1
+    shards: List[List[int]] = []
+    start = 0
+    cumulative = 0
+    for demand in demands:
+        cumulative += demand
+        end = round(len(employee_ids) * cumulative / total_demand)
+        shards.append(employee_ids[start:end])
+        start = end
+    return shards
+
+
+def _reconcile_project_plans(plans: List[Dict[str, Any]], state: GenerationState) -> int:
+    """
+    Merge independently planned projects into ``state`` in list order.
+
+    Every plan was made against the same starting state, so two projects may book
+    the same employee on one date. The first project in order keeps the employee;
+    later ones get a replacement from the shared candidate queue, or a shortfall
+    warning when nobody is left. A booking that only breaks the rest/hours limits
+    once merged is handled the same way. Returns the number of conflicting slots.
+    """
+    availability = state.availability
+    positions = availability.positions
+    conflicts = 0
+    for plan in plans:
+        kept: List[Dict[str, Any]] = []
+        for row in plan["assignments"]:
+            date_str = row["date"]
+            employee_id = row["employee_id"]
+            shift_key = normalize_shift_key(row["shift_key"])
+            if not state.working_by_date[date_str] >> positions[employee_id] & 1 and state.allows_work(
+                employee_id, date_str, shift_key
+            ):
+                state.record_assignment(employee_id, date_str, shift_key)
+                kept.append(row)
+                continue
+
+            conflicts += 1
+            eligible = availability.mask(date_str, shift_key) & ~state.working_by_date[date_str]
+            replacement = None
+            if eligible:
+                replacement = state.candidates.select(
+                    shift_key,
+                    lambda candidate: eligible >> positions[candidate] & 1
+                    and state.allows_work(candidate, date_str, shift_key),
+                )
+            if replacement is None:
+                plan["warnings"].append(
+                    f"לא נמצא עובד זמין למשמרת {row['shift']} בתאריך {date_str}"
+                )
+                plan["coverage"]["by_shift"][row["shift_key"]]["filled"] -= 1
+                continue
+            state.record_assignment(replacement, date_str, shift_key)
+            kept.append(dict(row, employee_id=replacement, employee=state.names[replacement]))
+
+        plan["assignments"] = kept
+        coverage = plan["coverage"]
+        coverage["filled"] = len(kept)
+        coverage["percent"] = (
+            round(100.0 * len(kept) / coverage["required"], 1) if coverage["required"] else 100.0
+        )
+    return conflicts
+
+
+def _generate_schedule_parallel(
+    cur,
+    projects,
+    employees,
+    constraints_map,
+    start_date: datetime,
+    end_date: datetime,
+    mode: str = "greedy",
+    workers: int = BATCH_GENERATION_WORKERS,
+    write_plans: Optional[Callable[..., List[Dict[str, int]]]] = None,
+) -> Dict[str, Any]:
+    """
+    Plan every project in its own worker process, reconcile the plans deterministically
+    and persist them in the caller's single transaction.
+
+    Constraints are compiled once into a GenerationState; the projects are dealt
+    round-robin into one chunk per worker of the long-lived ``plan_executors`` pool,
+    so the pickled state crosses to each worker once per batch. Workers do not see
+    each other's assignments, so each project is served first by its own
+    demand-weighted slice of the employees; that keeps cross-project conflicts (and
+    the serial reconciliation) small when there is enough staff.
+    """
+    date_list = _date_range(start_date, end_date)
+    employees = [dict(row) for row in employees]
+    projects = [dict(row) for row in projects]
+    state = _build_generation_state(cur, employees, constraints_map, date_list)
+    state_blob = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    shards = _employee_shards(state.employee_ids, projects)
+    workers = max(1, min(workers, len(projects)))
+    chunks = [list(range(index, len(projects), workers)) for index in range(workers)]
+    executor = plan_executors.get(workers)
+    try:
+        futures = [
+            executor.submit(
+                _plan_projects_worker,
+                state_blob,
+                date_list,
+                mode,
+                [(projects[index], shards[index]) for index in chunk],
+            )
+            for chunk in chunks
+        ]
+        plans: List[Dict[str, Any]] = [{} for _ in projects]
+        for chunk, future in zip(chunks, futures):
+            for index, plan in zip(chunk, future.result()):
+                plans[index] = plan
+    except BrokenProcessPool:
+        plan_executors.discard(executor)
+        raise
+
+    conflicts = _reconcile_project_plans(plans, state)
+    return _persist_batch(cur, projects, plans, conflicts, write_plans)
+
+
+def _persist_batch(
+    cur,
+    projects,
+    plans: List[Dict[str, Any]],
+    conflicts: int,
+    write_plans: Optional[Callable[..., List[Dict[str, int]]]],
+) -> Dict[str, Any]:
+    """Persist every project's plan in one transaction and build the batch result."""
+    items = [(project["id"], project["name"], plan["assignments"]) for project, plan in zip(projects, plans)]
+    if write_plans is None:
+        persisted_all = _persist_schedule_plans(cur, items)
+    else:
+        persisted_all = write_plans(items)
+
+    project_results: List[Dict[str, Any]] = []
+    for project, plan, persisted in zip(projects, plans, persisted_all):
+        project_results.append(
+            {
+                "assignments_created": plan["assignments"],
+                "total_assignments": persisted["assignments"],
+                "shifts_created": persisted["shifts"],
+                "warnings": plan["warnings"],
+                "coverage": plan["coverage"],
+                "improvement": plan["improvement"],
+                "project": project,
+                "requirements": _project_requirements(project),
+            }
+        )
+
+    return {
+        "projects": project_results,
+        "total_assignments": sum(item["total_assignments"] for item in project_results),
+        "shifts_created": sum(item["shifts_created"] for item in project_results),
+        "warnings_count": sum(len(item["warnings"]) for item in project_results),
+        "conflicts_resolved": conflicts,
+    }
+
+
+def _generate_schedule_batch(
+    cur,
+    projects,
+    employees,
+    constraints_map,
+    start_date: datetime,
+    end_date: datetime,
+    mode: str = "greedy",
+    workers: int = 1,
+    write_plans: Optional[Callable[..., List[Dict[str, int]]]] = None,
+) -> Dict[str, Any]:
+    """
+    Generate several projects over one range with a single shared GenerationState.
+    With ``workers > 1`` the projects are planned in parallel processes instead.
+    Every plan is made first and then all of them are persisted together, on ``cur``
+    by default or through ``write_plans([(project_id, location, assignments), ...])``.
+    """
+    if workers > 1 and len(projects) > 1:
+        return _generate_schedule_parallel(
+            cur, projects, employees, constraints_map, start_date, end_date, mode=mode, workers=workers,
+            write_plans=write_plans,
+        )
+
+    date_list = _date_range(start_date, end_date)
+    state = _build_generation_state(cur, employees, constraints_map, date_list)
+    plans = [
+        _plan_schedule_for_project(project, _project_requirements(project), date_list, state, mode=mode)
+        for project in projects
+    ]
+    return _persist_batch(cur, projects, plans, 0, write_plans)
+
+
+def _batch_generation_context(request: Request, cur, extra: Optional[Dict] = None) -> Dict:
+    context = {
+        "request": request,
+        "projects": queries.fetch_all(cur, "active_project_requirements"),
+        "generation_modes": GENERATION_MODES,
+        "selected_ids": [],
+        "mode": "greedy",
+        "parallel": True,
+        "batch_result": None,
+    }
+    if extra:
+        context.update(extra)
+    return context
+
+
+@router.get("/projects/batch-generate", response_class=HTMLResponse)
+def project_batch_generate_form(request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    conn = get_connection()
+    try:
+        context = _batch_generation_context(request, conn.cursor())
+    finally:
+        conn.close()
+    return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+
+@router.post("/projects/batch-generate", response_class=HTMLResponse)
+def project_batch_generate_submit(
+    request: Request,
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    project: List[str] = Form(default=[]),
+    mode: str = Form(default="greedy"),
+    parallel: str = Form(default=""),
+):
+    if (redirect := _require_admin(request)):
+        return redirect
+
+    selected_ids: List[int] = []
+    for value in project:
+        try:
+            selected_ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    mode = (mode or "").strip().lower() or "greedy"
+
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        context = _batch_generation_context(
+            request, cur, {"selected_ids": selected_ids, "mode": mode, "parallel": bool(parallel)}
+        )
+
+        try:
+            start_dt = datetime.strptime(start_date.strip(), "%Y-%m-%d")
+            end_dt = datetime.strptime(end_date.strip(), "%Y-%m-%d")
+        except ValueError:
+            context["error"] = "תאריכים אינם בתוקף"
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        if end_dt < start_dt:
+            context["error"] = "תאריך הסיום חייב להיות אחרי תאריך ההתחלה"
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        archived_error = _archived_range_error(conn, start_dt)
+        if archived_error:
+            context["error"] = archived_error
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        if mode not in GENERATION_MODES:
+            context["error"] = "מצב הפקה לא מוכר"
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        projects = _fetch_projects_by_ids(cur, selected_ids)
+        if not projects:
+            context["error"] = "יש לבחור לפחות פרויקט אחד"
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        employees, constraints_map = _load_active_employees_with_constraints(cur)
+        if not employees:
+            context["error"] = "אין עובדים פעילים זמינים לשיבוץ"
+            return templates.TemplateResponse("admin_project_batch_generate.html", context)
+
+        batch_result = _generate_schedule_batch(
             cur,
-            project,
+            projects,
             employees,
             constraints_map,
             start_dt,
             end_dt,
-            overrides,
-            location.strip() or project["name"],
+            mode=mode,
+            workers=BATCH_GENERATION_WORKERS if parallel else 1,
+            write_plans=_write_schedule_plans,
         )
-        conn.commit()
+    except ArchivedDateError as exc:
+        context["error"] = str(exc)
+        return templates.TemplateResponse("admin_project_batch_generate.html", context)
     finally:
         conn.close()
 
-    context["schedule_result"] = schedule_result
+    context["batch_result"] = batch_result
     context["generated_range"] = {
         "start": start_dt.date().isoformat(),
         "end": end_dt.date().isoformat(),
     }
-    context["overrides"] = overrides
-    context["message"] = f"נוצרו {schedule_result['total_assignments']} שיוכים חדשים"
-    context["warnings"] = schedule_result.get("warnings", [])
+    context["message"] = (
+        f"נוצרו {batch_result['total_assignments']} שיוכים חדשים ב-{len(batch_result['projects'])} פרויקטים"
+    )
+    return templates.TemplateResponse("admin_project_batch_generate.html", context)
 
-    return templates.TemplateResponse("admin_project_generate.html", context)
+
+@router.post("/schedule/repair")
+def repair_schedule(
+    request: Request,
+    employee_id: int = Form(...),
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+):
+    if (redirect := _require_admin(request)):
+        return redirect
+    try:
+        start_dt = datetime.strptime(start_date.strip(), "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date.strip(), "%Y-%m-%d")
+    except ValueError:
+        return JSONResponse({"error": "תאריכים אינם בתוקף"}, status_code=status.HTTP_400_BAD_REQUEST)
+    if end_dt < start_dt:
+        return JSONResponse(
+            {"error": "תאריך הסיום חייב להיות אחרי תאריך ההתחלה"},
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    conn = get_connection()
+    try:
+        archived_error = _archived_range_error(conn, start_dt)
+        if archived_error:
+            return JSONResponse({"error": archived_error}, status_code=status.HTTP_400_BAD_REQUEST)
+        diff = _plan_employee_repair(conn.cursor(), employee_id, start_dt, end_dt)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=status.HTTP_404_NOT_FOUND)
+    finally:
+        conn.close()
+    try:
+        diff = db.write(_apply_employee_repair, diff)
+    except (RepairConflict, ArchivedDateError) as exc:
+        return JSONResponse({"error": str(exc)}, status_code=status.HTTP_409_CONFLICT)
+    return JSONResponse(diff)
+
+
+@router.get("/projects/{project_id}/conflicts")
+def project_conflicts(request: Request, project_id: int, start_date: str, end_date: str):
+    if (redirect := _require_admin(request)):
+        return redirect
+    project = _fetch_project_record(project_id)
+    if not project:
+        return JSONResponse({"error": "הפרויקט לא נמצא"}, status_code=status.HTTP_404_NOT_FOUND)
+    try:
+        date_list = _heatmap_range(start_date, end_date)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+    conn = get_connection()
+    try:
+        analysis = _analyze_uncovered_slots(conn.cursor(), project, date_list)
+    finally:
+        conn.close()
+    return JSONResponse(analysis)
+
+
+@router.get("/projects/{project_id}/heatmap", response_class=HTMLResponse)
+def project_heatmap_page(request: Request, project_id: int, start_date: str = "", end_date: str = ""):
+    if (redirect := _require_admin(request)):
+        return redirect
+    project = _fetch_project_record(project_id)
+    if not project:
+        return _redirect("/admin/projects", error="הפרויקט לא נמצא")
+    context: Dict[str, Any] = {
+        "request": request,
+        "project": project,
+        "heatmap": None,
+        "heatmap_range": None,
+        "error": None,
+    }
+    try:
+        date_list = _heatmap_range(start_date, end_date)
+    except ValueError as exc:
+        context["error"] = str(exc)
+        return templates.TemplateResponse("admin_project_heatmap.html", context)
+
+    conn = get_connection()
+    try:
+        context["heatmap"] = _availability_heatmap(conn.cursor(), project, date_list)
+    finally:
+        conn.close()
+    context["heatmap_range"] = {"start": date_list[0], "end": date_list[-1]}
+    return templates.TemplateResponse("admin_project_heatmap.html", context)
+
+
+@router.get("/projects/{project_id}/heatmap.json")
+def project_heatmap_data(request: Request, project_id: int, start_date: str = "", end_date: str = ""):
+    if (redirect := _require_admin(request)):
+        return redirect
+    project = _fetch_project_record(project_id)
+    if not project:
+        return JSONResponse({"error": "הפרויקט לא נמצא"}, status_code=status.HTTP_404_NOT_FOUND)
+    try:
+        date_list = _heatmap_range(start_date, end_date)
+    except ValueError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=status.HTTP_400_BAD_REQUEST)
+
+    conn = get_connection()
+    try:
+        heatmap = _availability_heatmap(conn.cursor(), project, date_list)
+    finally:
+        conn.close()
+    return JSONResponse(heatmap)
+
+
+@router.get("/db/stats")
+def database_stats(request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    return JSONResponse(
+        {
+            "pool": get_pool().stats(),
+            "writer": db.get_writer().stats(),
+            "workloads": db_executors.stats(),
+            "constraint_profiles": profile_cache.stats(),
+            "queries": queries.query_timings.stats(),
+        }
+    )
+
+
+@router.get("/jobs/{job_id}", response_class=HTMLResponse)
+def generation_job_page(job_id: str, request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    job = generation_jobs.status(job_id)
+    if job is None:
+        return _redirect("/admin/projects", error="המשימה לא נמצאה")
+    return templates.TemplateResponse(
+        "admin_generation_job.html",
+        {"request": request, "job": job},
+    )
+
+
+@router.get("/jobs/{job_id}/status")
+def generation_job_status(job_id: str, request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    job = generation_jobs.status(job_id)
+    if job is None:
+        return JSONResponse({"error": "המשימה לא נמצאה"}, status_code=status.HTTP_404_NOT_FOUND)
+    return JSONResponse(job)
+
+
+@router.post("/jobs/{job_id}/cancel")
+def generation_job_cancel(job_id: str, request: Request):
+    if (redirect := _require_admin(request)):
+        return redirect
+    if generation_jobs.status(job_id) is None:
+        return _redirect("/admin/projects", error="המשימה לא נמצאה")
+    generation_jobs.cancel(job_id)
+    return _redirect(f"/admin/jobs/{job_id}")
 
 
 @router.get("/projects/{project_id}/schedule.ics")
@@ -1017,27 +2092,11 @@ def project_schedule_calendar(
 
     conn = get_connection()
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                s.date,
-                s.start_time,
-                s.end_time,
-                IFNULL(s.location, '') AS location,
-                e.name AS employee_name,
-                p.name AS project_name
-            FROM shifts s
-            INNER JOIN projects p ON p.id = s.project_id
-            LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            LEFT JOIN employees e ON e.id = sa.employee_id
-            WHERE s.project_id = ?
-              AND s.date BETWEEN ? AND ?
-            ORDER BY s.date ASC, s.start_time ASC, e.name ASC
-            """,
-            (project_id, start_dt.isoformat(), end_dt.isoformat()),
-        )
-        rows = cur.fetchall()
+        params = (project_id, start_dt.isoformat(), end_dt.isoformat())
+        with shift_tables(conn, start_dt.isoformat(), end_dt.isoformat()) as (shifts, assignments):
+            rows = queries.fetch_all(
+                conn.cursor(), "project_calendar_rows", params, shifts=shifts, assignments=assignments
+            )
     finally:
         conn.close()
 
@@ -1076,12 +2135,17 @@ def project_schedule_calendar(
 
 
 @router.get("/reports", response_class=HTMLResponse)
-def admin_reports(
+async def admin_reports(
     request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
 ):
-    data = build_admin_report_data(request, start_date, end_date, request.query_params.getlist("project"))
+    if (redirect := _require_admin(request)):
+        return redirect
+    data = await run_db(
+        "reports",
+        lambda conn: build_admin_report_data(request, conn, start_date, end_date, request.query_params.getlist("project")),
+    )
     if isinstance(data, RedirectResponse):
         return data
     context = {"request": request}
@@ -1089,52 +2153,11 @@ def admin_reports(
     return templates.TemplateResponse("admin_reports.html", context)
 
 
-@router.get("/overview", response_class=HTMLResponse)
-def business_overview(
-    request: Request,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-):
-    if (redirect := _require_admin(request)):
-        return redirect
-    start_date = (start_date or "").strip() or None
-    end_date = (end_date or "").strip() or None
-
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT
-                s.id AS shift_id,
-                s.date,
-                s.start_time,
-                s.end_time,
-                s.location,
-                p.id AS project_id,
-                p.name AS project_name,
-                p.hourly_rate,
-                p.active AS project_active,
-                sa.employee_id,
-                e.name AS employee_name
-            FROM shifts s
-            LEFT JOIN projects p ON p.id = s.project_id
-            LEFT JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            LEFT JOIN employees e ON e.id = sa.employee_id
-            WHERE 1=1
-        """
-        params: List[Optional[str]] = []
-        if start_date:
-            query += " AND s.date >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND s.date <= ?"
-            params.append(end_date)
-
-        query += " ORDER BY s.date ASC, s.start_time ASC"
-        cur.execute(query, params)
-        rows = cur.fetchall()
-    finally:
-        conn.close()
+def _build_business_overview(conn: sqlite3.Connection, start_date: Optional[str], end_date: Optional[str]) -> Dict:
+    cur = conn.cursor()
+    params = (start_date or queries.DATE_MIN, end_date or queries.DATE_MAX)
+    with shift_tables(conn, start_date, end_date) as (shifts, assignments):
+        rows = queries.fetch_all(cur, "business_overview_rows", params, shifts=shifts, assignments=assignments)
 
     shift_hours: Dict[int, float] = {}
     project_metrics: Dict[int, Dict[str, float]] = {}
@@ -1225,17 +2248,29 @@ def business_overview(
         reverse=True,
     )
 
-    return templates.TemplateResponse(
-        "admin_overview.html",
-        {
-            "request": request,
-            "start_date": start_date or "",
-            "end_date": end_date or "",
-            "total_shifts": total_shifts,
-            "covered_shifts": covered_shifts,
-            "total_person_hours": round(total_person_hours, 2),
-            "total_payout": round(total_payout, 2),
-            "project_overview": project_overview,
-            "employee_overview": employee_overview,
-        },
-    )
+    return {
+        "start_date": start_date or "",
+        "end_date": end_date or "",
+        "total_shifts": total_shifts,
+        "covered_shifts": covered_shifts,
+        "total_person_hours": round(total_person_hours, 2),
+        "total_payout": round(total_payout, 2),
+        "project_overview": project_overview,
+        "employee_overview": employee_overview,
+    }
+
+
+@router.get("/overview", response_class=HTMLResponse)
+async def business_overview(
+    request: Request,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    if (redirect := _require_admin(request)):
+        return redirect
+    start_date = (start_date or "").strip() or None
+    end_date = (end_date or "").strip() or None
+
+    context = {"request": request}
+    context.update(await run_db("reports", _build_business_overview, start_date, end_date))
+    return templates.TemplateResponse("admin_overview.html", context)
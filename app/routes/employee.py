@@ -1,31 +1,34 @@
+import csv
 import hashlib
+import io
 import json
-from typing import Dict, List, Optional
+import sqlite3
+import time
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urlencode
 
-from fastapi import APIRouter, Form, HTTPException, Request
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from starlette import status
 
-from app.db import get_connection
-from app.utils import calculate_shift_hours
+from app import db, queries
+from app.archive import shift_tables
+from app.constraint_cache import profile_cache
+from app.db import get_connection, run_db
+from app.utils import calculate_shift_hours, compile_constraint, date_ordinal
 from app.routes.admin import build_admin_report_data
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
+# כמה משמרות אחרונות מוצגות לעובד בפורטל
+PORTAL_RECENT_SHIFTS = 50
+
 
 def _fetch_employee(cur, employee_id: int) -> Dict:
-    cur.execute(
-        """
-        SELECT id, name, email, phone, active
-        FROM employees
-        WHERE id = ?
-        """,
-        (employee_id,),
-    )
-    employee = cur.fetchone()
+    employee = queries.fetch_one(cur, "employee_by_id", (employee_id,))
     if employee is None:
         raise HTTPException(status_code=404, detail="העובד לא נמצא")
     return employee
@@ -48,29 +51,16 @@ def _create_shift_assignment(
 
     project_id = None
     if project_name:
-        cur.execute("SELECT id FROM projects WHERE name = ?", (project_name,))
-        row = cur.fetchone()
+        row = queries.fetch_one(cur, "project_id_by_name", (project_name,))
         if row:
             project_id = row["id"]
         else:
-            cur.execute("INSERT INTO projects (name) VALUES (?)", (project_name,))
-            project_id = cur.lastrowid
-
-    cur.execute(
-        """
-        INSERT INTO shifts (project_id, date, start_time, end_time, location)
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (project_id, date, start_time, end_time, location),
-    )
-    shift_id = cur.lastrowid
-    cur.execute(
-        """
-        INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id)
-        VALUES (?, ?)
-        """,
-        (shift_id, employee_id),
-    )
+            project_id = queries.execute(cur, "project_insert_name", (project_name,)).lastrowid
+
+    shift_id = queries.execute(
+        cur, "shift_insert", (project_id, date, start_time, end_time, location)
+    ).lastrowid
+    queries.execute(cur, "shift_assignment_insert", (shift_id, employee_id))
     return shift_id
 
 
@@ -108,41 +98,18 @@ def _require_login(request: Request, admin: bool = False) -> Optional[RedirectRe
     return None
 
 
-def _build_employee_report(employee_id: int, start_date: Optional[str], end_date: Optional[str]) -> Dict:
+def _build_employee_report(
+    conn: sqlite3.Connection, employee_id: int, start_date: Optional[str], end_date: Optional[str]
+) -> Dict:
     start_date = (start_date or "").strip() or None
     end_date = (end_date or "").strip() or None
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        employee = _fetch_employee(cur, employee_id)
+    cur = conn.cursor()
+    employee = _fetch_employee(cur, employee_id)
 
-        query = """
-            SELECT
-                s.date,
-                s.start_time,
-                s.end_time,
-                s.location,
-                COALESCE(p.name, 'לא הוגדר פרויקט') AS project,
-                COALESCE(p.hourly_rate, 0) AS hourly_rate
-            FROM shifts s
-            INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            LEFT JOIN projects p ON p.id = s.project_id
-            WHERE sa.employee_id = ?
-        """
-        params: List[Optional[str]] = [employee_id]
-        if start_date:
-            query += " AND s.date >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND s.date <= ?"
-            params.append(end_date)
-
-        query += " ORDER BY s.date ASC, s.start_time ASC"
-        cur.execute(query, params)
-        rows = cur.fetchall()
-    finally:
-        conn.close()
+    params = (employee_id, start_date or queries.DATE_MIN, end_date or queries.DATE_MAX)
+    with shift_tables(conn, start_date, end_date) as (shifts, assignments):
+        rows = queries.fetch_all(cur, "employee_report_rows", params, shifts=shifts, assignments=assignments)
 
     report_rows: List[Dict] = []
     total_hours = 0.0
@@ -207,23 +174,7 @@ def employee_index(request: Request):
         return redirect
     conn = get_connection()
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT
-                e.id,
-                e.name,
-                e.email,
-                e.phone,
-                e.active,
-                COUNT(sa.shift_id) AS assigned_shifts
-            FROM employees e
-            LEFT JOIN ShiftAssignments sa ON sa.employee_id = e.id
-            GROUP BY e.id
-            ORDER BY e.active DESC, e.name
-            """
-        )
-        employees = cur.fetchall()
+        employees = queries.fetch_all(conn.cursor(), "employee_list")
     finally:
         conn.close()
 
@@ -244,15 +195,7 @@ def employee_profile(employee_id: int, request: Request):
     try:
         cur = conn.cursor()
         employee = _fetch_employee(cur, employee_id)
-        cur.execute(
-            """
-            SELECT COUNT(*) AS total
-            FROM ShiftAssignments
-            WHERE employee_id = ?
-            """,
-            (employee_id,),
-        )
-        assignment_summary = cur.fetchone()
+        assignment_summary = queries.fetch_one(cur, "employee_assignment_count", (employee_id,))
     finally:
         conn.close()
 
@@ -274,26 +217,8 @@ def employee_schedule(employee_id: int, request: Request):
     try:
         cur = conn.cursor()
         employee = _fetch_employee(cur, employee_id)
-        cur.execute(
-            """
-            SELECT
-                s.id,
-                s.date,
-                s.start_time,
-                s.end_time,
-                s.location,
-                COALESCE(p.name, 'לא הוגדר פרויקט') AS project
-            FROM shifts s
-            INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            LEFT JOIN projects p ON p.id = s.project_id
-            WHERE sa.employee_id = ?
-            ORDER BY s.date, s.start_time
-            """,
-            (employee_id,),
-        )
-        shifts = cur.fetchall()
-        cur.execute("SELECT name FROM projects ORDER BY name")
-        projects = [row["name"] for row in cur.fetchall()]
+        shifts = queries.fetch_all(cur, "employee_shifts", (employee_id,))
+        projects = [row["name"] for row in queries.fetch_all(cur, "project_names")]
     finally:
         conn.close()
 
@@ -334,29 +259,25 @@ def add_employee_shift(
             error="נא למלא מיקום, תאריך ושעות ההתחלה/סיום",
         )
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
+    def add_shift(cur) -> int:
         _fetch_employee(cur, employee_id)
+        return _create_shift_assignment(
+            cur,
+            employee_id=employee_id,
+            project_name=project_name,
+            location=location,
+            date=date,
+            start_time=start_time,
+            end_time=end_time,
+        )
 
-        try:
-            _create_shift_assignment(
-                cur,
-                employee_id=employee_id,
-                project_name=project_name,
-                location=location,
-                date=date,
-                start_time=start_time,
-                end_time=end_time,
-            )
-        except ValueError as exc:
-            return _redirect(
-                f"/employees/{employee_id}/schedule",
-                error=str(exc),
-            )
-        conn.commit()
-    finally:
-        conn.close()
+    try:
+        db.write(add_shift)
+    except ValueError as exc:
+        return _redirect(
+            f"/employees/{employee_id}/schedule",
+            error=str(exc),
+        )
 
     return _redirect(
         f"/employees/{employee_id}/schedule",
@@ -403,16 +324,7 @@ def employee_portal_login_submit(
 
     conn = get_connection()
     try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT id, name, password_hash, is_admin, active
-            FROM employees
-            WHERE LOWER(email) = ?
-            """,
-            (email_normalized,),
-        )
-        employee = cur.fetchone()
+        employee = queries.fetch_one(conn.cursor(), "employee_login", (email_normalized,))
     finally:
         conn.close()
 
@@ -472,27 +384,8 @@ def employee_portal_shifts(request: Request):
     try:
         cur = conn.cursor()
         employee = _fetch_employee(cur, employee_id)
-        cur.execute(
-            """
-            SELECT
-                s.id,
-                s.date,
-                s.start_time,
-                s.end_time,
-                s.location,
-                COALESCE(p.name, 'לא הוגדר פרויקט') AS project
-            FROM shifts s
-            INNER JOIN ShiftAssignments sa ON sa.shift_id = s.id
-            LEFT JOIN projects p ON p.id = s.project_id
-            WHERE sa.employee_id = ?
-            ORDER BY s.date DESC, s.start_time DESC
-            LIMIT 50
-            """,
-            (employee_id,),
-        )
-        shifts = cur.fetchall()
-        cur.execute("SELECT name FROM projects ORDER BY name")
-        projects = [row["name"] for row in cur.fetchall()]
+        shifts = queries.fetch_all(cur, "employee_recent_shifts", (employee_id, PORTAL_RECENT_SHIFTS))
+        projects = [row["name"] for row in queries.fetch_all(cur, "project_names")]
     finally:
         conn.close()
 
@@ -534,28 +427,25 @@ def employee_portal_add_shift(
             error="נא למלא מיקום, תאריך ושעות התחלה/סיום",
         )
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
+    def add_shift(cur) -> int:
         _fetch_employee(cur, employee_id)
-        try:
-            _create_shift_assignment(
-                cur,
-                employee_id=employee_id,
-                project_name=project_name,
-                location=location,
-                date=date,
-                start_time=start_time,
-                end_time=end_time,
-            )
-        except ValueError as exc:
-            return _redirect(
-                "/portal/shifts",
-                error=str(exc),
-            )
-        conn.commit()
-    finally:
-        conn.close()
+        return _create_shift_assignment(
+            cur,
+            employee_id=employee_id,
+            project_name=project_name,
+            location=location,
+            date=date,
+            start_time=start_time,
+            end_time=end_time,
+        )
+
+    try:
+        db.write(add_shift)
+    except ValueError as exc:
+        return _redirect(
+            "/portal/shifts",
+            error=str(exc),
+        )
 
     return _redirect(
         "/portal/shifts",
@@ -601,24 +491,7 @@ def employee_availability(employee_id: int, request: Request):
     try:
         cur = conn.cursor()
         employee = _fetch_employee(cur, employee_id)
-        cur.execute(
-            """
-            SELECT
-                id,
-                kind,
-                scope,
-                value_json,
-                valid_from,
-                valid_to
-            FROM EmployeeConstraints
-            WHERE employee_id = ?
-            ORDER BY
-                COALESCE(valid_from, '') ASC,
-                id ASC
-            """,
-            (employee_id,),
-        )
-        constraints_rows = cur.fetchall()
+        constraints_rows = queries.fetch_all(cur, "employee_constraints", (employee_id,))
     finally:
         conn.close()
 
@@ -640,6 +513,59 @@ def employee_availability(employee_id: int, request: Request):
     )
 
 
+def _prepare_constraint(
+    kind: str,
+    scope: str,
+    value: str,
+    valid_from: Optional[str],
+    valid_to: Optional[str],
+) -> Tuple[str, str, str, str, Optional[str], Optional[str]]:
+    """
+    Validate and compile one constraint; returns the (kind, scope, value_json,
+    compiled_json, valid_from, valid_to) values to insert or raises ValueError.
+    """
+    kind = (kind or "").strip()
+    scope = (scope or "").strip()
+    value = (value or "").strip()
+    valid_from = (valid_from or "").strip() or None
+    valid_to = (valid_to or "").strip() or None
+
+    if not kind or not scope or not value:
+        raise ValueError("נא למלא את סוג ההגבלה, היקפה והערך")
+
+    try:
+        # ננסה לפרש כ-JSON לקבלת ערכים מורכבים, ואם לא – נשמור כמחרוזת
+        parsed_value = json.loads(value)
+    except json.JSONDecodeError:
+        parsed_value = value
+    value_json = json.dumps(parsed_value, ensure_ascii=False)
+
+    # מפרשים את ההגבלה פעם אחת בזמן הכתיבה; הגבלה שלא זוהתה לא תשפיע על השיבוץ
+    compiled = compile_constraint(kind, scope, value_json)
+    if len(compiled) == 1:
+        raise ValueError("לא ניתן לפרש את ההגבלה – בדקו את הסוג, ההיקף והערך")
+    for bound in (valid_from, valid_to):
+        if bound and date_ordinal(bound) is None:
+            raise ValueError("תאריכי התוקף חייבים להיות בפורמט YYYY-MM-DD")
+    if valid_from and valid_to and valid_from > valid_to:
+        raise ValueError("תאריך תחילת התוקף חייב להיות לפני תאריך הסיום")
+
+    return kind, scope, value_json, json.dumps(compiled, ensure_ascii=False), valid_from, valid_to
+
+
+_INSERT_CONSTRAINT_SQL = """
+    INSERT INTO EmployeeConstraints (
+        employee_id,
+        kind,
+        scope,
+        value_json,
+        compiled_json,
+        valid_from,
+        valid_to
+    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
 @router.post("/employees/{employee_id}/availability")
 def add_employee_constraint(
     request: Request,
@@ -652,58 +578,206 @@ def add_employee_constraint(
 ):
     if (redirect := _require_login(request, admin=True)):
         return redirect
-    kind = kind.strip()
-    scope = scope.strip()
-    value = value.strip()
-    valid_from = valid_from.strip() or None
-    valid_to = valid_to.strip() or None
+    try:
+        prepared = _prepare_constraint(kind, scope, value, valid_from, valid_to)
+    except ValueError as exc:
+        return _redirect(f"/employees/{employee_id}/availability", error=str(exc))
 
-    if not kind or not scope or not value:
-        return _redirect(
-            f"/employees/{employee_id}/availability",
-            error="נא למלא את סוג ההגבלה, היקפה והערך",
-        )
+    def add_constraint(cur) -> None:
+        _fetch_employee(cur, employee_id)
+        cur.execute(_INSERT_CONSTRAINT_SQL, (employee_id, *prepared))
+
+    db.write(add_constraint)
+    profile_cache.invalidate(employee_id)
+
+    return _redirect(
+        f"/employees/{employee_id}/availability",
+        message="העדפה נשמרה בהצלחה",
+    )
+
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 200
+_IMPORT_FIELDS = ("kind", "scope", "value", "valid_from", "valid_to")
+
+
+def _iter_import_records(upload: UploadFile) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Yield ``(line, record, error)`` for every row of a CSV, JSON-array or JSON-lines
+    upload. CSV and JSON lines are read line by line; a JSON array is loaded whole.
+    """
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    filename = (upload.filename or "").lower()
+    first_char = text.read(1)
+    text.seek(0)
+
+    if filename.endswith(".json") or (not filename.endswith((".csv", ".jsonl", ".ndjson")) and first_char == "["):
+        try:
+            items = json.load(text)
+        except json.JSONDecodeError as exc:
+            yield exc.lineno, None, "קובץ JSON לא תקין"
+            return
+        if not isinstance(items, list):
+            yield 1, None, "קובץ JSON חייב להכיל מערך של הגבלות"
+            return
+        for index, item in enumerate(items, start=1):
+            if isinstance(item, dict):
+                yield index, item, None
+            else:
+                yield index, None, "כל פריט חייב להיות אובייקט"
+    elif filename.endswith((".jsonl", ".ndjson")) or first_char == "{":
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, None, "שורת JSON לא תקינה"
+                continue
+            if isinstance(item, dict):
+                yield line_number, item, None
+            else:
+                yield line_number, None, "כל שורה חייבת להיות אובייקט"
+    else:
+        reader = csv.DictReader(text)
+        for item in reader:
+            yield reader.line_num, item, None
+
+
+def _insert_constraints(cur, rows: List[tuple]) -> None:
+    """Insert prepared rows with ``executemany`` in chunks of ``IMPORT_BATCH_SIZE``; the caller owns the transaction."""
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        cur.executemany(_INSERT_CONSTRAINT_SQL, rows[start:start + IMPORT_BATCH_SIZE])
+
+
+def _import_constraints(
+    cur, records, insert_rows: Optional[Callable[[List[tuple]], None]] = None
+) -> Dict[str, Any]:
+    """
+    Validate every record first, then insert all valid ones at once: a file that
+    breaks halfway (bad encoding, broken CSV) raises before anything is written.
+    ``cur`` is only read (employee lookup); the rows go to ``insert_rows``, or are
+    inserted on ``cur`` itself when it is None.
+    """
+    if insert_rows is None:
+        insert_rows = partial(_insert_constraints, cur)
+    cur.execute("SELECT id, email FROM employees")
+    employee_ids = set()
+    ids_by_email: Dict[str, int] = {}
+    for row in cur.fetchall():
+        employee_ids.add(row["id"])
+        if row["email"]:
+            ids_by_email[row["email"].strip().lower()] = row["id"]
+
+    rejected = 0
+    errors: List[Dict[str, Any]] = []
+    touched = set()
+    rows: List[tuple] = []
+
+    def _reject(line: int, message: str) -> None:
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+            errors.append({"line": line, "error": message})
+
+    for line, record, error in records:
+        if error:
+            _reject(line, error)
+            continue
+
+        employee_id = None
+        raw_id = str(record.get("employee_id") or "").strip()
+        raw_email = str(record.get("email") or "").strip().lower()
+        if raw_id:
+            try:
+                employee_id = int(raw_id)
+            except ValueError:
+                employee_id = None
+            if employee_id not in employee_ids:
+                employee_id = None
+        elif raw_email:
+            employee_id = ids_by_email.get(raw_email)
+        if employee_id is None:
+            _reject(line, "העובד לא נמצא")
+            continue
+
+        values = {}
+        for field in _IMPORT_FIELDS:
+            value = record.get(field)
+            # בקובצי JSON הערך יכול להגיע כמבנה ולא כמחרוזת
+            values[field] = value if value is None or isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        try:
+            prepared = _prepare_constraint(**values)
+        except ValueError as exc:
+            _reject(line, str(exc))
+            continue
+
+        rows.append((employee_id, *prepared))
+        touched.add(employee_id)
+
+    if rows:
+        insert_rows(rows)
+
+    return {
+        "imported": len(rows),
+        "rejected": rejected,
+        "errors": errors,
+        "employees": touched,
+    }
 
-    try:
-        # ננסה לפרש כ-JSON לקבלת ערכים מורכבים, ואם לא – נשמור כמחרוזת
-        parsed_value = json.loads(value)
-    except json.JSONDecodeError:
-        parsed_value = value
 
+@router.get("/employees/availability/import", response_class=HTMLResponse)
+def constraints_import_form(request: Request):
+    if (redirect := _require_login(request, admin=True)):
+        return redirect
+    return templates.TemplateResponse(
+        "admin_constraints_import.html",
+        {"request": request, "result": None, "max_errors": IMPORT_MAX_REPORTED_ERRORS},
+    )
+
+
+@router.post("/employees/availability/import", response_class=HTMLResponse)
+def constraints_import_submit(request: Request, file: UploadFile = File(...)):
+    if (redirect := _require_login(request, admin=True)):
+        return redirect
+
+    started = time.perf_counter()
+    # הקריאה, הפענוח והבדיקה רצים כאן; לכותב נשלחת עבודה אחת עם כל השורות התקינות (COMMIT יחיד)
     conn = get_connection()
     try:
-        cur = conn.cursor()
-        _fetch_employee(cur, employee_id)
-        cur.execute(
-            """
-            INSERT INTO EmployeeConstraints (
-                employee_id,
-                kind,
-                scope,
-                value_json,
-                valid_from,
-                valid_to
-            ) VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                employee_id,
-                kind,
-                scope,
-                json.dumps(parsed_value, ensure_ascii=False),
-                valid_from,
-                valid_to,
-            ),
+        result = _import_constraints(
+            conn.cursor(),
+            _iter_import_records(file),
+            insert_rows=lambda rows: db.write(_insert_constraints, rows),
+        )
+    except (UnicodeDecodeError, csv.Error):
+        # הקובץ נשבר לפני השמירה – דבר לא נכתב
+        return templates.TemplateResponse(
+            "admin_constraints_import.html",
+            {
+                "request": request,
+                "result": None,
+                "max_errors": IMPORT_MAX_REPORTED_ERRORS,
+                "error": "לא ניתן לקרוא את הקובץ – יש להעלות CSV או JSON בקידוד UTF-8",
+            },
         )
-        conn.commit()
     finally:
         conn.close()
+    for employee_id in result.pop("employees"):
+        profile_cache.invalidate(employee_id)
+    result["seconds"] = round(time.perf_counter() - started, 2)
 
-    return _redirect(
-        f"/employees/{employee_id}/availability",
-        message="העדפה נשמרה בהצלחה",
+    return templates.TemplateResponse(
+        "admin_constraints_import.html",
+        {
+            "request": request,
+            "result": result,
+            "max_errors": IMPORT_MAX_REPORTED_ERRORS,
+            "message": f"יובאו {result['imported']} הגבלות, {result['rejected']} נדחו",
+        },
     )
 @router.get("/reports", response_class=HTMLResponse)
-def unified_reports(
+async def unified_reports(
     request: Request,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -714,22 +788,30 @@ def unified_reports(
         return redirect
 
     employee_id = _session_employee_id(request)
-    personal_data = _build_employee_report(employee_id, start_date, end_date)
+    is_admin = bool(request.session.get("is_admin"))
+
+    def build(conn: sqlite3.Connection) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"personal": _build_employee_report(conn, employee_id, start_date, end_date)}
+        if is_admin:
+            data["admin_reports"] = build_admin_report_data(
+                request,
+                conn,
+                admin_start,
+                admin_end,
+                request.query_params.getlist("project"),
+            )
+        return data
+
+    data = await run_db("reports", build)
+    if isinstance(data.get("admin_reports"), RedirectResponse):
+        return data["admin_reports"]
+
     context = {
         "request": request,
-        "personal": personal_data,
-        "is_admin": bool(request.session.get("is_admin")),
+        "personal": data["personal"],
+        "is_admin": is_admin,
     }
-
-    if request.session.get("is_admin"):
-        admin_data = build_admin_report_data(
-            request,
-            admin_start,
-            admin_end,
-            request.query_params.getlist("project"),
-        )
-        if isinstance(admin_data, RedirectResponse):
-            return admin_data
-        context["admin_reports"] = admin_data
+    if is_admin:
+        context["admin_reports"] = data["admin_reports"]
 
     return templates.TemplateResponse("reports.html", context)
@@ -0,0 +1,894 @@
+import heapq
+import random
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app.constraint_cache import profile_cache
+from app.utils import (
+    ConstraintTimeline,
+    constraint_allows_date,
+    constraint_allows_day,
+    constraint_allows_shift_key,
+    date_ordinal,
+    normalize_shift_key,
+)
+
+_NO_CONSTRAINTS = ConstraintTimeline([])
+
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class AvailabilityMatrix:
+    """
+    Employees x dates x shift keys availability, compiled once per generation run.
+
+    Every (date, shift key) cell is an integer bitset over employee positions, so
+    filtering candidates is a couple of bitwise operations instead of one
+    ``constraint_allows_shift`` call per candidate. Cell values are identical to
+    ``constraint_allows_shift`` on each employee's effective profile for the date.
+    Employees with time-scoped constraints additionally lose the cells their
+    effective profile dislikes without preferring, since the candidate ranking only
+    knows their open-ended preferences.
+    """
+
+    def __init__(
+        self,
+        employee_ids: Sequence[int],
+        timelines: Dict[int, ConstraintTimeline],
+        dates: Sequence[str],
+        shift_keys: Iterable[str],
+    ):
+        self.positions: Dict[int, int] = {
+            employee_id: position for position, employee_id in enumerate(employee_ids)
+        }
+        self.dates = list(dates)
+        shift_keys = [normalize_shift_key(key) for key in shift_keys]
+        ordinals = [date_ordinal(date_str) for date_str in self.dates]
+
+        def _allows_date(profile: Dict[str, Any], index: int) -> bool:
+            if ordinals[index] is None:
+                return constraint_allows_date(profile, self.dates[index])
+            return constraint_allows_day(profile, ordinals[index])
+
+        shift_masks = {key: 0 for key in shift_keys}
+        date_masks = [0] * len(self.dates)
+        unrestricted = 0
+        scoped: List[Tuple[int, ConstraintTimeline]] = []
+        for employee_id, position in self.positions.items():
+            timeline = timelines.get(employee_id, _NO_CONSTRAINTS)
+            bit = 1 << position
+            if not timeline.is_static:
+                scoped.append((bit, timeline))
+                continue
+            profile = timeline.base
+            for key in shift_keys:
+                if constraint_allows_shift_key(profile, key):
+                    shift_masks[key] |= bit
+            if not profile.get("allowed_dates") and not profile.get("blocked_dates"):
+                unrestricted |= bit
+                continue
+            for index in range(len(self.dates)):
+                if _allows_date(profile, index):
+                    date_masks[index] |= bit
+
+        self._cells: Dict[Tuple[str, str], int] = {}
+        for index, date_str in enumerate(self.dates):
+            date_mask = date_masks[index] | unrestricted
+            for key in shift_keys:
+                self._cells[(date_str, key)] = date_mask & shift_masks[key]
+
+        for bit, timeline in scoped:
+            for index, date_str in enumerate(self.dates):
+                profile = timeline.profile_for(date_str)
+                if not _allows_date(profile, index):
+                    continue
+                preferred = profile.get("preferred_shifts", set())
+                disliked = profile.get("disliked_shifts", set())
+                for key in shift_keys:
+                    if key in disliked and key not in preferred:
+                        continue
+                    if constraint_allows_shift_key(profile, key):
+                        self._cells[(date_str, key)] |= bit
+
+    def bit(self, employee_id: int) -> int:
+        return 1 << self.positions[employee_id]
+
+    def mask(self, date_str: str, shift_key: str) -> int:
+        """Bitset of employees whose constraints allow ``shift_key`` on ``date_str``."""
+        return self._cells.get((date_str, normalize_shift_key(shift_key)), 0)
+
+    def counts(self, shift_key: str, exclude: int = 0) -> List[int]:
+        """Per-date number of employees allowed ``shift_key``, ignoring the ``exclude`` bits."""
+        key = normalize_shift_key(shift_key)
+        keep = ~exclude
+        return [_popcount(self._cells.get((date_str, key), 0) & keep) for date_str in self.dates]
+
+    def allows(self, employee_id: int, date_str: str, shift_key: str) -> bool:
+        position = self.positions.get(employee_id)
+        if position is None:
+            return False
+        return bool(self.mask(date_str, shift_key) >> position & 1)
+
+
+class CandidateQueue:
+    """
+    Per-shift-key priority queues over the active employees.
+
+    Entries are ordered exactly like the generator's historical
+    ``sorted(employee_ids, key=(load, preference, dislike, name))`` call, with the
+    original list position as the final tie-breaker (``sorted`` is stable).
+    When an employee's load changes a fresh entry is pushed and the old one is
+    discarded lazily once it reaches the top of its heap. ``prefer`` ranks a set of
+    employees ahead of everyone else regardless of load.
+    """
+
+    def __init__(
+        self,
+        employees,
+        shift_keys: Iterable[str],
+        employee_load: Dict[int, int],
+        preferred_map: Dict[int, Set[str]],
+        disliked_map: Dict[int, Set[str]],
+    ):
+        self._load = employee_load
+        self._tiers: Dict[int, int] = {}
+        self._names: Dict[int, str] = {}
+        self._positions: Dict[int, int] = {}
+        self._ranks: Dict[str, Dict[int, Tuple[int, int]]] = {}
+        self._heaps: Dict[str, List[tuple]] = {}
+
+        for position, row in enumerate(employees):
+            self._names[row["id"]] = row["name"]
+            self._positions[row["id"]] = position
+
+        for shift_key in shift_keys:
+            ranks: Dict[int, Tuple[int, int]] = {}
+            heap: List[tuple] = []
+            for employee_id in self._positions:
+                preferred = shift_key in preferred_map.get(employee_id, set())
+                disliked = shift_key in disliked_map.get(employee_id, set())
+                # עובד שלא אוהב את המשמרת (ולא ביקש אותה) לעולם לא ישובץ אליה
+                if disliked and not preferred:
+                    continue
+                ranks[employee_id] = (0 if preferred else 1, 1 if disliked else 0)
+                heap.append(self._entry(employee_id, ranks[employee_id]))
+            heapq.heapify(heap)
+            self._ranks[shift_key] = ranks
+            self._heaps[shift_key] = heap
+
+    def _entry(self, employee_id: int, rank: Tuple[int, int]) -> tuple:
+        return (
+            self._tiers.get(employee_id, 0),
+            self._load.get(employee_id, 0),
+            rank[0],
+            rank[1],
+            self._names[employee_id],
+            self._positions[employee_id],
+            employee_id,
+        )
+
+    def select(self, shift_key: str, is_eligible: Callable[[int], bool]) -> Optional[int]:
+        """Return the best-ranked employee for ``shift_key`` that passes ``is_eligible``."""
+        heap = self._heaps.get(shift_key)
+        if not heap:
+            return None
+
+        popped: List[tuple] = []
+        chosen = None
+        while heap:
+            entry = heapq.heappop(heap)
+            employee_id = entry[-1]
+            if entry[1] != self._load.get(employee_id, 0):
+                continue
+            popped.append(entry)
+            if is_eligible(employee_id):
+                chosen = employee_id
+                break
+
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    def record_assignment(self, employee_id: int) -> None:
+        """Increase the employee's load and re-rank them in every queue."""
+        self._load[employee_id] = self._load.get(employee_id, 0) + 1
+        self.refresh(employee_id)
+
+    def refresh(self, employee_id: int) -> None:
+        """Re-rank an employee whose load was changed directly in the shared load map."""
+        for shift_key, ranks in self._ranks.items():
+            rank = ranks.get(employee_id)
+            if rank is not None:
+                heapq.heappush(self._heaps[shift_key], self._entry(employee_id, rank))
+
+    def prefer(self, employee_ids: Iterable[int]) -> None:
+        """Serve ``employee_ids`` before every other employee; the rest only fill what they cannot."""
+        preferred = set(employee_ids)
+        self._tiers = {employee_id: 1 for employee_id in self._positions if employee_id not in preferred}
+        for shift_key, ranks in self._ranks.items():
+            heap = [self._entry(employee_id, rank) for employee_id, rank in ranks.items()]
+            heapq.heapify(heap)
+            self._heaps[shift_key] = heap
+
+
+MAX_SHIFT_MINUTES = 16 * 60
+
+
+def _minutes_of_day(value: str) -> int:
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def _shift_interval(start_time: str, end_time: str) -> Tuple[int, int]:
+    """(start minute within the day, duration in minutes); overnight shifts wrap."""
+    start = _minutes_of_day(start_time)
+    end = _minutes_of_day(end_time)
+    if end <= start:
+        end += 24 * 60
+    return start, end - start
+
+
+class WorkHoursTracker:
+    """
+    Rest-gap and rolling-window hour limits per employee.
+
+    Every employee position keeps, per calendar day, the ``(start, end)`` interval
+    (absolute minutes) of each shift they work that day, plus one minutes counter
+    per ``window_days``-long window. Because planning does not move through
+    the calendar in order (batches revisit the range once per project, repair and
+    local search jump around), the "last shift end" is looked up on the adjacent
+    days that a shift of at most 16 hours can reach. A check therefore reads a
+    constant number of day cells and window counters, and an update writes
+    ``window_days`` counters; ``remove`` takes back exactly one shift, so other
+    shifts on the same day (e.g. manually reported ones) keep counting.
+    """
+
+    def __init__(
+        self,
+        employee_count: int,
+        dates: Sequence[str],
+        shift_times: Dict[str, Tuple[str, str]],
+        min_rest_hours: float,
+        max_window_hours: float,
+        window_days: int,
+        existing: Iterable[Tuple[int, str, str, str]] = (),
+    ):
+        self.min_rest = int(min_rest_hours * 60)
+        self.max_window = int(max_window_hours * 60) if max_window_hours else 0
+        self.window_days = max(1, window_days)
+        self.reach = 1 + (MAX_SHIFT_MINUTES + self.min_rest) // (24 * 60)
+        ordinals = [date_ordinal(date_str) for date_str in dates]
+        self.padding = self.padding_days(min_rest_hours, window_days)
+        self.base = min(ordinals) - self.padding if ordinals else 0
+        self.length = (max(ordinals) - min(ordinals) + 1 + 2 * self.padding) if ordinals else 0
+        self.shift_intervals = {
+            normalize_shift_key(key): _shift_interval(start, end) for key, (start, end) in shift_times.items()
+        }
+        self._day_index = {
+            date_str: ordinal - self.base for date_str, ordinal in zip(dates, ordinals) if ordinal is not None
+        }
+        self._shifts: Dict[int, List[Optional[List[Tuple[int, int]]]]] = {}
+        self._windows: Dict[int, List[int]] = {}
+        self.employee_count = employee_count
+
+        for position, date_str, start_time, end_time in existing:
+            ordinal = date_ordinal(date_str)
+            if ordinal is None or not start_time or not end_time:
+                continue
+            day = ordinal - self.base
+            if 0 <= day < self.length:
+                start, duration = _shift_interval(start_time, end_time)
+                self._add(position, day, start, duration)
+
+    @staticmethod
+    def padding_days(min_rest_hours: float, window_days: int) -> int:
+        """Days before/after a range whose assignments affect checks inside it."""
+        reach = 1 + (MAX_SHIFT_MINUTES + int(min_rest_hours * 60)) // (24 * 60)
+        return max(reach, window_days)
+
+    def _arrays(self, position: int):
+        if position not in self._shifts:
+            self._shifts[position] = [None] * self.length
+            self._windows[position] = [0] * self.length
+        return self._shifts[position], self._windows[position]
+
+    def _add(self, position: int, day: int, start: int, duration: int) -> None:
+        shifts, windows = self._arrays(position)
+        absolute_start = day * 24 * 60 + start
+        if shifts[day] is None:
+            shifts[day] = []
+        shifts[day].append((absolute_start, absolute_start + duration))
+        for window in range(max(0, day - self.window_days + 1), day + 1):
+            windows[window] += duration
+
+    def allows(self, position: int, date_str: str, shift_key: str) -> bool:
+        day = self._day_index.get(date_str)
+        interval = self.shift_intervals.get(shift_key)
+        if day is None or interval is None:
+            return True
+        start, duration = interval
+        if self.max_window and duration > self.max_window:
+            return False
+        shifts = self._shifts.get(position)
+        if shifts is None:
+            return True
+        windows = self._windows[position]
+
+        absolute_start = day * 24 * 60 + start
+        absolute_end = absolute_start + duration
+        for other in range(max(0, day - self.reach), day):
+            for _, other_end in shifts[other] or ():
+                if other_end + self.min_rest > absolute_start:
+                    return False
+        for other in range(day + 1, min(self.length, day + self.reach + 1)):
+            for other_start, _ in shifts[other] or ():
+                if absolute_end + self.min_rest > other_start:
+                    return False
+        if self.max_window:
+            for window in range(max(0, day - self.window_days + 1), day + 1):
+                if windows[window] + duration > self.max_window:
+                    return False
+        return True
+
+    def add(self, position: int, date_str: str, shift_key: str) -> None:
+        day = self._day_index.get(date_str)
+        interval = self.shift_intervals.get(shift_key)
+        if day is not None and interval is not None:
+            self._add(position, day, *interval)
+
+    def remove(self, position: int, date_str: str, shift_key: str) -> None:
+        """Undo one ``add`` of ``shift_key`` on ``date_str``; the employee's other shifts stay."""
+        day = self._day_index.get(date_str)
+        interval = self.shift_intervals.get(shift_key)
+        if day is None or interval is None or position not in self._shifts:
+            return
+        start, duration = interval
+        absolute_start = day * 24 * 60 + start
+        cell = self._shifts[position][day]
+        if not cell or (absolute_start, absolute_start + duration) not in cell:
+            return
+        cell.remove((absolute_start, absolute_start + duration))
+        windows = self._windows[position]
+        for window in range(max(0, day - self.window_days + 1), day + 1):
+            windows[window] -= duration
+
+
+class GenerationState:
+    """
+    Everything a generation run derives from the active employees and their constraints.
+
+    Built once per date range and shared by every project generated in that run, so
+    load balancing sees assignments made for the other projects in the same batch.
+    Profiles come from the process-wide ``profile_cache``, so unchanged constraints
+    are not parsed again across runs.
+
+    ``existing_assignments`` are ``(employee_id, date, start_time, end_time)``; rows
+    outside ``dates`` only feed the rest/hours limits. Those limits are enforced when
+    ``shift_times`` (shift key -> (start, end)) is given.
+    """
+
+    def __init__(
+        self,
+        employees,
+        constraints_map: Dict[int, List[Dict]],
+        dates: Sequence[str],
+        shift_keys: Iterable[str],
+        existing_assignments: Iterable[Tuple[int, str, str, str]] = (),
+        shift_times: Optional[Dict[str, Tuple[str, str]]] = None,
+        min_rest_hours: float = 0,
+        max_window_hours: float = 0,
+        window_days: int = 7,
+    ):
+        shift_keys = [normalize_shift_key(key) for key in shift_keys]
+        self.employees = list(employees)
+        self.employee_ids = [row["id"] for row in self.employees]
+        self.names = {row["id"]: row["name"] for row in self.employees}
+        self.dates = list(dates)
+
+        self.timelines = {
+            employee_id: profile_cache.get(employee_id, constraints_map.get(employee_id, []))
+            for employee_id in self.employee_ids
+        }
+        # הדירוג משתמש בהעדפות הפתוחות (ללא טווח תוקף) של כל עובד
+        self.profiles = {
+            employee_id: timeline.base for employee_id, timeline in self.timelines.items()
+        }
+        self.preferred_map = {
+            employee_id: self.profiles[employee_id].get("preferred_shifts", set())
+            for employee_id in self.employee_ids
+        }
+        self.disliked_map = {
+            employee_id: self.profiles[employee_id].get("disliked_shifts", set())
+            for employee_id in self.employee_ids
+        }
+        self.availability = AvailabilityMatrix(self.employee_ids, self.timelines, self.dates, shift_keys)
+
+        self.employee_load = {employee_id: 0 for employee_id in self.employee_ids}
+        # ביטסט של העובדים שכבר משובצים בכל תאריך
+        self.working_by_date: Dict[str, int] = defaultdict(int)
+        date_set = set(self.dates)
+        positions = self.availability.positions
+        existing_times: List[Tuple[int, str, str, str]] = []
+        for employee_id, date_str, start_time, end_time in existing_assignments:
+            if employee_id not in positions:
+                continue
+            existing_times.append((positions[employee_id], date_str, start_time, end_time))
+            if date_str not in date_set:
+                continue
+            self.working_by_date[date_str] |= self.availability.bit(employee_id)
+            self.employee_load[employee_id] += 1
+
+        self.work_hours: Optional[WorkHoursTracker] = None
+        if shift_times and (min_rest_hours or max_window_hours):
+            self.work_hours = WorkHoursTracker(
+                len(self.employee_ids),
+                self.dates,
+                shift_times,
+                min_rest_hours,
+                max_window_hours,
+                window_days,
+                existing_times,
+            )
+
+        self.candidates = CandidateQueue(
+            self.employees,
+            shift_keys,
+            self.employee_load,
+            self.preferred_map,
+            self.disliked_map,
+        )
+
+    def allows_work(self, employee_id: int, date_str: str, shift_key: str) -> bool:
+        """Rest-gap and rolling-hours check for one more shift (True when no limits are set)."""
+        if self.work_hours is None:
+            return True
+        return self.work_hours.allows(self.availability.positions[employee_id], date_str, shift_key)
+
+    def record_assignment(self, employee_id: int, date_str: str, shift_key: str) -> None:
+        self.working_by_date[date_str] |= self.availability.bit(employee_id)
+        self.candidates.record_assignment(employee_id)
+        if self.work_hours is not None:
+            self.work_hours.add(self.availability.positions[employee_id], date_str, shift_key)
+
+
+# סדר הסיבות קובע לאיזו סיבה נספר עובד שנפסל מכמה סיבות
+REJECTION_REASONS = ("working", "blocked_date", "blocked_shift", "not_allowed", "disliked", "rest_hours")
+
+
+class RejectionAnalyzer:
+    """
+    Explains why nobody could take a slot: every active employee is counted under
+    the first reason in ``REJECTION_REASONS`` that rules them out, or as
+    ``available`` when none does.
+
+    The date and shift rules are compiled into bitsets the same way
+    ``AvailabilityMatrix`` compiles its cells (static profiles once per date and
+    once per shift key, time-scoped profiles per date), so one slot costs a few
+    bitwise operations and popcounts. Only the employees left after that are
+    checked against the rest/hours limits one by one.
+    """
+
+    def __init__(self, state: GenerationState, shift_keys: Iterable[str]):
+        self.state = state
+        shift_keys = [normalize_shift_key(key) for key in shift_keys]
+        dates = state.dates
+        ordinals = [date_ordinal(date_str) for date_str in dates]
+        self._date_index = {date_str: index for index, date_str in enumerate(dates)}
+        self.everyone = (1 << len(state.employee_ids)) - 1
+
+        def _day_reasons(profile: Dict[str, Any], index: int) -> Tuple[bool, bool]:
+            """(blocked date, outside the allowed dates)"""
+            allowed_dates = profile.get("allowed_dates")
+            blocked_dates = profile.get("blocked_dates")
+            if ordinals[index] is None:
+                return False, bool(allowed_dates)
+            return (
+                bool(blocked_dates) and blocked_dates.contains_ordinal(ordinals[index]),
+                bool(allowed_dates) and not allowed_dates.contains_ordinal(ordinals[index]),
+            )
+
+        def _key_reasons(profile: Dict[str, Any], key: str) -> Tuple[bool, bool, bool]:
+            """(blocked shift, outside the allowed/required shifts, disliked and not preferred)"""
+            allowed_shifts = profile.get("allowed_shifts")
+            required_shifts = profile.get("required_shifts")
+            return (
+                key in profile.get("blocked_shifts", set()),
+                bool(allowed_shifts) and key not in allowed_shifts
+                or bool(required_shifts) and key not in required_shifts,
+                key in profile.get("disliked_shifts", set()) and key not in profile.get("preferred_shifts", set()),
+            )
+
+        self._blocked_dates = [0] * len(dates)
+        self._outside_dates = [0] * len(dates)
+        self._blocked_shifts = {key: 0 for key in shift_keys}
+        self._outside_shifts = {key: 0 for key in shift_keys}
+        # הדירוג פוסל לפי ההעדפות הפתוחות של כל עובד, גם כשיש לו אילוצים תחומים בזמן
+        self._disliked = {key: 0 for key in shift_keys}
+        self._scoped_cells: Dict[Tuple[int, str], List[int]] = {}
+
+        for employee_id, position in state.availability.positions.items():
+            timeline = state.timelines[employee_id]
+            base = timeline.base
+            bit = 1 << position
+            for key in shift_keys:
+                blocked, outside, disliked = _key_reasons(base, key)
+                if disliked:
+                    self._disliked[key] |= bit
+                if timeline.is_static and blocked:
+                    self._blocked_shifts[key] |= bit
+                if timeline.is_static and outside:
+                    self._outside_shifts[key] |= bit
+
+            if timeline.is_static and not base.get("allowed_dates") and not base.get("blocked_dates"):
+                continue
+            for index, date_str in enumerate(dates):
+                profile = base if timeline.is_static else timeline.profile_for(date_str)
+                blocked, outside = _day_reasons(profile, index)
+                if blocked:
+                    self._blocked_dates[index] |= bit
+                if outside:
+                    self._outside_dates[index] |= bit
+                if timeline.is_static:
+                    continue
+                for key in shift_keys:
+                    flags = _key_reasons(profile, key)
+                    if not any(flags):
+                        continue
+                    cell = self._scoped_cells.setdefault((index, key), [0, 0, 0])
+                    for slot, flag in enumerate(flags):
+                        if flag:
+                            cell[slot] |= bit
+
+    def explain(self, date_str: str, shift_key: str) -> Dict[str, int]:
+        """Per-reason employee counts for one ``(date, shift key)`` slot."""
+        key = normalize_shift_key(shift_key)
+        index = self._date_index[date_str]
+        scoped = self._scoped_cells.get((index, key), (0, 0, 0))
+        masks = (
+            ("working", self.state.working_by_date.get(date_str, 0)),
+            ("blocked_date", self._blocked_dates[index]),
+            ("blocked_shift", self._blocked_shifts.get(key, 0) | scoped[0]),
+            ("not_allowed", self._outside_dates[index] | self._outside_shifts.get(key, 0) | scoped[1]),
+            ("disliked", self._disliked.get(key, 0) | scoped[2]),
+        )
+        counts: Dict[str, int] = {}
+        remaining = self.everyone
+        for reason, mask in masks:
+            hit = remaining & mask
+            counts[reason] = _popcount(hit)
+            remaining &= ~hit
+
+        rested = available = 0
+        employee_ids = self.state.employee_ids
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            if self.state.allows_work(employee_ids[low.bit_length() - 1], date_str, key):
+                available += 1
+            else:
+                rested += 1
+        counts["rest_hours"] = rested
+        counts["available"] = available
+        return counts
+
+
+OPTIMAL_LOAD_COST = 10
+OPTIMAL_NOT_PREFERRED_COST = 2
+OPTIMAL_DISLIKED_COST = 1
+
+
+def plan_day_optimal(
+    date_str: str,
+    requirements: Dict[str, int],
+    availability: AvailabilityMatrix,
+    working_mask: int,
+    employee_load: Dict[int, int],
+    preferred_map: Dict[int, Set[str]],
+    disliked_map: Dict[int, Set[str]],
+    names: Dict[int, str],
+    is_allowed: Optional[Callable[[int, str], bool]] = None,
+) -> Dict[str, List[int]]:
+    """
+    Fill one day's slots with a min-cost max-flow on
+    source -> employee (capacity 1) -> shift key (capacity = required) -> sink.
+
+    The result is optimal for this day only: coverage is maximal and, among the
+    maximum assignments, the cheapest one is kept, where an employee's cost for a
+    shift is their current load plus preference penalties. Days are solved in order
+    on top of the assignments already fixed on earlier days, so the period as a
+    whole is not guaranteed to be optimal.
+
+    Successive shortest paths only ever turn at the shift-key nodes (free employee ->
+    shift, then "move an assignee to another shift"), so each augmentation is a
+    Bellman-Ford over the shift keys fed by lazily-pruned heaps.
+
+    ``is_allowed(employee_id, shift_key)`` drops further edges (rest gaps, hour
+    limits). It is evaluated against the earlier days' fixed assignments, which is
+    why a choice made on one day can leave a later day with less coverage.
+    """
+    keys = [normalize_shift_key(key) for key, required in requirements.items() if (required or 0) > 0]
+    capacity = {normalize_shift_key(key): required for key, required in requirements.items()}
+    positions = availability.positions
+
+    costs: Dict[int, Dict[str, int]] = {}
+    free_heaps: Dict[str, List[tuple]] = {}
+    for key in keys:
+        eligible = availability.mask(date_str, key) & ~working_mask
+        heap: List[tuple] = []
+        if eligible:
+            for employee_id, position in positions.items():
+                if not eligible >> position & 1:
+                    continue
+                preferred = key in preferred_map.get(employee_id, set())
+                disliked = key in disliked_map.get(employee_id, set())
+                if disliked and not preferred:
+                    continue
+                if is_allowed is not None and not is_allowed(employee_id, key):
+                    continue
+                cost = (
+                    employee_load.get(employee_id, 0) * OPTIMAL_LOAD_COST
+                    + (0 if preferred else OPTIMAL_NOT_PREFERRED_COST)
+                    + (OPTIMAL_DISLIKED_COST if disliked else 0)
+                )
+                costs.setdefault(employee_id, {})[key] = cost
+                heap.append((cost, names[employee_id], position, employee_id))
+        heapq.heapify(heap)
+        free_heaps[key] = heap
+
+    assigned: Dict[str, List[int]] = {key: [] for key in keys}
+    placement: Dict[int, str] = {}
+    # (from_key, to_key) -> heap of (cost delta of moving an assignee, position, employee)
+    move_heaps: Dict[Tuple[str, str], List[tuple]] = {
+        (source, target): [] for source in keys for target in keys if source != target
+    }
+
+    def _place(employee_id: int, key: str) -> None:
+        placement[employee_id] = key
+        assigned[key].append(employee_id)
+        own_cost = costs[employee_id][key]
+        for target, cost in costs[employee_id].items():
+            if target != key:
+                heapq.heappush(
+                    move_heaps[(key, target)],
+                    (cost - own_cost, positions[employee_id], employee_id),
+                )
+
+    while True:
+        dist: Dict[str, int] = {}
+        pred: Dict[str, Tuple[Optional[str], int]] = {}
+        for key in keys:
+            heap = free_heaps[key]
+            while heap and heap[0][-1] in placement:
+                heapq.heappop(heap)
+            if heap:
+                dist[key] = heap[0][0]
+                pred[key] = (None, heap[0][-1])
+
+        best_moves: Dict[Tuple[str, str], tuple] = {}
+        for pair, heap in move_heaps.items():
+            while heap and placement.get(heap[0][-1]) != pair[0]:
+                heapq.heappop(heap)
+            if heap:
+                best_moves[pair] = heap[0]
+
+        for _ in range(len(keys) - 1):
+            changed = False
+            for (source, target), move in best_moves.items():
+                if source not in dist:
+                    continue
+                candidate = dist[source] + move[0]
+                if target not in dist or candidate < dist[target]:
+                    dist[target] = candidate
+                    pred[target] = (source, move[-1])
+                    changed = True
+            if not changed:
+                break
+
+        open_keys = [
+            key for key in keys if key in dist and len(assigned[key]) < capacity[key]
+        ]
+        if not open_keys:
+            break
+        key = min(open_keys, key=lambda item: dist[item])
+
+        while True:
+            source, employee_id = pred[key]
+            if source is not None:
+                assigned[source].remove(employee_id)
+            _place(employee_id, key)
+            if source is None:
+                break
+            key = source
+
+    return {key: sorted(members, key=positions.get) for key, members in assigned.items()}
+
+
+def _swap_keeps_limits(
+    hours: WorkHoursTracker, date_str: str, first: int, first_key: str, second: int, second_key: str
+) -> bool:
+    """Exchange the shifts of two positions on one date in ``hours`` if both stay within limits."""
+    hours.remove(first, date_str, first_key)
+    if second >= 0:
+        hours.remove(second, date_str, second_key)
+    allowed = hours.allows(first, date_str, second_key)
+    if allowed and second >= 0:
+        allowed = hours.allows(second, date_str, first_key)
+    if not allowed:
+        hours.add(first, date_str, first_key)
+        if second >= 0:
+            hours.add(second, date_str, second_key)
+        return False
+    hours.add(first, date_str, second_key)
+    if second >= 0:
+        hours.add(second, date_str, first_key)
+    return True
+
+
+LOCAL_SEARCH_UNFILLED_COST = 1000
+LOCAL_SEARCH_NOT_PREFERRED_COST = 2
+LOCAL_SEARCH_DISLIKED_COST = 1
+
+
+def improve_schedule(
+    slots: Sequence[Tuple[str, str, Optional[int]]],
+    state: GenerationState,
+    time_budget: float,
+    max_moves: Optional[int] = None,
+    seed: int = 0,
+) -> Tuple[List[Tuple[str, str, Optional[int]]], Dict[str, Any]]:
+    """
+    Local search over a planned schedule; ``slots`` are ``(date, shift_key, employee_id)``
+    with ``None`` for a slot nobody could fill.
+
+    The score (lower is better) is ``LOCAL_SEARCH_UNFILLED_COST`` per empty slot, plus
+    the sum of squared employee loads (i.e. load variance at a fixed total), plus the
+    preference penalties of every filled slot. Random moves fill an empty slot, hand a
+    slot to another employee, or swap two slots of the same date; only moves that do
+    not worsen the score are kept. A move touches at most two employees, so its score
+    delta is computed from their loads and costs alone. Moves that would break the
+    state's rest/hours limits are rejected.
+
+    Runs until ``time_budget`` seconds (or ``max_moves``) are spent, then writes the
+    new loads and working dates back into ``state``.
+    """
+    availability = state.availability
+    employee_ids = state.employee_ids
+    count = len(employee_ids)
+    load = [state.employee_load.get(employee_id, 0) for employee_id in employee_ids]
+
+    # עלות העדפה לכל עובד בכל סוג משמרת; None = העובד לא ישובץ למשמרת הזו
+    key_costs: Dict[str, List[Optional[int]]] = {}
+    for key in {normalize_shift_key(key) for _, key, _ in slots}:
+        costs: List[Optional[int]] = []
+        for employee_id in employee_ids:
+            preferred = key in state.preferred_map.get(employee_id, set())
+            disliked = key in state.disliked_map.get(employee_id, set())
+            if disliked and not preferred:
+                costs.append(None)
+            else:
+                costs.append(
+                    (0 if preferred else LOCAL_SEARCH_NOT_PREFERRED_COST)
+                    + (LOCAL_SEARCH_DISLIKED_COST if disliked else 0)
+                )
+        key_costs[key] = costs
+
+    slot_dates: List[str] = []
+    slot_keys: List[str] = []
+    slot_costs: List[List[Optional[int]]] = []
+    slot_masks: List[int] = []
+    slot_members: List[int] = []
+    by_date: Dict[str, List[int]] = defaultdict(list)
+    working: Dict[str, int] = {}
+    for index, (date_str, key, employee_id) in enumerate(slots):
+        normalized = normalize_shift_key(key)
+        slot_dates.append(date_str)
+        slot_keys.append(normalized)
+        slot_costs.append(key_costs[normalized])
+        slot_masks.append(availability.mask(date_str, normalized))
+        slot_members.append(-1 if employee_id is None else availability.positions[employee_id])
+        by_date[date_str].append(index)
+        working[date_str] = state.working_by_date[date_str]
+
+    score = sum(value * value for value in load)
+    for index, member in enumerate(slot_members):
+        if member < 0:
+            score += LOCAL_SEARCH_UNFILLED_COST
+        else:
+            score += slot_costs[index][member]
+    score_before = score
+
+    rng = random.Random(seed)
+    randrange = rng.randrange
+    slot_count = len(slot_members)
+    started = time.perf_counter()
+    deadline = started + time_budget
+    moves = accepted = 0
+    touched: Set[int] = set()
+    hours = state.work_hours
+
+    while slot_count and count:
+        if max_moves is not None and moves >= max_moves:
+            break
+        if (moves & 1023) == 0 and time.perf_counter() >= deadline:
+            break
+        moves += 1
+
+        index = randrange(slot_count)
+        date_str = slot_dates[index]
+        costs = slot_costs[index]
+        current = slot_members[index]
+        busy = working[date_str]
+
+        if current < 0 or rng.random() < 0.5:
+            # מילוי משבצת ריקה או העברת המשבצת לעובד אחר
+            candidate = randrange(count)
+            cost = costs[candidate]
+            if cost is None or busy >> candidate & 1 or not slot_masks[index] >> candidate & 1:
+                continue
+            delta = 2 * load[candidate] + 1 + cost
+            if current < 0:
+                delta -= LOCAL_SEARCH_UNFILLED_COST
+            else:
+                delta -= 2 * load[current] - 1 + costs[current]
+            if delta > 0:
+                continue
+            if hours is not None:
+                if not hours.allows(candidate, date_str, slot_keys[index]):
+                    continue
+                hours.add(candidate, date_str, slot_keys[index])
+                if current >= 0:
+                    hours.remove(current, date_str, slot_keys[index])
+            busy |= 1 << candidate
+            load[candidate] += 1
+            touched.add(candidate)
+            if current >= 0:
+                busy &= ~(1 << current)
+                load[current] -= 1
+                touched.add(current)
+            working[date_str] = busy
+            slot_members[index] = candidate
+        else:
+            # החלפה בין שתי משבצות באותו תאריך, או מעבר למשבצת ריקה בו (העומס לא משתנה)
+            same_day = by_date[date_str]
+            other_index = same_day[randrange(len(same_day))]
+            if slot_keys[other_index] == slot_keys[index]:
+                continue
+            other = slot_members[other_index]
+            other_costs = slot_costs[other_index]
+            if other_costs[current] is None or not slot_masks[other_index] >> current & 1:
+                continue
+            delta = other_costs[current] - costs[current]
+            if other >= 0:
+                if costs[other] is None or not slot_masks[index] >> other & 1:
+                    continue
+                delta += costs[other] - other_costs[other]
+            if delta > 0:
+                continue
+            if hours is not None and not _swap_keeps_limits(
+                hours, date_str, current, slot_keys[index], other, slot_keys[other_index]
+            ):
+                continue
+            slot_members[index], slot_members[other_index] = other, current
+        accepted += 1
+        score += delta
+
+    for position in touched:
+        employee_id = employee_ids[position]
+        state.employee_load[employee_id] = load[position]
+        state.candidates.refresh(employee_id)
+    state.working_by_date.update(working)
+
+    improved = [
+        (date_str, key, None if member < 0 else employee_ids[member])
+        for (date_str, key, _), member in zip(slots, slot_members)
+    ]
+    return improved, {
+        "score_before": score_before,
+        "score_after": score,
+        "moves": moves,
+        "accepted": accepted,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
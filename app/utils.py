@@ -1,6 +1,7 @@
 import json
+from bisect import bisect_right
 from datetime import datetime, timedelta, date
-from typing import Any, Dict, Iterable, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 
 def calculate_shift_hours(date_str: str, start_time: str, end_time: str) -> float:
@@ -47,6 +48,110 @@ def _parse_date(value: str) -> Optional[date]:
         return None
 
 
+_WEEKDAYS = {
+    "monday": 0, "mon": 0, "שני": 0,
+    "tuesday": 1, "tue": 1, "שלישי": 1,
+    "wednesday": 2, "wed": 2, "רביעי": 2,
+    "thursday": 3, "thu": 3, "חמישי": 3,
+    "friday": 4, "fri": 4, "שישי": 4,
+    "saturday": 5, "sat": 5, "שבת": 5,
+    "sunday": 6, "sun": 6, "ראשון": 6,
+}
+
+_DATE_RULE_KEYS = ("dates", "from", "to", "ranges", "weekdays")
+
+
+def date_ordinal(date_str: str) -> Optional[int]:
+    parsed = _parse_date(date_str)
+    return parsed.toordinal() if parsed else None
+
+
+def _weekday_index(value: Any) -> Optional[int]:
+    """Weekday as ``date.weekday()`` (0 = Monday); accepts English/Hebrew names or 0-6."""
+    if isinstance(value, int):
+        return value if 0 <= value <= 6 else None
+    return _WEEKDAYS.get(str(value).strip().lower())
+
+
+class DaySet:
+    """
+    A set of calendar days kept as merged ordinal-day ranges plus weekly rules.
+
+    A three-month block is one ``(start, end)`` pair instead of ~90 date strings,
+    and membership is a bisect over the range starts or a couple of modulo checks.
+    A weekly rule is ``(weekday bitmask, every_weeks, anchor)``: the listed weekdays
+    of every ``every_weeks``-th week, counted in Sunday-to-Saturday weeks from the
+    week that contains ``anchor`` (an ordinal). Call ``freeze`` after the last add.
+    """
+
+    def __init__(self):
+        self._pending: List[Tuple[int, int]] = []
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self.rules: List[Tuple[int, int, int]] = []
+
+    def add_range(self, start: int, end: int) -> None:
+        if start <= end:
+            self._pending.append((start, end))
+
+    def add_rule(self, weekday_mask: int, every_weeks: int = 1, anchor: int = 0) -> None:
+        if not weekday_mask:
+            return
+        every_weeks = max(1, every_weeks)
+        # תחילת השבוע (יום ראשון) של תאריך העוגן
+        week_start = anchor - (anchor % 7) if every_weeks > 1 else 0
+        self.rules.append((weekday_mask, every_weeks, week_start))
+
+    def freeze(self) -> "DaySet":
+        ranges = sorted(self._pending + list(zip(self._starts, self._ends)))
+        self._pending = []
+        starts: List[int] = []
+        ends: List[int] = []
+        for start, end in ranges:
+            if ends and start <= ends[-1] + 1:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self._starts, self._ends = starts, ends
+        return self
+
+    @property
+    def ranges(self) -> List[Tuple[int, int]]:
+        return list(zip(self._starts, self._ends))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ranges": [list(item) for item in self.ranges],
+            "rules": [list(rule) for rule in self.rules],
+        }
+
+    def update_from_dict(self, data: Dict[str, Any]) -> None:
+        for start, end in data.get("ranges") or []:
+            self.add_range(start, end)
+        for weekday_mask, every_weeks, week_start in data.get("rules") or []:
+            # week_start כבר מיושר ליום ראשון, ולכן add_rule משאיר אותו כמות שהוא
+            self.add_rule(weekday_mask, every_weeks, week_start)
+
+    def contains_ordinal(self, ordinal: int) -> bool:
+        index = bisect_right(self._starts, ordinal) - 1
+        if index >= 0 and ordinal <= self._ends[index]:
+            return True
+        # date(1, 1, 1) (ordinal 1) was a Monday, so ordinal % 7 == 0 is a Sunday
+        weekday_bit = 1 << ((ordinal - 1) % 7)
+        for weekday_mask, every_weeks, week_start in self.rules:
+            if weekday_mask & weekday_bit and ((ordinal - week_start) // 7) % every_weeks == 0:
+                return True
+        return False
+
+    def __contains__(self, date_str: str) -> bool:
+        ordinal = date_ordinal(date_str)
+        return ordinal is not None and self.contains_ordinal(ordinal)
+
+    def __bool__(self) -> bool:
+        return bool(self._starts or self._pending or self.rules)
+
+
 def _ensure_set(container: Optional[Set[str]], items: Iterable[str]) -> Set[str]:
     base = container or set()
     for item in items:
@@ -55,12 +160,53 @@ def _ensure_set(container: Optional[Set[str]], items: Iterable[str]) -> Set[str]
     return base
 
 
+COMPILED_CONSTRAINT_VERSION = 1
+
+_SHIFT_FIELDS = ("allowed_shifts", "blocked_shifts", "preferred_shifts", "disliked_shifts", "required_shifts")
+_DATE_FIELDS = ("allowed_dates", "blocked_dates")
+
+
+def compile_constraint(kind: str, scope: str, value_json: str) -> Dict[str, Any]:
+    """
+    Run the heuristic parser once for a single stored row and return its canonical
+    form (stored in ``EmployeeConstraints.compiled_json``). Only the ``"v"`` key is
+    present when nothing in the row was recognized.
+    """
+    profile = build_constraint_profile([{"kind": kind, "scope": scope, "value_json": value_json}])
+    compiled: Dict[str, Any] = {"v": COMPILED_CONSTRAINT_VERSION}
+    for field in _SHIFT_FIELDS:
+        if profile[field]:
+            compiled[field] = sorted(profile[field])
+    for field in _DATE_FIELDS:
+        if profile[field]:
+            compiled[field] = profile[field].to_dict()
+    return compiled
+
+
+def _load_compiled(compiled_json: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not compiled_json:
+        return None
+    try:
+        compiled = json.loads(compiled_json)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    if not isinstance(compiled, dict) or compiled.get("v") != COMPILED_CONSTRAINT_VERSION:
+        return None
+    return compiled
+
+
 def build_constraint_profile(constraints_rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Build a normalized constraint profile for an employee.
     Supported patterns (value_json dictionaries or lists):
         - allowed/blocked shift keys
         - allowed/blocked dates (YYYY-MM-DD)
+        - date rules for scope "date":
+          {"from": "2025-01-01", "to": "2025-03-31"}, {"ranges": [[from, to], ...]},
+          {"weekdays": ["שישי", "שבת"], "every_weeks": 2, "anchor": "2025-01-03"}
+    Dates compile into ``DaySet`` objects (ordinal ranges and weekly rules).
+    Rows carrying a current ``compiled_json`` are merged directly; only rows without
+    one go through the keyword heuristics below.
     """
     profile: Dict[str, Any] = {
         "allowed_shifts": None,  # type: Optional[Set[str]]
@@ -68,11 +214,56 @@ def build_constraint_profile(constraints_rows: Iterable[Dict[str, Any]]) -> Dict
         "preferred_shifts": set(),  # type: Set[str]
         "disliked_shifts": set(),  # type: Set[str]
         "required_shifts": None,  # type: Optional[Set[str]]
-        "allowed_dates": None,  # type: Optional[Set[str]]
-        "blocked_dates": set(),  # type: Set[str]
+        "allowed_dates": None,  # type: Optional[DaySet]
+        "blocked_dates": DaySet(),  # type: DaySet
     }
 
+    def _target_days(allow: bool) -> DaySet:
+        if not allow:
+            return profile["blocked_dates"]
+        if profile["allowed_dates"] is None:
+            profile["allowed_dates"] = DaySet()
+        return profile["allowed_dates"]
+
+    def _apply_date_rules(rules: Dict[str, Any], allow: bool):
+        target = _target_days(allow)
+        ranges = list(rules.get("ranges") or [])
+        if rules.get("from") or rules.get("to"):
+            ranges.append([rules.get("from"), rules.get("to") or rules.get("from")])
+        for item in ranges:
+            if isinstance(item, dict):
+                item = [item.get("from"), item.get("to") or item.get("from")]
+            if not isinstance(item, (list, tuple)) or len(item) != 2:
+                continue
+            start, end = date_ordinal(str(item[0] or "")), date_ordinal(str(item[1] or ""))
+            if start is not None and end is not None:
+                target.add_range(start, end)
+        for item in rules.get("dates") or []:
+            ordinal = date_ordinal(str(item))
+            if ordinal is not None:
+                target.add_range(ordinal, ordinal)
+        weekday_mask = 0
+        for item in rules.get("weekdays") or []:
+            index = _weekday_index(item)
+            if index is not None:
+                weekday_mask |= 1 << index
+        try:
+            every_weeks = int(rules.get("every_weeks") or 1)
+        except (TypeError, ValueError):
+            every_weeks = 1
+        target.add_rule(weekday_mask, every_weeks, date_ordinal(str(rules.get("anchor") or "")) or 0)
+
     for row in constraints_rows:
+        compiled = _load_compiled(row.get("compiled_json"))
+        if compiled is not None:
+            for field in _SHIFT_FIELDS:
+                if compiled.get(field):
+                    profile[field] = _ensure_set(profile[field], compiled[field])
+            for field in _DATE_FIELDS:
+                if compiled.get(field):
+                    _target_days(field == "allowed_dates").update_from_dict(compiled[field])
+            continue
+
         value_json = row.get("value_json")
         try:
             parsed = json.loads(value_json) if value_json else None
@@ -99,20 +290,15 @@ def build_constraint_profile(constraints_rows: Iterable[Dict[str, Any]]) -> Dict
                 profile["disliked_shifts"] = _ensure_set(profile.get("disliked_shifts"), normalized_values)
 
         def _maybe_apply_dates(values: Iterable[str], allow: bool):
-            normalized = []
-            for item in values:
-                if item:
-                    normalized.append(str(item))
-            if allow:
-                existing = profile["allowed_dates"] or set()
-                existing.update(normalized)
-                profile["allowed_dates"] = existing
-            else:
-                profile["blocked_dates"].update(normalized)
+            _apply_date_rules({"dates": [item for item in values if item]}, allow)
 
         priority_hint = (row.get("priority") or "").lower()
 
-        if isinstance(parsed, dict):
+        if isinstance(parsed, dict) and "date" in scope and any(key in parsed for key in _DATE_RULE_KEYS):
+            action = str(parsed.get("action") or kind).lower()
+            allow = not any(token in action for token in ("un", "לא", "אסור", "block"))
+            _apply_date_rules(parsed, allow)
+        elif isinstance(parsed, dict):
             priority = str(parsed.get("priority") or priority_hint or row.get("kind") or "").lower()
             for key, value in parsed.items():
                 lowered_key = key.lower()
@@ -155,24 +341,93 @@ def build_constraint_profile(constraints_rows: Iterable[Dict[str, Any]]) -> Dict
                 allow = not any(token in kind for token in ("un", "לא", "אסור", "block"))
                 _maybe_apply_dates([parsed], allow=allow)
 
+    if profile["allowed_dates"] is not None:
+        profile["allowed_dates"].freeze()
+    profile["blocked_dates"].freeze()
     return profile
 
 
-def constraint_allows_shift(
-    profile: Dict[str, Any],
-    date_str: str,
-    shift_key: str,
-) -> bool:
-    """Check if the normalized profile allows working the shift on the given date."""
-    normalized_shift = normalize_shift_key(shift_key)
-    shift_date = _parse_date(date_str)
+class ConstraintTimeline:
+    """
+    An employee's constraints resolved over time.
+
+    Rows without ``valid_from``/``valid_to`` form ``base``. The validity bounds of the
+    other rows cut the calendar into segments with a constant set of active rows;
+    each segment's profile is compiled once, and ``profile_for`` finds it with a
+    bisect over the sorted segment start dates (ISO dates sort chronologically as
+    strings). Both bounds are inclusive; an unparsable bound is treated as open.
+    """
+
+    def __init__(self, constraints_rows: Iterable[Dict[str, Any]]):
+        base_rows: List[Dict[str, Any]] = []
+        scoped: List[Tuple[Optional[str], Optional[str], Dict[str, Any]]] = []
+        for row in constraints_rows:
+            valid_from = _parse_date(row.get("valid_from") or "")
+            valid_to = _parse_date(row.get("valid_to") or "")
+            if valid_from is None and valid_to is None:
+                base_rows.append(row)
+                continue
+            scoped.append(
+                (
+                    valid_from.isoformat() if valid_from else None,
+                    # גבול עליון לא כולל: היום שאחרי valid_to
+                    (valid_to + timedelta(days=1)).isoformat() if valid_to else None,
+                    row,
+                )
+            )
 
-    allowed_dates: Optional[Set[str]] = profile.get("allowed_dates")
-    blocked_dates: Set[str] = profile.get("blocked_dates", set())
-    if allowed_dates and date_str not in allowed_dates:
+        self.base = build_constraint_profile(base_rows)
+        self.boundaries: List[str] = sorted(
+            {bound for start, end, _ in scoped for bound in (start, end) if bound}
+        )
+        compiled: Dict[Tuple[int, ...], Dict[str, Any]] = {(): self.base}
+        self.profiles: List[Dict[str, Any]] = []
+        for index in range(len(self.boundaries) + 1):
+            segment_start = self.boundaries[index - 1] if index else None
+            active = tuple(
+                position
+                for position, (start, end, _) in enumerate(scoped)
+                if (
+                    start is None
+                    if segment_start is None
+                    else (start is None or start <= segment_start) and (end is None or segment_start < end)
+                )
+            )
+            if active not in compiled:
+                compiled[active] = build_constraint_profile(base_rows + [scoped[i][2] for i in active])
+            self.profiles.append(compiled[active])
+
+    @property
+    def is_static(self) -> bool:
+        return not self.boundaries
+
+    def profile_for(self, date_str: str) -> Dict[str, Any]:
+        """Effective profile on ``date_str`` in O(log segments)."""
+        return self.profiles[bisect_right(self.boundaries, date_str)]
+
+
+def constraint_allows_day(profile: Dict[str, Any], ordinal: int) -> bool:
+    """Check the date-level rules of a normalized profile for a ``date.toordinal()`` day."""
+    allowed_dates: Optional[DaySet] = profile.get("allowed_dates")
+    blocked_dates: Optional[DaySet] = profile.get("blocked_dates")
+    if allowed_dates and not allowed_dates.contains_ordinal(ordinal):
         return False
-    if date_str in blocked_dates:
+    if blocked_dates and blocked_dates.contains_ordinal(ordinal):
         return False
+    return True
+
+
+def constraint_allows_date(profile: Dict[str, Any], date_str: str) -> bool:
+    """Check the date-level rules (allowed/blocked dates) of a normalized profile."""
+    ordinal = date_ordinal(date_str)
+    if ordinal is None:
+        return not profile.get("allowed_dates")
+    return constraint_allows_day(profile, ordinal)
+
+
+def constraint_allows_shift_key(profile: Dict[str, Any], shift_key: str) -> bool:
+    """Check the shift-level rules (allowed/blocked/required shifts) of a normalized profile."""
+    normalized_shift = normalize_shift_key(shift_key)
 
     allowed_shifts: Optional[Set[str]] = profile.get("allowed_shifts")
     blocked_shifts: Set[str] = profile.get("blocked_shifts", set())
@@ -186,3 +441,12 @@ def constraint_allows_shift(
         return False
 
     return True
+
+
+def constraint_allows_shift(
+    profile: Dict[str, Any],
+    date_str: str,
+    shift_key: str,
+) -> bool:
+    """Check if the normalized profile allows working the shift on the given date."""
+    return constraint_allows_date(profile, date_str) and constraint_allows_shift_key(profile, shift_key)
@@ -0,0 +1,111 @@
+"""
+Candidate selection benchmark: legacy per-slot ``sorted`` vs ``CandidateQueue``.
+
+Simulates a quarter (90 days x 3 shifts) with random preferences and blocked
+dates, checks that both strategies pick the same employees and prints timings.
+
+    python benchmarks/bench_candidate_selection.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scheduler import CandidateQueue  # noqa: E402
+
+SHIFT_KEYS = ["morning", "afternoon", "night"]
+DAYS = 90
+SLOTS_PER_SHIFT = 5
+
+
+def _build_population(size: int, seed: int = 1):
+    rng = random.Random(seed)
+    start = date(2025, 1, 1)
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range(DAYS)]
+    employees = [{"id": emp_id, "name": f"עובד {emp_id:05d}"} for emp_id in range(1, size + 1)]
+    preferred = {row["id"]: set(rng.sample(SHIFT_KEYS, rng.randint(0, 1))) for row in employees}
+    disliked = {row["id"]: set(rng.sample(SHIFT_KEYS, rng.randint(0, 1))) - preferred[row["id"]] for row in employees}
+    blocked = {row["id"]: set(rng.sample(dates, rng.randint(0, 20))) for row in employees}
+    return dates, employees, preferred, disliked, blocked
+
+
+def _run_legacy(dates, employees, preferred, disliked, blocked):
+    lookup = {row["id"]: row for row in employees}
+    employee_ids = list(lookup)
+    load = {emp_id: 0 for emp_id in employee_ids}
+    busy = {emp_id: set() for emp_id in employee_ids}
+    picks = []
+    for date_str in dates:
+        for shift_key in SHIFT_KEYS:
+            for _ in range(SLOTS_PER_SHIFT):
+                order = sorted(
+                    employee_ids,
+                    key=lambda emp_id: (
+                        load[emp_id],
+                        0 if shift_key in preferred[emp_id] else 1,
+                        1 if shift_key in disliked[emp_id] else 0,
+                        lookup[emp_id]["name"],
+                    ),
+                )
+                chosen = None
+                for emp_id in order:
+                    if date_str in busy[emp_id] or date_str in blocked[emp_id]:
+                        continue
+                    if shift_key in disliked[emp_id] and shift_key not in preferred[emp_id]:
+                        continue
+                    chosen = emp_id
+                    break
+                picks.append(chosen)
+                if chosen is None:
+                    break
+                busy[chosen].add(date_str)
+                load[chosen] += 1
+    return picks
+
+
+def _run_queue(dates, employees, preferred, disliked, blocked):
+    load = {row["id"]: 0 for row in employees}
+    busy = {row["id"]: set() for row in employees}
+    queue = CandidateQueue(employees, SHIFT_KEYS, load, preferred, disliked)
+    picks = []
+    for date_str in dates:
+        for shift_key in SHIFT_KEYS:
+            for _ in range(SLOTS_PER_SHIFT):
+                chosen = queue.select(
+                    shift_key,
+                    lambda emp_id: date_str not in busy[emp_id] and date_str not in blocked[emp_id],
+                )
+                picks.append(chosen)
+                if chosen is None:
+                    break
+                busy[chosen].add(date_str)
+                queue.record_assignment(chosen)
+    return picks
+
+
+def main():
+    print(f"{'employees':>10} {'legacy (s)':>12} {'queue (s)':>12} {'speedup':>9}")
+    for size in (100, 1_000, 5_000):
+        population = _build_population(size)
+
+        started = time.perf_counter()
+        legacy_picks = _run_legacy(*population)
+        legacy_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        queue_picks = _run_queue(*population)
+        queue_elapsed = time.perf_counter() - started
+
+        if legacy_picks != queue_picks:
+            raise SystemExit(f"assignments differ at {size} employees")
+        print(
+            f"{size:>10} {legacy_elapsed:>12.3f} {queue_elapsed:>12.3f} "
+            f"{legacy_elapsed / queue_elapsed:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
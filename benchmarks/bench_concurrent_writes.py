@@ -0,0 +1,101 @@
+"""
+Concurrent write benchmark: one connection per request vs the serialized writer.
+
+Simulates a burst of portal shift reports: ``THREADS`` threads each add
+``WRITES_PER_THREAD`` shifts through ``_create_shift_assignment``. The legacy path
+gives every write its own connection and commit, so writers contend for SQLite's
+lock (short busy timeout, one retry per failure, like the old handlers in
+production). The writer path submits the same jobs to ``db.write``, which group
+commits whatever is queued.
+
+    python benchmarks/bench_concurrent_writes.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+from app.routes.employee import _create_shift_assignment  # noqa: E402
+
+THREADS = 16
+WRITES_PER_THREAD = 100
+LEGACY_BUSY_TIMEOUT = 0.05
+
+
+def _add_shift(cur, employee_id: int, index: int) -> int:
+    return _create_shift_assignment(
+        cur,
+        employee_id=employee_id,
+        project_name="אתר",
+        location="שער",
+        date=f"2025-{1 + index % 12:02d}-{1 + index % 28:02d}",
+        start_time="06:00",
+        end_time="14:00",
+    )
+
+
+def _legacy_worker(path: str, employee_id: int, failures: list) -> None:
+    for index in range(WRITES_PER_THREAD):
+        for attempt in range(2):
+            conn = sqlite3.connect(path, timeout=LEGACY_BUSY_TIMEOUT)
+            conn.row_factory = sqlite3.Row
+            try:
+                _add_shift(conn.cursor(), employee_id, index)
+                conn.commit()
+                break
+            except sqlite3.OperationalError:
+                failures.append(attempt)
+            finally:
+                conn.close()
+
+
+def _writer_worker(path: str, employee_id: int, failures: list) -> None:
+    for index in range(WRITES_PER_THREAD):
+        try:
+            db.write(_add_shift, employee_id, index, path=path)
+        except sqlite3.OperationalError:
+            failures.append(0)
+
+
+def _run(path: str, worker) -> tuple:
+    failures: list = []
+    threads = [threading.Thread(target=worker, args=(path, idx + 1, failures)) for idx in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    conn = sqlite3.connect(path)
+    try:
+        written = conn.execute("SELECT COUNT(*) FROM ShiftAssignments").fetchone()[0]
+    finally:
+        conn.close()
+    # attempt 1 = גם הניסיון החוזר נכשל והכתיבה אבדה
+    return elapsed, written, len(failures), sum(1 for attempt in failures if attempt)
+
+
+def main():
+    total = THREADS * WRITES_PER_THREAD
+    print(f"{THREADS} threads x {WRITES_PER_THREAD} writes")
+    print(f"{'path':>8} {'time (s)':>9} {'writes/s':>9} {'written':>8} {'lock errors':>12} {'lost':>5}")
+    for label, worker in (("legacy", _legacy_worker), ("writer", _writer_worker)):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "bench.db")
+            db.init_db(path)
+            conn = db.connect(path)
+            conn.executemany("INSERT INTO employees (name, active) VALUES (?, 1)", [(f"עובד {idx}",) for idx in range(THREADS)])
+            conn.commit()
+            conn.close()
+            elapsed, written, errors, lost = _run(path, worker)
+            db.close_pools()
+            print(f"{label:>8} {elapsed:>9.2f} {total / elapsed:>9.0f} {written:>8} {errors:>12} {lost:>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Availability heatmap: cold build vs cached lookup at 2,000 employees x 365 days.
+
+Seeds a temporary database with a mix of shift and date constraints (some of
+them time-scoped), then times ``_availability_heatmap`` with empty caches, again
+with warm caches, and once more after a single constraint row changed.
+
+    python benchmarks/bench_heatmap.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+from app.constraint_cache import coverage_cache, profile_cache  # noqa: E402
+from app.routes import admin  # noqa: E402
+
+EMPLOYEES = 2000
+DAYS = 365
+START = date(2025, 1, 1)
+
+
+def _seed(cur, dates):
+    rng = random.Random(5)
+    cur.execute(
+        """
+        INSERT INTO projects (name, active, morning_required, afternoon_required, night_required)
+        VALUES ('אתר', 1, 1400, 1000, 800)
+        """
+    )
+    cur.executemany(
+        "INSERT INTO employees (name, active) VALUES (?, 1)",
+        [(f"עובד {idx:04d}",) for idx in range(EMPLOYEES)],
+    )
+    rows = []
+    for employee_id in range(1, EMPLOYEES + 1):
+        if rng.random() < 0.5:
+            value = {"values": [rng.choice(admin.SHIFT_ORDER)], "action": rng.choice(["allow", "block"])}
+            rows.append((employee_id, "shift", "shift", json.dumps(value), None, None))
+        if rng.random() < 0.4:
+            rows.append((employee_id, "unavailable", "date", json.dumps(rng.sample(dates, 12)), None, None))
+        if rng.random() < 0.15:
+            rows.append((employee_id, "unavailable", "date", json.dumps({"weekdays": ["שבת"]}), None, None))
+        if rng.random() < 0.1:
+            value = {"values": ["night"], "action": "block"}
+            rows.append((employee_id, "shift", "shift", json.dumps(value), "2025-03-01", "2025-06-30"))
+    cur.executemany(
+        """
+        INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json, valid_from, valid_to)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    db.compile_stored_constraints(cur)
+
+
+def _timed(cur, project, dates):
+    started = time.perf_counter()
+    heatmap = admin._availability_heatmap(cur, project, dates)
+    return time.perf_counter() - started, heatmap
+
+
+def main() -> None:
+    dates = [(START + timedelta(days=offset)).isoformat() for offset in range(DAYS)]
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_PATH = os.path.join(workdir, "bench.db")
+        db.init_db()
+        conn = db.connect()
+        try:
+            cur = conn.cursor()
+            _seed(cur, dates)
+            conn.commit()
+            project = cur.execute("SELECT * FROM projects WHERE name = 'אתר'").fetchone()
+
+            profile_cache.invalidate()
+            coverage_cache.invalidate()
+            cold, heatmap = _timed(cur, project, dates)
+            warm, _ = _timed(cur, project, dates)
+            cur.execute("UPDATE EmployeeConstraints SET value_json = '[\"2025-02-02\"]', compiled_json = NULL WHERE id = 1")
+            changed, _ = _timed(cur, project, dates)
+        finally:
+            conn.close()
+
+    cells = DAYS * len(admin.SHIFT_ORDER)
+    print(f"grid:              {EMPLOYEES} employees x {DAYS} days x {len(admin.SHIFT_ORDER)} shifts")
+    print(f"short cells:       {heatmap['gaps']}/{cells}")
+    print(f"cold:              {cold * 1000:.0f} ms")
+    print(f"cached:            {warm * 1000:.0f} ms")
+    print(f"one row changed:   {changed * 1000:.0f} ms (profiles reused, counts rebuilt)")
+
+
+if __name__ == "__main__":
+    main()
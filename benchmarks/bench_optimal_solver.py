@@ -0,0 +1,100 @@
+"""
+Greedy vs optimal generation: coverage and runtime over a 90-day horizon.
+
+Builds a throwaway SQLite database with 500 active employees, a mix of
+shift-restricted and date-blocked constraints, and runs
+``_generate_schedule_for_project`` in both modes.
+
+    python benchmarks/bench_optimal_solver.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+from app.routes import admin  # noqa: E402
+
+EMPLOYEES = 500
+DAYS = 90
+REQUIREMENTS = {"morning": 150, "afternoon": 140, "night": 130}
+START = datetime(2025, 1, 1)
+
+
+def _seed(cur, seed: int = 3):
+    rng = random.Random(seed)
+    dates = [(START + timedelta(days=offset)).date().isoformat() for offset in range(DAYS)]
+    cur.execute(
+        "INSERT INTO projects (name, hourly_rate, active, morning_required, afternoon_required, night_required) "
+        "VALUES ('אתר בדיקה', 50, 1, ?, ?, ?)",
+        (REQUIREMENTS["morning"], REQUIREMENTS["afternoon"], REQUIREMENTS["night"]),
+    )
+    for emp_id in range(1, EMPLOYEES + 1):
+        cur.execute("INSERT INTO employees (name, active) VALUES (?, 1)", (f"עובד {emp_id:04d}",))
+        roll = rng.random()
+        if roll < 0.6:
+            allowed = rng.sample(["morning", "afternoon", "night"], rng.randint(1, 2))
+            cur.execute(
+                "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'shift', 'shift', ?)",
+                (emp_id, json.dumps({"values": allowed, "action": "allow"})),
+            )
+        if rng.random() < 0.5:
+            cur.execute(
+                "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'unavailable', 'date', ?)",
+                (emp_id, json.dumps(rng.sample(dates, rng.randint(5, 40)))),
+            )
+
+
+def _run(mode: str):
+    conn = db.connect()
+    try:
+        cur = conn.cursor()
+        project = cur.execute("SELECT * FROM projects").fetchone()
+        employees, constraints_map = admin._load_active_employees_with_constraints(cur)
+        started = time.perf_counter()
+        result = admin._generate_schedule_for_project(
+            cur,
+            project,
+            employees,
+            constraints_map,
+            START,
+            START + timedelta(days=DAYS - 1),
+            REQUIREMENTS,
+            project["name"],
+            mode=mode,
+        )
+        elapsed = time.perf_counter() - started
+        conn.rollback()
+    finally:
+        conn.close()
+    return result, elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_PATH = os.path.join(workdir, "bench.db")
+        db.init_db()
+        conn = db.connect()
+        _seed(conn.cursor())
+        conn.commit()
+        conn.close()
+
+        total_slots = DAYS * sum(REQUIREMENTS.values())
+        print(f"{EMPLOYEES} employees x {DAYS} days, {total_slots} slots")
+        print(f"{'mode':>8} {'covered':>9} {'coverage':>9} {'warnings':>9} {'time (s)':>9}")
+        for mode in ("greedy", "optimal"):
+            result, elapsed = _run(mode)
+            covered = result["total_assignments"]
+            print(
+                f"{mode:>8} {covered:>9} {covered / total_slots:>8.2%} "
+                f"{len(result['warnings']):>9} {elapsed:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Batch generation of many projects: sequential shared-state run vs the parallel
+process-pool driver, for 1..N workers.
+
+Builds a throwaway SQLite database with 2000 active employees and 32 projects and
+runs ``_generate_schedule_batch`` over a four-week horizon, ``REPEATS`` times per
+worker count. The first parallel run also starts the long-lived worker pool; the
+repeated runs reuse it, as later requests do, and the speed-up is taken from
+their best time. Speed-up is bounded by the number of cores on the machine
+running the script.
+
+    python benchmarks/bench_parallel_generation.py
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+from app.routes import admin  # noqa: E402
+
+EMPLOYEES = 2000
+PROJECTS = 32
+DAYS = 28
+START = datetime(2025, 1, 1)
+REPEATS = 3
+MODE = "greedy"
+
+
+def _seed(cur, seed: int = 5):
+    rng = random.Random(seed)
+    for project_id in range(1, PROJECTS + 1):
+        cur.execute(
+            "INSERT INTO projects (name, hourly_rate, active, morning_required, afternoon_required, night_required) "
+            "VALUES (?, 50, 1, ?, ?, ?)",
+            (f"אתר {project_id:02d}", rng.randint(10, 20), rng.randint(10, 20), rng.randint(5, 15)),
+        )
+    for emp_id in range(1, EMPLOYEES + 1):
+        cur.execute("INSERT INTO employees (name, active) VALUES (?, 1)", (f"עובד {emp_id:04d}",))
+        if rng.random() < 0.5:
+            allowed = rng.sample(["morning", "afternoon", "night"], rng.randint(1, 2))
+            cur.execute(
+                "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'shift', 'shift', ?)",
+                (emp_id, json.dumps({"values": allowed, "action": "allow"})),
+            )
+
+
+def _run(workers: int):
+    conn = db.connect()
+    try:
+        cur = conn.cursor()
+        projects = cur.execute("SELECT * FROM projects ORDER BY name").fetchall()
+        employees, constraints_map = admin._load_active_employees_with_constraints(cur)
+        started = time.perf_counter()
+        result = admin._generate_schedule_batch(
+            cur,
+            projects,
+            employees,
+            constraints_map,
+            START,
+            START + timedelta(days=DAYS - 1),
+            mode=MODE,
+            workers=workers,
+        )
+        elapsed = time.perf_counter() - started
+        conn.rollback()
+    finally:
+        conn.close()
+    return result, elapsed
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_PATH = os.path.join(workdir, "bench.db")
+        db.init_db()
+        conn = db.connect()
+        _seed(conn.cursor())
+        conn.commit()
+        conn.close()
+
+        cores = os.cpu_count() or 1
+        print(f"{EMPLOYEES} employees x {PROJECTS} projects x {DAYS} days, mode={MODE}, {cores} cores")
+        print(
+            f"{'workers':>8} {'assigned':>9} {'warnings':>9} {'conflicts':>10} "
+            f"{'first (s)':>10} {'repeat (s)':>11} {'speed-up':>9}"
+        )
+        baseline = None
+        worker_counts = sorted({1, 2, 4, 8, 16, cores} & set(range(1, cores + 1))) or [1]
+        if 2 not in worker_counts:
+            # בלי ליבות נוספות עדיין מודדים את התקורה של המסלול המקבילי
+            worker_counts.append(2)
+        for workers in worker_counts:
+            runs = [_run(workers) for _ in range(REPEATS)]
+            result, first = runs[0]
+            repeat = min(elapsed for _, elapsed in runs[1:]) if len(runs) > 1 else first
+            baseline = baseline or repeat
+            print(
+                f"{workers:>8} {result['total_assignments']:>9} {result['warnings_count']:>9} "
+                f"{result['conflicts_resolved']:>10} {first:>10.2f} {repeat:>11.2f} {baseline / repeat:>8.2f}x"
+            )
+        admin.plan_executors.shutdown()
+
+
+if __name__ == "__main__":
+    main()
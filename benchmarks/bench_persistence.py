@@ -0,0 +1,122 @@
+"""
+Schedule persistence benchmark: legacy per-row writes vs ``_persist_schedule_plan``.
+
+The legacy path is the pre-bulk generator loop: one ``_ensure_shift`` SELECT per
+slot, an INSERT per missing shift and an INSERT per assignment. Both paths
+persist the same plan (a quarter for a large site) into a database that already
+holds shift history, inside one transaction that is rolled back afterwards.
+Statement counts come from ``sqlite3.Connection.set_trace_callback``.
+
+    python benchmarks/bench_persistence.py
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db  # noqa: E402
+from app.routes import admin  # noqa: E402
+
+DAYS = 90
+GUARDS_PER_SHIFT = {"morning": 20, "afternoon": 15, "night": 10}
+HISTORY_SHIFTS = 20_000
+LOCATION = "אתר גדול"
+
+
+def _seed(cur):
+    cur.execute("INSERT INTO projects (name, active) VALUES (?, 1)", (LOCATION,))
+    cur.execute("INSERT INTO projects (name, active) VALUES ('היסטוריה', 1)")
+    employees = max(GUARDS_PER_SHIFT.values()) * 3
+    cur.executemany(
+        "INSERT INTO employees (name, active) VALUES (?, 1)",
+        [(f"עובד {idx}",) for idx in range(employees)],
+    )
+    history_start = date(2023, 1, 1)
+    cur.executemany(
+        "INSERT INTO shifts (project_id, date, start_time, end_time, location) VALUES (2, ?, '06:00', '14:00', 'ישן')",
+        [((history_start + timedelta(days=idx % 700)).isoformat(),) for idx in range(HISTORY_SHIFTS)],
+    )
+
+
+def _build_plan():
+    plan = []
+    start = date(2025, 1, 1)
+    for offset in range(DAYS):
+        date_str = (start + timedelta(days=offset)).isoformat()
+        employee_id = 1
+        for shift_key, guards in GUARDS_PER_SHIFT.items():
+            for _ in range(guards):
+                plan.append({"date": date_str, "shift_key": shift_key, "employee_id": employee_id})
+                employee_id += 1
+    return plan
+
+
+def _legacy_persist(cur, project_id, location, assignments):
+    for row in assignments:
+        template = admin.SHIFT_TEMPLATES[row["shift_key"]]
+        cur.execute(
+            """
+            SELECT id
+            FROM shifts
+            WHERE project_id = ?
+              AND date = ?
+              AND start_time = ?
+              AND end_time = ?
+              AND IFNULL(location, '') = ?
+            """,
+            (project_id, row["date"], template["start"], template["end"], location),
+        )
+        found = cur.fetchone()
+        if found:
+            shift_id = found["id"]
+        else:
+            cur.execute(
+                "INSERT INTO shifts (project_id, date, start_time, end_time, location) VALUES (?, ?, ?, ?, ?)",
+                (project_id, row["date"], template["start"], template["end"], location),
+            )
+            shift_id = cur.lastrowid
+        cur.execute(
+            "INSERT OR IGNORE INTO ShiftAssignments (shift_id, employee_id) VALUES (?, ?)",
+            (shift_id, row["employee_id"]),
+        )
+
+
+def _measure(persist, plan):
+    conn = db.connect()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        cur = conn.cursor()
+        started = time.perf_counter()
+        persist(cur, 1, LOCATION, plan)
+        elapsed = time.perf_counter() - started
+        written = cur.execute("SELECT COUNT(*) FROM ShiftAssignments").fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.set_trace_callback(None)
+        conn.close()
+    return len(statements), elapsed, written
+
+
+def main():
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_PATH = os.path.join(workdir, "bench.db")
+        db.init_db()
+        conn = db.connect()
+        _seed(conn.cursor())
+        conn.commit()
+        conn.close()
+
+        plan = _build_plan()
+        print(f"{len(plan)} assignments, {HISTORY_SHIFTS} existing shifts")
+        print(f"{'path':>8} {'statements':>11} {'time (s)':>9} {'rows':>7}")
+        for label, persist in (("legacy", _legacy_persist), ("bulk", admin._persist_schedule_plan)):
+            statements, elapsed, written = _measure(persist, plan)
+            print(f"{label:>8} {statements:>11} {elapsed:>9.3f} {written:>7}")
+
+
+if __name__ == "__main__":
+    main()
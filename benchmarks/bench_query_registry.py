@@ -0,0 +1,76 @@
+"""
+Variable-length id lists: inline ``IN (?, ?, ...)`` vs the registry's ``json_each``.
+
+Loads constraints for ``LOOKUPS`` employee subsets of varying size, as generation
+does for the active staff. The inline form builds a new SQL text for every list
+length, so sqlite3's statement cache misses and the statement is re-prepared; the
+registry statement keeps one text and binds the list as one JSON parameter.
+
+    python benchmarks/bench_query_registry.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import db, queries  # noqa: E402
+
+EMPLOYEES = 2000
+CONSTRAINTS_PER_EMPLOYEE = 3
+LOOKUPS = 2000
+MAX_IDS = 20
+
+
+def _inline(cur, ids):
+    placeholders = ",".join("?" for _ in ids)
+    cur.execute(
+        f"""
+        SELECT id, employee_id, kind, scope, value_json, compiled_json, valid_from, valid_to
+        FROM EmployeeConstraints
+        WHERE employee_id IN ({placeholders})
+        """,
+        ids,
+    )
+    return cur.fetchall()
+
+
+def _registry(cur, ids):
+    return queries.fetch_all(cur, "constraints_for_employees", (queries.id_list(ids),))
+
+
+def main():
+    rng = random.Random(7)
+    lookups = [rng.sample(range(1, EMPLOYEES + 1), rng.randint(1, MAX_IDS)) for _ in range(LOOKUPS)]
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench.db")
+        db.init_db(path)
+        conn = db.connect(path)
+        conn.executemany("INSERT INTO employees (name, active) VALUES (?, 1)", [(f"עובד {idx}",) for idx in range(EMPLOYEES)])
+        conn.executemany(
+            "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'unavailable', 'date', ?)",
+            [
+                (employee_id, f'{{"date": "2025-01-{day + 1:02d}"}}')
+                for employee_id in range(1, EMPLOYEES + 1)
+                for day in range(CONSTRAINTS_PER_EMPLOYEE)
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+        print(f"{LOOKUPS} lookups of 1-{MAX_IDS} ids over {EMPLOYEES} employees")
+        print(f"{'path':>8} {'time (s)':>9} {'lookups/s':>10} {'rows':>9}")
+        for label, lookup in (("inline", _inline), ("registry", _registry)):
+            conn = db.connect(path)
+            cur = conn.cursor()
+            started = time.perf_counter()
+            rows = sum(len(lookup(cur, ids)) for ids in lookups)
+            elapsed = time.perf_counter() - started
+            conn.close()
+            print(f"{label:>8} {elapsed:>9.2f} {LOOKUPS / elapsed:>10.0f} {rows:>9}")
+
+
+if __name__ == "__main__":
+    main()
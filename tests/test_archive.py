@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+
+from app import archive, db, migrations, queries
+from app.routes import admin
+
+# (תאריך, עובדים משובצים)
+SHIFTS = [
+    ("2023-06-01", [1]),
+    ("2023-12-31", [1, 2]),
+    ("2024-03-10", [2]),
+    ("2025-01-20", [1]),
+    ("2025-02-03", [2]),
+    ("2025-03-01", [1, 2]),
+]
+TODAY = date(2025, 3, 15)
+
+
+class ArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "hot.db")
+        migrations.migrate(self.path)
+        conn = db.connect(self.path)
+        conn.execute("INSERT INTO projects (name, hourly_rate) VALUES ('אתר', 10)")
+        conn.executemany("INSERT INTO employees (name, active) VALUES (?, 1)", [("דנה",), ("יוסי",)])
+        for shift_date, employee_ids in SHIFTS:
+            self._add_shift(conn, shift_date, employee_ids)
+        conn.commit()
+        conn.close()
+        self.pool = db.ConnectionPool(self.path, readonly=True)
+
+    def tearDown(self):
+        self.pool.close()
+        self.workdir.cleanup()
+
+    def _add_shift(self, conn, shift_date, employee_ids):
+        cur = conn.execute(
+            "INSERT INTO shifts (project_id, date, start_time, end_time, location) VALUES (1, ?, '06:00', '14:00', 'שער')",
+            (shift_date,),
+        )
+        conn.executemany(
+            "INSERT INTO ShiftAssignments (shift_id, employee_id) VALUES (?, ?)",
+            [(cur.lastrowid, employee_id) for employee_id in employee_ids],
+        )
+
+    def _overview(self, start_date=None, end_date=None):
+        conn = self.pool.acquire()
+        try:
+            result = admin._build_business_overview(conn, start_date, end_date)
+            self.assertEqual([row[1] for row in conn.execute("PRAGMA database_list")], ["main"])
+            return result
+        finally:
+            conn.close()
+
+    def test_cutoff_keeps_current_and_recent_months(self):
+        self.assertEqual(archive.archive_cutoff(TODAY, 3), "2024-12-01")
+        self.assertEqual(archive.archive_cutoff(TODAY, 0), "2025-03-01")
+        self.assertEqual(archive.archive_cutoff(date(2025, 1, 31), 1), "2024-12-01")
+
+    def test_closed_months_move_to_yearly_files(self):
+        before = self._overview("2000-01-01")
+        moved = archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        self.assertEqual(moved, {2023: 2, 2024: 1, 2025: 1})
+        self.assertEqual(archive.archive_closed_months(self.path, keep_months=1, today=TODAY), {})
+
+        conn = sqlite3.connect(self.path)
+        try:
+            hot = [row[0] for row in conn.execute("SELECT date FROM shifts ORDER BY date")]
+            self.assertEqual(hot, ["2025-02-03", "2025-03-01"])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM ShiftAssignments").fetchone()[0], 3)
+            self.assertEqual(
+                archive.archive_catalog(conn),
+                [
+                    (2023, os.path.join("archive", "shifts_2023.db"), "2024-01-01"),
+                    (2024, os.path.join("archive", "shifts_2024.db"), "2025-01-01"),
+                    (2025, os.path.join("archive", "shifts_2025.db"), "2025-02-01"),
+                ],
+            )
+        finally:
+            conn.close()
+
+        after = self._overview("2000-01-01")
+        for key in ("total_shifts", "total_person_hours", "total_payout"):
+            self.assertEqual(after[key], before[key], key)
+        self.assertEqual(self._overview()["total_shifts"], before["total_shifts"])
+
+    def test_only_overlapping_archives_are_attached(self):
+        archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        conn = self.pool.acquire()
+        try:
+            with archive.shift_tables(conn, "2025-02-01", None) as (shifts, assignments):
+                self.assertEqual((shifts, assignments), ("shifts", "ShiftAssignments"))
+            with archive.shift_tables(conn, "2024-01-01", "2024-12-31") as (shifts, assignments):
+                attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+                self.assertEqual(attached, ["main", "archive_2024"])
+                count = conn.execute(
+                    f"SELECT COUNT(*) FROM {shifts} s JOIN {assignments} sa ON sa.shift_id = s.id "
+                    "WHERE s.date BETWEEN '2024-01-01' AND '2024-12-31'"
+                ).fetchone()[0]
+                self.assertEqual(count, 1)
+        finally:
+            conn.close()
+
+    def test_open_ended_range_attaches_every_archive(self):
+        archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        conn = self.pool.acquire()
+        try:
+            with archive.shift_tables(conn) as (shifts, assignments):
+                attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+                self.assertEqual(attached, ["main", "archive_2023", "archive_2024", "archive_2025"])
+            with archive.shift_tables(conn, None, "2024-06-30") as (shifts, assignments):
+                attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+                self.assertEqual(attached, ["main", "archive_2023", "archive_2024"])
+        finally:
+            conn.close()
+
+    def test_dashboards_cover_archived_years(self):
+        def dashboards():
+            conn = self.pool.acquire()
+            try:
+                with archive.shift_tables(conn) as (shifts, assignments):
+                    return [
+                        len(queries.fetch_all(conn.cursor(), name, shifts=shifts, assignments=assignments))
+                        for name in ("schedule_overview", "projects_dashboard_rows")
+                    ]
+            finally:
+                conn.close()
+
+        self.assertEqual(dashboards(), [6, 8])
+        archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        self.assertEqual(dashboards(), [6, 8])
+
+    def test_scheduling_writes_before_horizon_are_rejected(self):
+        archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        conn = db.connect(self.path)
+        try:
+            cur = conn.cursor()
+            archived_plan = [{"date": "2025-01-20", "shift_key": "morning", "employee_id": 2}]
+            with self.assertRaises(archive.ArchivedDateError):
+                admin._persist_schedule_plan(cur, 1, "שער", archived_plan)
+            self.assertEqual(cur.execute("SELECT COUNT(*) FROM shifts").fetchone()[0], 2)
+
+            employees = cur.execute("SELECT id, name FROM employees").fetchall()
+            assignments, warnings = admin._validate_plan_rows(
+                cur, [["2025-01-20", "morning", 2], ["2025-02-10", "morning", 2]], employees, {}
+            )
+            self.assertEqual([row["date"] for row in assignments], ["2025-02-10"])
+            self.assertEqual(len(warnings), 1)
+            persisted = admin._persist_schedule_plan(cur, 1, "שער", assignments)
+            self.assertEqual(persisted["assignments"], 1)
+        finally:
+            conn.close()
+
+    def test_late_rows_for_archived_dates_stay_visible_once(self):
+        archive.archive_closed_months(self.path, keep_months=1, today=TODAY)
+        conn = db.connect(self.path)
+        self._add_shift(conn, "2023-06-02", [2])
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(self._overview("2023-01-01", "2023-12-31")["total_shifts"], 3)
+        self.assertEqual(archive.archive_closed_months(self.path, keep_months=1, today=TODAY), {2023: 1})
+        self.assertEqual(self._overview("2023-01-01", "2023-12-31")["total_shifts"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from app.constraint_cache import ConstraintProfileCache
+
+
+def _row(row_id, value_json):
+    return {
+        "id": row_id,
+        "kind": "shift",
+        "scope": "shift",
+        "value_json": value_json,
+        "valid_from": None,
+        "valid_to": None,
+    }
+
+
+class ConstraintProfileCacheTests(unittest.TestCase):
+    def test_unchanged_rows_hit_and_changed_rows_recompile(self):
+        cache = ConstraintProfileCache()
+        rows = [_row(1, '{"values":["morning"],"action":"allow"}')]
+
+        first = cache.get(7, rows)
+        second = cache.get(7, [dict(row) for row in rows])
+        self.assertIs(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        changed = cache.get(7, [_row(1, '{"values":["night"],"action":"allow"}')])
+        self.assertEqual(changed.base["allowed_shifts"], {"night"})
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_invalidate_and_lru_eviction(self):
+        cache = ConstraintProfileCache(maxsize=2)
+        cache.get(1, [])
+        cache.get(2, [])
+        cache.get(1, [])
+        cache.get(3, [])
+        self.assertEqual(cache.stats()["size"], 2)
+
+        cache.get(1, [])
+        self.assertEqual(cache.stats()["hits"], 2)
+        cache.get(2, [])
+        self.assertEqual(cache.stats()["misses"], 4)
+
+        cache.invalidate(2)
+        cache.get(2, [])
+        self.assertEqual(cache.stats()["misses"], 5)
+        cache.invalidate()
+        self.assertEqual(cache.stats()["size"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import io
+import json
+import sqlite3
+import unittest
+from unittest import mock
+
+from fastapi import UploadFile
+
+from app.db import compile_stored_constraints
+from app.routes import employee
+from app.routes.employee import _import_constraints, _iter_import_records
+from app.utils import build_constraint_profile, compile_constraint
+
+RAW_ROWS = [
+    {"kind": "shift", "scope": "shift", "value_json": '{"values":["בוקר"],"priority":"preferred"}'},
+    {"kind": "shift", "scope": "shift", "value_json": '{"values":["night"],"action":"block"}'},
+    {"kind": "unavailable", "scope": "shift", "value_json": '["evening"]'},
+    {"kind": "available", "scope": "date", "value_json": '["2025-01-01", "2025-01-02"]'},
+    {"kind": "unavailable", "scope": "date", "value_json": '{"from": "2025-02-01", "to": "2025-04-30"}'},
+    {"kind": "unavailable", "scope": "date", "value_json": '{"weekdays": ["שבת"], "every_weeks": 2, "anchor": "2025-01-04"}'},
+]
+
+
+def _comparable(profile):
+    result = {}
+    for field, value in profile.items():
+        if value is None or isinstance(value, set):
+            result[field] = value
+        else:
+            result[field] = value.to_dict()
+    return result
+
+
+class CompiledConstraintTests(unittest.TestCase):
+    def test_compiled_rows_build_the_same_profile(self):
+        compiled_rows = [
+            dict(row, compiled_json=json.dumps(compile_constraint(row["kind"], row["scope"], row["value_json"])))
+            for row in RAW_ROWS
+        ]
+        # ערך גולמי שבור מוכיח שהשורות המהודרות לא מפוענחות מחדש
+        for row in compiled_rows:
+            row["value_json"] = "not json"
+
+        self.assertEqual(
+            _comparable(build_constraint_profile(compiled_rows)),
+            _comparable(build_constraint_profile(RAW_ROWS)),
+        )
+
+    def test_unrecognized_row_compiles_to_version_only(self):
+        self.assertEqual(list(compile_constraint("note", "general", '"hello"')), ["v"])
+
+    def test_migration_compiles_only_missing_rows(self):
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute(
+            "CREATE TABLE EmployeeConstraints (id INTEGER PRIMARY KEY, kind TEXT, scope TEXT, value_json TEXT, compiled_json TEXT)"
+        )
+        cur.executemany(
+            "INSERT INTO EmployeeConstraints (kind, scope, value_json) VALUES (?, ?, ?)",
+            [(row["kind"], row["scope"], row["value_json"]) for row in RAW_ROWS],
+        )
+        cur.execute("UPDATE EmployeeConstraints SET compiled_json = '{\"v\": 0}' WHERE id = 1")
+
+        self.assertEqual(compile_stored_constraints(cur), len(RAW_ROWS))
+        self.assertEqual(compile_stored_constraints(cur), 0)
+        stored = json.loads(cur.execute("SELECT compiled_json FROM EmployeeConstraints WHERE id = 2").fetchone()[0])
+        self.assertEqual(stored["blocked_shifts"], ["night"])
+        conn.close()
+
+
+
+class ConstraintImportTests(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.cur = self.conn.cursor()
+        self.cur.executescript(
+            """
+            CREATE TABLE employees (id INTEGER PRIMARY KEY, name TEXT, email TEXT);
+            CREATE TABLE EmployeeConstraints (
+                id INTEGER PRIMARY KEY,
+                employee_id INTEGER,
+                kind TEXT,
+                scope TEXT,
+                value_json TEXT,
+                compiled_json TEXT,
+                valid_from TEXT,
+                valid_to TEXT
+            );
+            INSERT INTO employees (id, name, email) VALUES (1, 'אלי', 'eli@example.com'), (2, 'נועה', NULL);
+            """
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def _import(self, filename, content):
+        upload = UploadFile(file=io.BytesIO(content.encode("utf-8")), filename=filename)
+        return _import_constraints(self.cur, _iter_import_records(upload))
+
+    def test_csv_rows_are_validated_individually(self):
+        result = self._import(
+            "week.csv",
+            "employee_id,email,kind,scope,value,valid_from,valid_to\n"
+            '2,,unavailable,date,"[""2025-03-01""]",,\n'
+            ',ELI@example.com,shift,shift,"{""values"":[""night""],""action"":""block""}",2025-03-01,2025-03-31\n'
+            '7,,unavailable,date,"[""2025-03-01""]",,\n'
+            "2,,note,general,hello,,\n",
+        )
+
+        self.assertEqual(result["imported"], 2)
+        self.assertEqual(result["rejected"], 2)
+        self.assertEqual([item["line"] for item in result["errors"]], [4, 5])
+        self.assertEqual(result["employees"], {1, 2})
+        rows = self.cur.execute(
+            "SELECT employee_id, valid_to, compiled_json FROM EmployeeConstraints ORDER BY id"
+        ).fetchall()
+        self.assertEqual([(row["employee_id"], row["valid_to"]) for row in rows], [(2, None), (1, "2025-03-31")])
+        self.assertEqual(json.loads(rows[1]["compiled_json"])["blocked_shifts"], ["night"])
+
+    def test_json_lines_accept_structured_values(self):
+        result = self._import(
+            "week.jsonl",
+            '{"employee_id": 1, "kind": "unavailable", "scope": "date", "value": {"from": "2025-01-01", "to": "2025-01-31"}}\n'
+            "{broken\n",
+        )
+
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual(result["errors"], [{"line": 2, "error": "שורת JSON לא תקינה"}])
+
+    def test_valid_rows_are_handed_to_the_writer_at_once(self):
+        writes = []
+        upload = UploadFile(
+            file=io.BytesIO(
+                (
+                    "employee_id,kind,scope,value\n"
+                    '1,unavailable,date,"[""2025-03-01""]"\n'
+                    "1,note,general,hello\n"
+                    '2,unavailable,date,"[""2025-03-02""]"\n'
+                    '2,unavailable,date,"[""2025-03-03""]"\n'
+                ).encode("utf-8")
+            ),
+            filename="week.csv",
+        )
+        with mock.patch.object(employee, "IMPORT_BATCH_SIZE", 2):
+            result = _import_constraints(self.cur, _iter_import_records(upload), insert_rows=writes.append)
+
+        self.assertEqual([[row[0] for row in rows] for rows in writes], [[1, 2, 2]])
+        self.assertEqual((result["imported"], result["rejected"]), (3, 1))
+        self.assertEqual(self.cur.execute("SELECT COUNT(*) FROM EmployeeConstraints").fetchone()[0], 0)
+
+    def test_file_broken_after_a_batch_writes_nothing(self):
+        row = '1,unavailable,date,"[""2025-03-01""]"\n'
+        content = ("employee_id,kind,scope,value\n" + row * (employee.IMPORT_BATCH_SIZE + 100)).encode("utf-8")
+        upload = UploadFile(file=io.BytesIO(content + b"\xff\n" + row.encode("utf-8")), filename="week.csv")
+
+        with self.assertRaises(UnicodeDecodeError):
+            _import_constraints(self.cur, _iter_import_records(upload))
+
+        self.assertEqual(self.cur.execute("SELECT COUNT(*) FROM EmployeeConstraints").fetchone()[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,421 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from app import db, migrations, queries
+from app.db import ConnectionPool, PoolTimeout, SerializedWriter, WorkloadExecutors
+
+
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.workdir.name, "pool.db"), max_connections=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.workdir.cleanup()
+
+    def test_connections_are_configured_and_reused(self):
+        conn = self.pool.acquire()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)
+        conn.close()
+        conn.close()
+
+        again = self.pool.acquire()
+        self.assertIs(again, conn)
+        again.close()
+        stats = self.pool.stats()
+        self.assertEqual((stats["created"], stats["checkouts"], stats["idle"]), (1, 2, 1))
+
+    def test_release_rolls_back_uncommitted_work(self):
+        conn = self.pool.acquire()
+        conn.execute("CREATE TABLE items (value INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO items VALUES (1)")
+        conn.close()
+
+        conn = self.pool.acquire()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 0)
+        conn.close()
+
+    def test_checkout_waits_then_times_out(self):
+        first, second = self.pool.acquire(), self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+
+        threading.Timer(0.05, second.close).start()
+        self.assertIs(self.pool.acquire(timeout=2.0), second)
+        first.close()
+        stats = self.pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["in_use"], 1)
+
+    def test_broken_idle_connection_is_replaced(self):
+        self.pool.healthcheck_after = 0
+        conn = self.pool.acquire()
+        conn.close()
+        conn.discard()
+
+        fresh = self.pool.acquire()
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(fresh.execute("SELECT 1").fetchone()[0], 1)
+        fresh.close()
+        self.assertEqual(self.pool.stats()["discarded"], 1)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires fork")
+    def test_forked_child_gets_its_own_pool(self):
+        path = os.path.join(self.workdir.name, "fork.db")
+        setup = db.connect(path)
+        setup.execute("CREATE TABLE items (value INTEGER)")
+        setup.execute("INSERT INTO items VALUES (7)")
+        setup.commit()
+        setup.close()
+
+        parent_pool = db.get_pool(path)
+        parent_conn = db.get_connection(path)
+        parent_conn.close()
+        results = multiprocessing.get_context("fork").Queue()
+
+        def child():
+            conn = db.get_connection(path)
+            try:
+                results.put((
+                    db.get_pool(path) is parent_pool,
+                    conn is parent_conn,
+                    db.get_pool(path).stats()["created"],
+                    conn.execute("SELECT value FROM items").fetchone()[0],
+                ))
+            finally:
+                conn.close()
+                db.close_pools()
+
+        process = multiprocessing.get_context("fork").Process(target=child)
+        process.start()
+        try:
+            self.assertEqual(results.get(timeout=10), (False, False, 1, 7))
+        finally:
+            process.join()
+        self.assertEqual(process.exitcode, 0)
+        # ההורה ממשיך להשתמש במאגר ובחיבור שלו
+        self.assertIs(db.get_connection(path), parent_conn)
+        parent_conn.close()
+        self.assertEqual(parent_pool.stats()["created"], 1)
+        db.close_pools()
+
+
+class SerializedWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "writer.db")
+        self.writer = SerializedWriter(self.path)
+        self.writer.submit(lambda cur: cur.execute("CREATE TABLE items (value INTEGER)")).result()
+
+    def tearDown(self):
+        self.writer.close()
+        self.workdir.cleanup()
+
+    def _values(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return sorted(row[0] for row in conn.execute("SELECT value FROM items"))
+        finally:
+            conn.close()
+
+    def _insert(self, cur, value):
+        cur.execute("INSERT INTO items VALUES (?)", (value,))
+        return value
+
+    def test_queued_jobs_share_one_commit(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocker(cur):
+            started.set()
+            release.wait(5)
+
+        first = self.writer.submit(blocker)
+        started.wait(5)
+        futures = [self.writer.submit(self._insert, value) for value in range(10)]
+        release.set()
+
+        self.assertEqual([future.result(5) for future in futures], list(range(10)))
+        first.result(5)
+        self.assertEqual(self._values(), list(range(10)))
+        stats = self.writer.stats()
+        self.assertEqual(stats["largest_batch"], 10)
+        self.assertEqual(stats["batches"], 3)
+
+    def test_failing_job_is_rolled_back_alone(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocker(cur):
+            started.set()
+            release.wait(5)
+
+        def broken(cur):
+            cur.execute("INSERT INTO items VALUES (99)")
+            raise ValueError("boom")
+
+        self.writer.submit(blocker)
+        started.wait(5)
+        futures = [self.writer.submit(self._insert, 1), self.writer.submit(broken), self.writer.submit(self._insert, 2)]
+        release.set()
+
+        self.assertEqual(futures[0].result(5), 1)
+        with self.assertRaises(ValueError):
+            futures[1].result(5)
+        self.assertEqual(futures[2].result(5), 2)
+        self.assertEqual(self._values(), [1, 2])
+        self.assertEqual(self.writer.stats()["failed"], 1)
+
+    def test_concurrent_writers_do_not_hit_lock_errors(self):
+        errors = []
+
+        def worker(offset):
+            try:
+                for value in range(offset, offset + 50):
+                    self.writer.submit(self._insert, value).result(10)
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=worker, args=(index * 50,)) for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self._values(), list(range(400)))
+
+    def test_job_cannot_submit_nested_write(self):
+        with self.assertRaises(RuntimeError):
+            self.writer.submit(lambda cur: self.writer.submit(self._insert, 1)).result(5)
+
+    def test_read_pool_is_read_only(self):
+        pool = ConnectionPool(self.path, readonly=True)
+        conn = pool.acquire()
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                conn.execute("INSERT INTO items VALUES (1)")
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM items").fetchone()[0], 0)
+        finally:
+            conn.close()
+            pool.close()
+
+
+class WorkloadExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.executors = WorkloadExecutors({"reports": 2, "interactive": 2})
+
+    def tearDown(self):
+        self.executors.shutdown()
+
+    def test_workload_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        running = {"now": 0, "peak": 0}
+
+        def work():
+            with lock:
+                running["now"] += 1
+                running["peak"] = max(running["peak"], running["now"])
+            threading.Event().wait(0.02)
+            with lock:
+                running["now"] -= 1
+            return True
+
+        async def scenario():
+            return await asyncio.gather(*(self.executors.run("reports", work) for _ in range(8)))
+
+        self.assertEqual(asyncio.run(scenario()), [True] * 8)
+        self.assertEqual(running["peak"], 2)
+        stats = self.executors.stats()["reports"]
+        self.assertEqual((stats["completed"], stats["queued"], stats["max_workers"]), (8, 0, 2))
+
+    def test_saturated_workload_does_not_block_another(self):
+        release = threading.Event()
+
+        async def scenario():
+            slow = [asyncio.ensure_future(self.executors.run("reports", release.wait, 5)) for _ in range(4)]
+            await asyncio.sleep(0.05)
+            quick = await asyncio.wait_for(self.executors.run("interactive", lambda: "ok"), timeout=1)
+            self.assertEqual(self.executors.stats()["reports"]["queued"], 2)
+            release.set()
+            await asyncio.gather(*slow)
+            return quick
+
+        self.assertEqual(asyncio.run(scenario()), "ok")
+
+    def test_unknown_workload_is_rejected(self):
+        with self.assertRaises(KeyError):
+            asyncio.run(self.executors.run("batch", lambda: None))
+
+    def test_run_db_returns_connection_to_pool(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "async.db")
+            previous, db.DB_PATH = db.DB_PATH, path
+            try:
+                value = asyncio.run(db.run_db("interactive", lambda conn, x: conn.execute("SELECT ?", (x,)).fetchone()[0], 7))
+                self.assertEqual(value, 7)
+                self.assertEqual(db.get_pool(path).stats()["in_use"], 0)
+            finally:
+                db.get_pool(path).close()
+                db.DB_PATH = previous
+
+
+# שאילתות המאגר שקוראות את כל הטבלה במכוון (רשימות ודף הבית)
+FULL_SCAN_QUERIES = {
+    "schedule_overview",
+    "employee_list",
+    "active_employees",
+    "project_names",
+    "project_options",
+    "projects_dashboard_rows",
+    "active_project_requirements",
+}
+
+# השאילתות החמות שחייבות לרוץ על אינדקס: כל המאגר פרט לרשימות
+HOT_QUERIES = {name: queries.sql(name) for name in queries.QUERIES if name not in FULL_SCAN_QUERIES}
+
+CHECKED_TABLES = {"shifts", "ShiftAssignments", "EmployeeConstraints", "employees", "projects"}
+_TABLE_REFERENCE = re.compile(r"(?:FROM|JOIN)\s+(\w+)(?:\s+(?!ON\b|WHERE\b)(\w+))?")
+
+
+class QueryPlanTests(unittest.TestCase):
+    def test_hot_queries_use_indexes(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "plan.db")
+            previous, db.DB_PATH = db.DB_PATH, path
+            try:
+                db.init_db()
+
+                def explain(cur):
+                    # השלב הזמני נוצר רק על חיבור הכתיבה, שם גם רצה השמירה עצמה
+                    queries.execute(cur, "plan_stage_create")
+                    return {
+                        name: cur.execute(f"EXPLAIN QUERY PLAN {sql}", [None] * sql.count("?")).fetchall()
+                        for name, sql in HOT_QUERIES.items()
+                    }
+
+                try:
+                    plans = db.write(explain)
+                finally:
+                    db.get_writer(path).close()
+                    db.get_pool(path).close()
+                for name, sql in HOT_QUERIES.items():
+                    checked = {
+                        alias or table
+                        for table, alias in _TABLE_REFERENCE.findall(sql)
+                        if table in CHECKED_TABLES
+                    }
+                    scans = [
+                        row[3] for row in plans[name]
+                        if row[3].startswith("SCAN ") and row[3].split()[1] in checked
+                    ]
+                    self.assertFalse(scans, f"{name}: {scans}")
+            finally:
+                db.DB_PATH = previous
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.workdir.name, "migrate.db")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def _user_version(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return migrations.schema_version(conn)
+        finally:
+            conn.close()
+
+    def test_fresh_database_is_migrated_once(self):
+        applied = migrations.migrate(self.path)
+        self.assertEqual(applied, [version for version, _, _ in migrations.MIGRATIONS])
+        self.assertEqual(self._user_version(), migrations.SCHEMA_VERSION)
+        self.assertEqual(migrations.migrate(self.path), [])
+        migrations.require_current_schema(self.path)
+
+    def test_migrations_build_the_managed_indexes(self):
+        # המיגרציות מחזיקות DDL קפוא; שינוי ב-MANAGED_INDEXES בלי מיגרציה חדשה נכשל כאן
+        migrations.migrate(self.path)
+        conn = sqlite3.connect(self.path)
+        try:
+            indexes = dict(
+                conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx%'")
+            )
+        finally:
+            conn.close()
+        self.assertEqual(
+            indexes,
+            {name: f"CREATE INDEX {name} ON {definition}" for name, definition in db.MANAGED_INDEXES.items()},
+        )
+
+    def test_unversioned_legacy_database_is_upgraded(self):
+        conn = sqlite3.connect(self.path)
+        conn.executescript(
+            """
+            CREATE TABLE employees (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+            CREATE TABLE projects (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+            CREATE TABLE shifts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER, date TEXT,
+                start_time TEXT, end_time TEXT, employee_id INTEGER
+            );
+            CREATE TABLE EmployeeConstraints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, employee_id INTEGER NOT NULL, kind TEXT NOT NULL,
+                scope TEXT NOT NULL, value_json TEXT NOT NULL, valid_from TEXT, valid_to TEXT
+            );
+            INSERT INTO employees (name) VALUES ('דנה');
+            INSERT INTO shifts (project_id, date, start_time, end_time, employee_id)
+                VALUES (1, '2024-01-01', '07:00', '15:00', 1);
+            INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json)
+                VALUES (1, 'block', 'date', '{"date": "2024-01-02"}');
+            """
+        )
+        conn.close()
+        with self.assertRaises(RuntimeError):
+            migrations.require_current_schema(self.path)
+
+        migrations.migrate(self.path)
+
+        conn = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(conn.execute("SELECT shift_id, employee_id FROM ShiftAssignments").fetchall(), [(1, 1)])
+            self.assertEqual(conn.execute("SELECT is_admin, active FROM employees").fetchone(), (0, 1))
+            self.assertIsNotNone(conn.execute("SELECT compiled_json FROM EmployeeConstraints").fetchone()[0])
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue(set(db.MANAGED_INDEXES) <= indexes)
+        finally:
+            conn.close()
+        self.assertEqual(self._user_version(), migrations.SCHEMA_VERSION)
+
+    def test_failed_migration_leaves_version_unchanged(self):
+        def broken(cur):
+            cur.execute("CREATE TABLE half_done (id INTEGER)")
+            raise sqlite3.OperationalError("boom")
+
+        original = migrations.MIGRATIONS
+        migrations.MIGRATIONS = original[:1] + [(2, "broken", broken)]
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                migrations.migrate(self.path)
+        finally:
+            migrations.MIGRATIONS = original
+        conn = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(migrations.schema_version(conn), 1)
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.assertNotIn("half_done", tables)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import time
+import unittest
+
+from app.jobs import JobCancelled, JobManager
+
+
+def _count_job(limit, progress, cancel):
+    for step in range(limit):
+        if cancel.is_set():
+            raise JobCancelled()
+        progress["step"] = step + 1
+        time.sleep(0.01)
+    return {"steps": limit}
+
+
+def _wait_for(manager, job_id, statuses, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = manager.status(job_id)
+        if info["status"] in statuses:
+            return info
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+
+class JobManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.manager = JobManager(max_workers=1)
+
+    def tearDown(self):
+        self.manager.shutdown()
+
+    def test_result_is_kept_after_completion(self):
+        job_id = self.manager.submit(_count_job, 3, description="count")
+        info = _wait_for(self.manager, job_id, {"done"})
+        self.assertEqual(info["result"], {"steps": 3})
+        self.assertEqual(info["progress"]["step"], 3)
+        self.assertEqual(self.manager.status(job_id)["result"], {"steps": 3})
+
+    def test_running_job_can_be_cancelled(self):
+        job_id = self.manager.submit(_count_job, 10_000)
+        _wait_for(self.manager, job_id, {"running"})
+        self.assertTrue(self.manager.cancel(job_id))
+        info = _wait_for(self.manager, job_id, {"cancelled"})
+        self.assertIsNone(info["result"])
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.manager.status("missing"))
+        self.assertFalse(self.manager.cancel("missing"))
+
+
+if __name__ == "__main__":
+    unittest.main()
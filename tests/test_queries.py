@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from app import db, migrations, queries
+from app.queries import QueryTimings
+
+
+class QueryRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.workdir.name, "queries.db")
+        migrations.migrate(path)
+        self.conn = db.connect(path)
+        self.conn.executemany(
+            "INSERT INTO projects (name, hourly_rate, active) VALUES (?, 10, 1)",
+            [("גשר",), ("אתר",), ("מגדל",)],
+        )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        self.workdir.cleanup()
+
+    def test_every_statement_prepares_with_fixed_text(self):
+        queries.execute(self.conn.cursor(), "plan_stage_create")
+        for name in queries.QUERIES:
+            text = queries.sql(name)
+            self.assertNotIn("{", text, name)
+            self.conn.execute(f"EXPLAIN {text}", [None] * text.count("?"))
+        self.assertEqual(
+            queries.sql("admin_report_rows", shifts="(SELECT 1)", assignments="(SELECT 2)").count("(SELECT"), 3
+        )
+
+    def test_id_lists_bind_as_one_parameter(self):
+        cur = self.conn.cursor()
+
+        def names(ids):
+            return [row["name"] for row in queries.fetch_all(cur, "projects_by_ids", (queries.id_list(ids),))]
+
+        self.assertEqual(names([]), [])
+        self.assertEqual(names([2]), ["אתר"])
+        self.assertEqual(names([3, 1, 99]), ["גשר", "מגדל"])
+        self.assertEqual(queries.id_list(["3", 1]), "[3, 1]")
+
+    def test_open_date_bounds_leave_out_undated_shifts(self):
+        self.conn.executemany(
+            "INSERT INTO shifts (project_id, date, start_time, end_time) VALUES (1, ?, '06:00', '14:00')",
+            [("2025-01-05",), (None,)],
+        )
+        rows = queries.fetch_all(
+            self.conn.cursor(), "business_overview_rows", (queries.DATE_MIN, queries.DATE_MAX)
+        )
+        # משמרת ללא תאריך אינה נספרת במכוון: אין לה שעות וחיפוש הטווח נשאר על האינדקס
+        self.assertEqual([row["date"] for row in rows], ["2025-01-05"])
+
+    def test_timings_are_recorded_per_statement(self):
+        timings = QueryTimings()
+        timings.record("fast", 0.001, rows=2)
+        timings.record("slow", 0.010, rows=1)
+        timings.record("fast", 0.003, rows=3)
+        stats = timings.stats()
+        self.assertEqual(list(stats), ["slow", "fast"])
+        self.assertEqual((stats["fast"]["calls"], stats["fast"]["rows"]), (2, 5))
+        self.assertAlmostEqual(stats["fast"]["avg_ms"], 2.0)
+        self.assertAlmostEqual(stats["fast"]["max_ms"], 3.0)
+
+        before = queries.query_timings.stats().get("project_names", {}).get("calls", 0)
+        queries.fetch_all(self.conn.cursor(), "project_names")
+        self.assertEqual(queries.query_timings.stats()["project_names"]["calls"], before + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
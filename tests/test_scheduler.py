@@ -1,8 +1,26 @@
+import itertools
+import json
+import os
+import random
 import sqlite3
+import tempfile
 import unittest
 from datetime import datetime
+from unittest import mock
 
+from app import db
 from app.routes import admin
+from app.scheduler import (
+    OPTIMAL_DISLIKED_COST,
+    OPTIMAL_LOAD_COST,
+    OPTIMAL_NOT_PREFERRED_COST,
+    AvailabilityMatrix,
+    CandidateQueue,
+    WorkHoursTracker,
+    improve_schedule,
+    plan_day_optimal,
+)
+from app.utils import ConstraintTimeline, build_constraint_profile, constraint_allows_date, constraint_allows_shift, date_ordinal
 
 
 def setup_in_memory_db():
@@ -31,6 +49,7 @@ def setup_in_memory_db():
             kind TEXT,
             scope TEXT,
             value_json TEXT,
+            compiled_json TEXT,
             valid_from TEXT,
             valid_to TEXT
         );
@@ -47,6 +66,11 @@ def setup_in_memory_db():
             employee_id INTEGER,
             PRIMARY KEY (shift_id, employee_id)
         );
+        CREATE TABLE ShiftArchives (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            archived_before TEXT NOT NULL
+        );
         """
     )
     conn.commit()
@@ -133,6 +157,669 @@ class SchedulerTests(unittest.TestCase):
         self.assertEqual(result["total_assignments"], 0)
         self.assertTrue(result["warnings"])
 
+    def test_optimal_mode_covers_slots_greedy_misses(self):
+        morning_only = {
+            "kind": "shift",
+            "scope": "shift",
+            "value_json": '{"values":["morning"],"action":"allow"}'
+        }
+        constraints_map = {self.employees[1]["id"]: [morning_only]}
+        requirements = {"morning": 1, "afternoon": 0, "night": 1}
+        day = datetime.strptime("2025-11-06", "%Y-%m-%d")
+
+        greedy = admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, constraints_map, day, day, requirements, "אתר מבחן"
+        )
+        self.conn.rollback()
+        optimal = admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, constraints_map, day, day, requirements, "אתר מבחן",
+            mode="optimal",
+        )
+
+        self.assertEqual(greedy["total_assignments"], 1)
+        self.assertTrue(greedy["warnings"])
+        self.assertEqual(optimal["total_assignments"], 2)
+        self.assertFalse(optimal["warnings"])
+        by_shift = {row["shift"]: row["employee"] for row in optimal["assignments_created"]}
+        self.assertEqual(by_shift["בוקר"], self.employees[1]["name"])
+        self.assertEqual(by_shift["לילה"], self.employees[0]["name"])
+
+    def test_batch_generation_shares_load_across_projects(self):
+        self.cur.execute(
+            "INSERT INTO projects (name, hourly_rate, active, morning_required, afternoon_required, night_required) VALUES (?, ?, 1, 1, 0, 0)",
+            ("אתר שני", 40.0),
+        )
+        projects = self.cur.execute("SELECT * FROM projects ORDER BY name").fetchall()
+        start_dt = datetime.strptime("2025-11-09", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-10", "%Y-%m-%d")
+
+        result = admin._generate_schedule_batch(
+            self.cur, projects, self.employees, {}, start_dt, end_dt
+        )
+
+        self.assertEqual(result["total_assignments"], 4)
+        self.assertEqual(result["warnings_count"], 0)
+        worked = self.cur.execute(
+            """
+            SELECT sa.employee_id, s.date, COUNT(*) AS total
+            FROM ShiftAssignments sa
+            INNER JOIN shifts s ON s.id = sa.shift_id
+            GROUP BY sa.employee_id, s.date
+            """
+        ).fetchall()
+        self.assertEqual(len(worked), 4)
+        self.assertTrue(all(row["total"] == 1 for row in worked))
+
+    def test_parallel_batch_gives_each_project_its_own_staff(self):
+        self.cur.execute(
+            "INSERT INTO projects (name, hourly_rate, active, morning_required, afternoon_required, night_required) VALUES (?, ?, 1, 1, 0, 0)",
+            ("אתר שני", 40.0),
+        )
+        projects = self.cur.execute("SELECT * FROM projects ORDER BY name").fetchall()
+        start_dt = datetime.strptime("2025-11-16", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-17", "%Y-%m-%d")
+
+        executor = admin.plan_executors.get(2)
+        result = admin._generate_schedule_batch(
+            self.cur, projects, self.employees, {}, start_dt, end_dt, workers=2
+        )
+
+        self.assertIs(admin.plan_executors.get(2), executor)
+        self.assertEqual(result["total_assignments"], 4)
+        self.assertEqual(result["warnings_count"], 0)
+        self.assertEqual(result["conflicts_resolved"], 0)
+        by_project = {
+            item["project"]["id"]: {row["employee_id"] for row in item["assignments_created"]}
+            for item in result["projects"]
+        }
+        self.assertEqual(by_project[projects[0]["id"]], {self.employees[0]["id"]})
+        self.assertEqual(by_project[projects[1]["id"]], {self.employees[1]["id"]})
+
+    def test_batch_is_persisted_in_one_write(self):
+        self.cur.execute(
+            "INSERT INTO projects (name, hourly_rate, active, morning_required, afternoon_required, night_required) VALUES (?, ?, 1, 1, 0, 0)",
+            ("אתר שני", 40.0),
+        )
+        projects = self.cur.execute("SELECT * FROM projects ORDER BY name").fetchall()
+        start_dt = datetime.strptime("2025-11-20", "%Y-%m-%d")
+        calls = []
+
+        def write_plans(items):
+            calls.append([project_id for project_id, _, _ in items])
+            return admin._persist_schedule_plans(self.cur, items)
+
+        result = admin._generate_schedule_batch(
+            self.cur, projects, self.employees, {}, start_dt, start_dt, write_plans=write_plans
+        )
+
+        self.assertEqual(calls, [[project["id"] for project in projects]])
+        self.assertEqual(result["total_assignments"], 2)
+
+    def test_failed_batch_write_keeps_nothing(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            previous, db.DB_PATH = db.DB_PATH, os.path.join(workdir, "batch.db")
+            try:
+                db.init_db()
+                conn = db.connect()
+                conn.execute("INSERT INTO projects (name) VALUES ('א')")
+                conn.execute("INSERT INTO employees (name, active) VALUES ('אלי', 1)")
+                conn.commit()
+                row = {"date": "2025-11-20", "shift_key": "morning", "employee_id": 1}
+                with self.assertRaises(KeyError):
+                    admin._write_schedule_plans([(1, "א", [row]), (1, "א", [dict(row, shift_key="bogus")])])
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM shifts").fetchone()[0], 0)
+                conn.close()
+            finally:
+                db.close_pools()
+                db.DB_PATH = previous
+
+    def test_reconcile_replaces_double_booked_employee(self):
+        date_list = ["2025-11-18"]
+        state = admin._build_generation_state(self.cur, self.employees, {}, date_list)
+        first, second = self.employees[0]["id"], self.employees[1]["id"]
+
+        def _plan(project_id):
+            row = {"date": "2025-11-18", "shift_key": "morning", "shift": "בוקר",
+                   "employee_id": first, "employee": "אלי", "hours": 8.0}
+            coverage = {"required": 1, "filled": 1, "percent": 100.0,
+                        "by_shift": {"morning": {"label": "בוקר", "required": 1, "filled": 1}}}
+            return {"project_id": project_id, "assignments": [row], "warnings": [], "coverage": coverage}
+
+        plans = [_plan(1), _plan(2), _plan(3)]
+        conflicts = admin._reconcile_project_plans(plans, state)
+
+        self.assertEqual(conflicts, 2)
+        self.assertEqual([row["employee_id"] for row in plans[0]["assignments"]], [first])
+        self.assertEqual([row["employee_id"] for row in plans[1]["assignments"]], [second])
+        self.assertEqual(plans[2]["assignments"], [])
+        self.assertEqual(len(plans[2]["warnings"]), 1)
+        self.assertEqual(plans[2]["coverage"]["filled"], 0)
+
+    def test_time_scoped_constraint_applies_only_within_validity(self):
+        scoped_block = {
+            "kind": "shift",
+            "scope": "shift",
+            "value_json": '{"values":["morning"],"action":"block"}',
+            "valid_from": "2025-11-20",
+            "valid_to": "2025-11-21",
+        }
+        constraints_map = {self.employees[0]["id"]: [scoped_block]}
+        start_dt = datetime.strptime("2025-11-19", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-22", "%Y-%m-%d")
+
+        result = admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, constraints_map, start_dt, end_dt,
+            {"morning": 1, "afternoon": 0, "night": 0}, "אתר מבחן",
+        )
+
+        first_dates = [
+            row["date"] for row in result["assignments_created"] if row["employee_id"] == self.employees[0]["id"]
+        ]
+        self.assertEqual(first_dates, ["2025-11-19", "2025-11-22"])
+        self.assertFalse(result["warnings"])
+
+    def test_plan_preview_writes_nothing_until_persisted(self):
+        start_dt = datetime.strptime("2025-11-11", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-12", "%Y-%m-%d")
+        date_list = admin._date_range(start_dt, end_dt)
+        changes_before = self.conn.total_changes
+
+        state = admin._build_generation_state(self.cur, self.employees, {}, date_list)
+        plan = admin._plan_schedule_for_project(
+            self.project, {"morning": 1, "afternoon": 1, "night": 0}, date_list, state
+        )
+
+        self.assertEqual(self.conn.total_changes, changes_before)
+        self.assertEqual(plan["coverage"]["required"], 4)
+        self.assertEqual(plan["coverage"]["filled"], 4)
+
+        persisted = admin._persist_schedule_plan(self.cur, self.project["id"], "אתר מבחן", plan["assignments"])
+        self.assertEqual(persisted, {"assignments": 4, "shifts": 4})
+        self.assertEqual(self.cur.execute("SELECT COUNT(*) FROM ShiftAssignments").fetchone()[0], 4)
+
+    def test_repair_replaces_only_conflicting_assignments(self):
+        start_dt = datetime.strptime("2025-11-13", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-14", "%Y-%m-%d")
+        admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, {}, start_dt, end_dt,
+            {"morning": 1, "afternoon": 0, "night": 0}, "אתר מבחן",
+        )
+        sick_employee = self.employees[0]["id"]
+        self.cur.execute(
+            "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'unavailable', 'date', ?)",
+            (sick_employee, '["2025-11-13"]'),
+        )
+
+        diff = admin._repair_employee_schedule(self.cur, sick_employee, start_dt, end_dt)
+
+        self.assertEqual([row["date"] for row in diff["removed"]], ["2025-11-13"])
+        self.assertEqual(len(diff["added"]), 1)
+        self.assertEqual(diff["added"][0]["employee_id"], self.employees[1]["id"])
+        self.assertEqual(diff["added"][0]["shift_id"], diff["removed"][0]["shift_id"])
+        rows = self.cur.execute(
+            """
+            SELECT s.date, sa.employee_id
+            FROM ShiftAssignments sa
+            INNER JOIN shifts s ON s.id = sa.shift_id
+            ORDER BY s.date
+            """
+        ).fetchall()
+        self.assertEqual(
+            [(row["date"], row["employee_id"]) for row in rows],
+            [("2025-11-13", self.employees[1]["id"]), ("2025-11-14", self.employees[1]["id"])],
+        )
+
+    def test_repair_diff_is_rejected_when_assignments_changed(self):
+        start_dt = datetime.strptime("2025-11-13", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-13", "%Y-%m-%d")
+        admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, {}, start_dt, end_dt,
+            {"morning": 1, "afternoon": 0, "night": 0}, "אתר מבחן",
+        )
+        sick_employee = self.employees[0]["id"]
+        self.cur.execute(
+            "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, 'unavailable', 'date', ?)",
+            (sick_employee, '["2025-11-13"]'),
+        )
+        changes_before = self.conn.total_changes
+        diff = admin._plan_employee_repair(self.cur, sick_employee, start_dt, end_dt)
+        self.assertEqual(self.conn.total_changes, changes_before)
+        self.assertEqual(len(diff["added"]), 1)
+
+        # בין התכנון להחלה העובד החלופי שובץ למשמרת אחרת באותו יום
+        self.cur.execute(
+            "INSERT INTO shifts (project_id, date, start_time, end_time) VALUES (?, '2025-11-13', '14:00', '22:00')",
+            (self.project["id"],),
+        )
+        self.cur.execute(
+            "INSERT INTO ShiftAssignments (shift_id, employee_id) VALUES (?, ?)",
+            (self.cur.lastrowid, diff["added"][0]["employee_id"]),
+        )
+        with self.assertRaises(admin.RepairConflict):
+            admin._apply_employee_repair(self.cur, diff)
+        self.assertIsNotNone(
+            self.cur.execute(
+                "SELECT 1 FROM ShiftAssignments WHERE shift_id = ? AND employee_id = ?",
+                (diff["removed"][0]["shift_id"], sick_employee),
+            ).fetchone()
+        )
+
+    def test_improvement_fills_slot_greedy_left_empty(self):
+        morning_only = {
+            "kind": "shift",
+            "scope": "shift",
+            "value_json": '{"values":["morning"],"action":"allow"}'
+        }
+        constraints_map = {self.employees[1]["id"]: [morning_only]}
+        date_list = ["2025-11-15"]
+        state = admin._build_generation_state(self.cur, self.employees, constraints_map, date_list)
+
+        plan = admin._plan_schedule_for_project(
+            self.project, {"morning": 1, "afternoon": 0, "night": 1}, date_list, state,
+            improve_seconds=0.2,
+        )
+
+        self.assertEqual(plan["coverage"]["filled"], 2)
+        self.assertFalse(plan["warnings"])
+        self.assertLess(plan["improvement"]["score_after"], plan["improvement"]["score_before"])
+        self.assertEqual(sum(state.employee_load.values()), 2)
+
+    def test_improvement_delta_score_matches_full_rescore(self):
+        rng = random.Random(5)
+        employees = [{"id": emp_id, "name": f"עובד {emp_id}"} for emp_id in range(1, 13)]
+        constraints_map = {
+            row["id"]: [{
+                "kind": "shift",
+                "scope": "shift",
+                "value_json": json.dumps({"values": [rng.choice(["morning", "night"])], "priority": rng.choice(["preferred", "avoid"])}),
+            }]
+            for row in employees
+            if rng.random() < 0.6
+        }
+        date_list = [f"2025-12-{day:02d}" for day in range(1, 8)]
+        state = admin._build_generation_state(self.cur, employees, constraints_map, date_list)
+        plan = admin._plan_schedule_for_project(
+            self.project, {"morning": 3, "afternoon": 2, "night": 2}, date_list, state
+        )
+        slots = [(row["date"], row["shift_key"], row["employee_id"]) for row in plan["assignments"]]
+
+        improved, stats = improve_schedule(slots, state, time_budget=5, max_moves=20000, seed=3)
+        _, rescored = improve_schedule(improved, state, time_budget=0, max_moves=0)
+
+        self.assertLessEqual(stats["score_after"], stats["score_before"])
+        self.assertEqual(stats["score_after"], rescored["score_before"])
+        for date_str in date_list:
+            working = [employee_id for day, _, employee_id in improved if day == date_str]
+            self.assertEqual(len(working), len(set(working)))
+
+    def _book(self, employee_id, date_str, shift_key):
+        template = admin.SHIFT_TEMPLATES[shift_key]
+        self.cur.execute(
+            "INSERT INTO shifts (project_id, date, start_time, end_time, location) VALUES (?, ?, ?, ?, ?)",
+            (self.project["id"], date_str, template["start"], template["end"], "אתר מבחן"),
+        )
+        self.cur.execute(
+            "INSERT INTO ShiftAssignments (shift_id, employee_id) VALUES (?, ?)",
+            (self.cur.lastrowid, employee_id),
+        )
+
+    def test_night_shift_blocks_next_morning(self):
+        first = self.employees[0]
+        self._book(first["id"], "2025-11-09", "night")
+        day = datetime.strptime("2025-11-10", "%Y-%m-%d")
+
+        alone = admin._generate_schedule_for_project(
+            self.cur, self.project, [first], {}, day, day, {"morning": 1}, "אתר מבחן"
+        )
+        self.conn.rollback()
+        self._book(first["id"], "2025-11-09", "night")
+        both = admin._generate_schedule_for_project(
+            self.cur, self.project, self.employees, {}, day, day, {"morning": 1}, "אתר מבחן"
+        )
+
+        self.assertEqual(alone["total_assignments"], 0)
+        self.assertTrue(alone["warnings"])
+        self.assertEqual(both["assignments_created"][0]["employee"], self.employees[1]["name"])
+
+    def test_zero_limits_disable_rest_and_hours_checks(self):
+        first = self.employees[0]
+        self._book(first["id"], "2025-11-09", "night")
+        day = datetime.strptime("2025-11-10", "%Y-%m-%d")
+
+        with mock.patch.object(admin, "MIN_REST_HOURS", 0), mock.patch.object(admin, "MAX_HOURS_PER_WINDOW", 0):
+            result = admin._generate_schedule_for_project(
+                self.cur, self.project, [first], {}, day, day, {"morning": 1}, "אתר מבחן"
+            )
+
+        self.assertEqual(result["total_assignments"], 1)
+
+    def test_removing_a_shift_keeps_other_shifts_that_day(self):
+        shift_times = {key: (template["start"], template["end"]) for key, template in admin.SHIFT_TEMPLATES.items()}
+        tracker = WorkHoursTracker(
+            1, ["2025-11-10", "2025-11-11"], shift_times, 8, 0, 7,
+            existing=[(0, "2025-11-10", "18:00", "23:00")],
+        )
+        tracker.add(0, "2025-11-10", "morning")
+        tracker.remove(0, "2025-11-10", "morning")
+        tracker.remove(0, "2025-11-10", "morning")
+
+        # המשמרת הידנית עד 23:00 עדיין חוסמת את הבוקר שלמחרת
+        self.assertFalse(tracker.allows(0, "2025-11-11", "morning"))
+        self.assertTrue(tracker.allows(0, "2025-11-11", "afternoon"))
+
+    def test_commit_revalidates_plan_against_constraints_and_limits(self):
+        first, second = self.employees[0]["id"], self.employees[1]["id"]
+        self._book(first, "2025-11-09", "night")
+        constraints_map = {
+            second: [{"kind": "unavailable", "scope": "date", "value_json": '["2025-11-11"]'}],
+        }
+        plan = [
+            ["2025-11-10", "morning", first],
+            ["2025-11-10", "morning", second],
+            ["2025-11-11", "morning", second],
+            ["2025-11-12", "morning", second],
+            ["2025-11-12", "night", second],
+        ]
+
+        assignments, warnings = admin._validate_plan_rows(self.cur, plan, self.employees, constraints_map)
+
+        self.assertEqual(
+            [(row["date"], row["employee_id"]) for row in assignments],
+            [("2025-11-10", second), ("2025-11-12", second)],
+        )
+        self.assertEqual(len(warnings), 3)
+
+    def test_rolling_window_caps_weekly_hours(self):
+        first = self.employees[0]
+        for day_number in range(3, 9):
+            self._book(first["id"], f"2025-11-0{day_number}", "morning")
+        start_dt = datetime.strptime("2025-11-09", "%Y-%m-%d")
+        end_dt = datetime.strptime("2025-11-10", "%Y-%m-%d")
+
+        result = admin._generate_schedule_for_project(
+            self.cur, self.project, [first], {}, start_dt, end_dt, {"morning": 1}, "אתר מבחן"
+        )
+
+        # שש משמרות של 8 שעות כבר ממלאות את תקרת 48 השעות בשבוע של 9.11,
+        # וב-10.11 החלון כבר לא כולל את 3.11
+        self.assertEqual([row["date"] for row in result["assignments_created"]], ["2025-11-10"])
+
+    def test_conflict_analysis_counts_rejection_reasons(self):
+        self.cur.executemany("INSERT INTO employees (name, active) VALUES (?, 1)", [("דנה",), ("יוסי",)])
+        blocked_shift, blocked_date, rested, working = [
+            row["id"] for row in self.cur.execute("SELECT id FROM employees ORDER BY id").fetchall()
+        ]
+        self.cur.executemany(
+            "INSERT INTO EmployeeConstraints (employee_id, kind, scope, value_json) VALUES (?, ?, ?, ?)",
+            [
+                (blocked_shift, "shift", "shift", '{"values":["morning"],"action":"block"}'),
+                (blocked_date, "unavailable", "date", '["2025-11-12"]'),
+            ],
+        )
+        self._book(rested, "2025-11-11", "night")
+        self._book(working, "2025-11-12", "afternoon")
+
+        analysis = admin._analyze_uncovered_slots(self.cur, self.project, ["2025-11-12"])
+
+        self.assertEqual(len(analysis["slots"]), 1)
+        slot = analysis["slots"][0]
+        self.assertEqual((slot["shift_key"], slot["missing"]), ("morning", 1))
+        self.assertEqual(
+            slot["reasons"],
+            {
+                "working": 1,
+                "blocked_date": 1,
+                "blocked_shift": 1,
+                "not_allowed": 0,
+                "disliked": 0,
+                "rest_hours": 1,
+                "available": 0,
+            },
+        )
+
+    def test_heatmap_counts_eligible_staff_and_caches_until_constraints_change(self):
+        from app.constraint_cache import coverage_cache
+
+        first, second = self.employees[0]["id"], self.employees[1]["id"]
+        self.cur.executemany(
+            "INSERT INTO EmployeeConstraints (id, employee_id, kind, scope, value_json) VALUES (?, ?, ?, ?, ?)",
+            [
+                (1, first, "shift", "shift", '{"values":["morning"],"action":"block"}'),
+                (2, second, "unavailable", "date", '["2025-11-13"]'),
+            ],
+        )
+        dates = ["2025-11-12", "2025-11-13"]
+
+        heatmap = admin._availability_heatmap(self.cur, self.project, dates)
+        morning = [day["cells"][0] for day in heatmap["days"]]
+        night = [day["cells"][2] for day in heatmap["days"]]
+        self.assertEqual([cell["eligible"] for cell in morning], [1, 0])
+        self.assertEqual([cell["short"] for cell in morning], [False, True])
+        self.assertEqual([cell["eligible"] for cell in night], [2, 1])
+        self.assertEqual(heatmap["gaps"], 1)
+
+        hits = coverage_cache.hits
+        admin._availability_heatmap(self.cur, self.project, dates)
+        self.assertEqual(coverage_cache.hits, hits + 1)
+
+        self.cur.execute("DELETE FROM EmployeeConstraints WHERE id = 2")
+        refreshed = admin._availability_heatmap(self.cur, self.project, dates)
+        self.assertEqual(coverage_cache.hits, hits + 1)
+        self.assertEqual(refreshed["gaps"], 0)
+
+
+class CandidateQueueTests(unittest.TestCase):
+    def test_matches_sorted_candidate_order(self):
+        rng = random.Random(7)
+        shift_keys = ["morning", "afternoon", "night"]
+        employees = [
+            {"id": emp_id, "name": rng.choice(["אבי", "בני", "גלי", "דנה"])}
+            for emp_id in range(1, 41)
+        ]
+        preferred_map = {row["id"]: set(rng.sample(shift_keys, rng.randint(0, 2))) for row in employees}
+        disliked_map = {row["id"]: set(rng.sample(shift_keys, rng.randint(0, 1))) for row in employees}
+        legacy_load = {row["id"]: rng.randint(0, 2) for row in employees}
+        queue_load = dict(legacy_load)
+        queue = CandidateQueue(employees, shift_keys, queue_load, preferred_map, disliked_map)
+        names = {row["id"]: row["name"] for row in employees}
+
+        for _ in range(300):
+            shift_key = rng.choice(shift_keys)
+            busy = set(rng.sample(list(names), 15))
+            ordered = sorted(
+                names,
+                key=lambda emp_id: (
+                    legacy_load[emp_id],
+                    0 if shift_key in preferred_map[emp_id] else 1,
+                    1 if shift_key in disliked_map[emp_id] else 0,
+                    names[emp_id],
+                ),
+            )
+            expected = next(
+                (
+                    emp_id
+                    for emp_id in ordered
+                    if emp_id not in busy
+                    and not (shift_key in disliked_map[emp_id] and shift_key not in preferred_map[emp_id])
+                ),
+                None,
+            )
+            chosen = queue.select(shift_key, lambda emp_id: emp_id not in busy)
+            self.assertEqual(chosen, expected)
+            if chosen is not None:
+                legacy_load[chosen] += 1
+                queue.record_assignment(chosen)
+
+        self.assertEqual(queue_load, legacy_load)
+
+    def test_preferred_employees_are_served_first_at_real_loads(self):
+        employees = [{"id": 1, "name": "אבי"}, {"id": 2, "name": "בני"}, {"id": 3, "name": "גלי"}]
+        load = {1: 2, 2: 0, 3: 1}
+        queue = CandidateQueue(employees, ["morning"], load, {}, {})
+        queue.prefer([1, 3])
+
+        self.assertEqual(queue.select("morning", lambda emp_id: True), 3)
+        queue.record_assignment(3)
+        queue.record_assignment(3)
+        self.assertEqual(queue.select("morning", lambda emp_id: True), 1)
+        self.assertEqual(queue.select("morning", lambda emp_id: emp_id == 2), 2)
+        self.assertEqual(load, {1: 2, 2: 0, 3: 3})
+
+
+class AvailabilityMatrixTests(unittest.TestCase):
+    def test_matches_constraint_allows_shift(self):
+        rng = random.Random(11)
+        dates = [f"2025-03-{day:02d}" for day in range(1, 15)]
+        shift_keys = ["morning", "afternoon", "night"]
+        profiles = {}
+        for employee_id in range(1, 31):
+            rows = []
+            if rng.random() < 0.5:
+                rows.append({
+                    "kind": "shift",
+                    "scope": "shift",
+                    "value_json": json.dumps({"values": rng.sample(["בוקר", "evening", "night"], 1), "action": rng.choice(["allow", "block"])}),
+                })
+            if rng.random() < 0.5:
+                rows.append({
+                    "kind": rng.choice(["available", "unavailable"]),
+                    "scope": "date",
+                    "value_json": json.dumps(rng.sample(dates, 4)),
+                })
+            if rng.random() < 0.3:
+                rows.append({
+                    "kind": "shift",
+                    "scope": "shift",
+                    "value_json": json.dumps({"values": rng.sample(shift_keys, 1), "action": "block"}),
+                    "valid_from": rng.choice([None, "2025-03-04"]),
+                    "valid_to": rng.choice([None, "2025-03-09"]),
+                })
+            profiles[employee_id] = ConstraintTimeline(rows)
+
+        matrix = AvailabilityMatrix(list(profiles), profiles, dates, shift_keys)
+        for employee_id, timeline in profiles.items():
+            for date_str in dates:
+                for shift_key in shift_keys:
+                    self.assertEqual(
+                        matrix.allows(employee_id, date_str, shift_key),
+                        constraint_allows_shift(timeline.profile_for(date_str), date_str, shift_key),
+                    )
+
+
+class PlanDayOptimalTests(unittest.TestCase):
+    def test_matches_brute_force_on_small_instances(self):
+        rng = random.Random(3)
+        date_str = "2025-03-02"
+        shift_keys = ["morning", "afternoon", "night"]
+        employee_ids = [1, 2, 3, 4]
+        names = {employee_id: f"emp{employee_id}" for employee_id in employee_ids}
+        matrix = AvailabilityMatrix(employee_ids, {}, [date_str], shift_keys)
+
+        for _ in range(200):
+            requirements = {key: rng.randint(0, 2) for key in shift_keys}
+            working = set(rng.sample(employee_ids, rng.randint(0, 1)))
+            working_mask = sum(1 << matrix.positions[employee_id] for employee_id in working)
+            load = {employee_id: rng.randint(0, 3) for employee_id in employee_ids}
+            preferred = {employee_id: set(rng.sample(shift_keys, rng.randint(0, 2))) for employee_id in employee_ids}
+            disliked = {employee_id: set(rng.sample(shift_keys, rng.randint(0, 2))) for employee_id in employee_ids}
+            blocked = {(employee_id, key) for employee_id in employee_ids for key in shift_keys if rng.random() < 0.2}
+
+            def cost(employee_id, key):
+                if employee_id in working or (employee_id, key) in blocked:
+                    return None
+                liked = key in preferred[employee_id]
+                if key in disliked[employee_id] and not liked:
+                    return None
+                return (
+                    load[employee_id] * OPTIMAL_LOAD_COST
+                    + (0 if liked else OPTIMAL_NOT_PREFERRED_COST)
+                    + (OPTIMAL_DISLIKED_COST if key in disliked[employee_id] else 0)
+                )
+
+            # כל עובד: משמרת אחת או כלום; הטוב ביותר = כיסוי מרבי ואז עלות מזערית
+            best = None
+            for choice in itertools.product([None, *shift_keys], repeat=len(employee_ids)):
+                if any(choice.count(key) > requirements[key] for key in shift_keys):
+                    continue
+                picked = [cost(employee_id, key) for employee_id, key in zip(employee_ids, choice) if key]
+                if None in picked:
+                    continue
+                score = (-len(picked), sum(picked))
+                best = score if best is None else min(best, score)
+
+            plan = plan_day_optimal(
+                date_str, requirements, matrix, working_mask, load, preferred, disliked, names,
+                is_allowed=lambda employee_id, key: (employee_id, key) not in blocked,
+            )
+            placed = [(employee_id, key) for key, members in plan.items() for employee_id in members]
+            self.assertEqual(len({employee_id for employee_id, _ in placed}), len(placed))
+            self.assertTrue(all(len(plan.get(key, [])) <= requirements[key] for key in shift_keys))
+            self.assertEqual(
+                (-len(placed), sum(cost(employee_id, key) for employee_id, key in placed)), best
+            )
+
+
+class ConstraintTimelineTests(unittest.TestCase):
+    def test_scoped_rows_apply_only_inside_their_validity(self):
+        timeline = ConstraintTimeline([
+            {"kind": "shift", "scope": "shift", "value_json": '{"values":["night"],"action":"block"}'},
+            {"kind": "unavailable", "scope": "date", "value_json": '["2025-05-10"]',
+             "valid_from": "2025-05-01", "valid_to": "2025-05-31"},
+            {"kind": "shift", "scope": "shift", "value_json": '{"values":["morning"],"action":"allow"}',
+             "valid_from": "2025-05-20", "valid_to": None},
+        ])
+
+        self.assertEqual(timeline.boundaries, ["2025-05-01", "2025-05-20", "2025-06-01"])
+        self.assertEqual(timeline.profile_for("2025-04-30"), timeline.base)
+        self.assertIn("2025-05-10", timeline.profile_for("2025-05-01")["blocked_dates"])
+        self.assertIsNone(timeline.profile_for("2025-05-19")["allowed_shifts"])
+        self.assertEqual(timeline.profile_for("2025-05-20")["allowed_shifts"], {"morning"})
+        self.assertIn("2025-05-10", timeline.profile_for("2025-05-31")["blocked_dates"])
+        self.assertFalse(timeline.profile_for("2025-06-01")["blocked_dates"])
+        self.assertEqual(timeline.profile_for("2026-01-01")["allowed_shifts"], {"morning"})
+        self.assertTrue(all(profile["blocked_shifts"] == {"night"} for profile in timeline.profiles))
+
+
+
+class DateRuleTests(unittest.TestCase):
+    def test_range_compiles_to_single_ordinal_range(self):
+        profile = build_constraint_profile([
+            {"kind": "unavailable", "scope": "date", "value_json": '{"from": "2025-01-01", "to": "2025-03-31"}'},
+            {"kind": "unavailable", "scope": "date", "value_json": '["2025-04-01", "2025-04-02", "2025-06-01"]'},
+        ])
+
+        self.assertEqual(
+            profile["blocked_dates"].ranges,
+            [
+                (date_ordinal("2025-01-01"), date_ordinal("2025-04-02")),
+                (date_ordinal("2025-06-01"), date_ordinal("2025-06-01")),
+            ],
+        )
+        self.assertFalse(constraint_allows_date(profile, "2025-02-15"))
+        self.assertTrue(constraint_allows_date(profile, "2025-04-03"))
+        self.assertFalse(constraint_allows_date(profile, "2025-06-01"))
+
+    def test_every_other_week_rule(self):
+        profile = build_constraint_profile([
+            {
+                "kind": "unavailable",
+                "scope": "date",
+                "value_json": '{"weekdays": ["שישי", "שבת"], "every_weeks": 2, "anchor": "2025-01-03"}',
+            },
+        ])
+
+        blocked = [day for day in range(1, 32) if not constraint_allows_date(profile, f"2025-01-{day:02d}")]
+        self.assertEqual(blocked, [3, 4, 17, 18, 31])
+
+    def test_available_weekdays_restrict_other_days(self):
+        profile = build_constraint_profile([
+            {"kind": "available", "scope": "date", "value_json": '{"weekdays": ["ראשון", "monday"]}'},
+        ])
+
+        self.assertTrue(constraint_allows_date(profile, "2025-01-05"))
+        self.assertTrue(constraint_allows_date(profile, "2025-01-06"))
+        self.assertFalse(constraint_allows_date(profile, "2025-01-07"))
+
 
 if __name__ == "__main__":
     unittest.main()